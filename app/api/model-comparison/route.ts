@@ -1,7 +1,47 @@
 import { NextResponse } from "next/server"
+import { readFile, stat } from "fs/promises"
+import path from "path"
 
 export const runtime = "nodejs"
 
+// Live latency/agreement written by shadow scoring (see scripts/shadow_scoring.py)
+const LIVE_COMPARISON_PATH =
+  process.env.LIVE_MODEL_COMPARISON_PATH || path.join(process.cwd(), "models", "live_model_comparison.json")
+
+type LiveModelStats = {
+  primary: boolean
+  batches: number
+  rows: number
+  mean_batch_ms: number
+  max_batch_ms: number
+  us_per_row: number
+  prediction_agreement: number | null
+  risk_level_agreement: number | null
+  mean_abs_probability_diff: number | null
+}
+
+type LiveComparison = {
+  updated_at: string
+  primary_model: string
+  primary_version: string
+  models: Record<string, LiveModelStats>
+}
+
+// Cache the parsed snapshot until the file changes
+let cached: { mtimeMs: number; snapshot: LiveComparison } | null = null
+
+async function loadLiveComparison(): Promise<LiveComparison | null> {
+  try {
+    const { mtimeMs } = await stat(LIVE_COMPARISON_PATH)
+    if (!cached || cached.mtimeMs !== mtimeMs) {
+      cached = { mtimeMs, snapshot: JSON.parse(await readFile(LIVE_COMPARISON_PATH, "utf-8")) }
+    }
+    return cached.snapshot
+  } catch {
+    return null
+  }
+}
+
 export async function GET() {
   try {
     console.log("[v0] Model comparison API called")
@@ -81,8 +121,10 @@ export async function GET() {
       trained: false,
     }
 
+    const live = await loadLiveComparison()
+
     console.log("[v0] Returning model comparison data")
-    return NextResponse.json(mockData)
+    return NextResponse.json({ ...mockData, live })
   } catch (error) {
     console.error("[v0] Model comparison API error:", error)
     const errorMessage = error instanceof Error ? error.message : "Unknown error"
@@ -1,8 +1,69 @@
 import { NextResponse } from "next/server"
+import { readFile, stat } from "fs/promises"
+import path from "path"
+
+export const runtime = "nodejs"
+
+// Rolling aggregates written by scripts/batch_predict.py (see scripts/risk_aggregates.py)
+const AGGREGATES_PATH = process.env.RISK_AGGREGATES_PATH || path.join(process.cwd(), "data", "risk_aggregates.json")
+
+type AggregateBucket = {
+  students: number
+  high_risk: number
+  medium_risk: number
+  low_risk: number
+  mean_dropout_probability: number
+  intervention_students: number
+  interventions: Record<string, number>
+}
+
+type AggregatesSnapshot = {
+  updated_at: string
+  overall: AggregateBucket
+  groups: Record<string, Record<string, AggregateBucket>>
+}
+
+// Cache the parsed snapshot until the file changes
+let cached: { mtimeMs: number; snapshot: AggregatesSnapshot } | null = null
+
+async function loadAggregates(): Promise<AggregatesSnapshot | null> {
+  try {
+    const { mtimeMs } = await stat(AGGREGATES_PATH)
+    if (!cached || cached.mtimeMs !== mtimeMs) {
+      cached = { mtimeMs, snapshot: JSON.parse(await readFile(AGGREGATES_PATH, "utf-8")) }
+    }
+    return cached.snapshot
+  } catch {
+    return null
+  }
+}
+
+function percentage(part: number, total: number) {
+  return total > 0 ? Math.round((part / total) * 100) : 0
+}
 
-// Simulated real-time stats with slight variations
 export async function GET() {
   try {
+    const aggregates = await loadAggregates()
+
+    if (aggregates) {
+      const { overall } = aggregates
+      return NextResponse.json({
+        totalStudents: overall.students,
+        highRisk: overall.high_risk,
+        mediumRisk: overall.medium_risk,
+        interventions: overall.intervention_students,
+        totalStudentsChange: `Updated ${aggregates.updated_at}`,
+        highRiskPercentage: `${percentage(overall.high_risk, overall.students)}% of total students`,
+        mediumRiskPercentage: `${percentage(overall.medium_risk, overall.students)}% of total students`,
+        // Outcomes of interventions are not tracked, so no success rate is reported here
+        interventionPercentage: `${percentage(overall.intervention_students, overall.students)}% of total students`,
+        meanDropoutProbability: overall.mean_dropout_probability,
+        groups: aggregates.groups,
+        source: "aggregates",
+      })
+    }
+
     // Simulate database query with slight random variations for real-time feel
     const baseStats = {
       totalStudents: 2847,
@@ -21,6 +82,7 @@ export async function GET() {
       highRiskPercentage: "5% of total students",
       mediumRiskPercentage: "10% of total students",
       interventionSuccessRate: "63% success rate",
+      source: "simulated",
     }
 
     return NextResponse.json(stats)
@@ -75,7 +75,7 @@ export function StatsOverview() {
       label: "Interventions Active",
       value: stats.interventions.toString(),
       icon: CheckCircle,
-      change: stats.interventionSuccessRate,
+      change: stats.interventionSuccessRate ?? stats.interventionPercentage,
       positive: true,
     },
   ]
@@ -0,0 +1,108 @@
+"""
+Pipelined batch scoring
+Overlaps CSV parsing, vectorized scoring and result writing in threads joined by bounded queues
+"""
+
+import queue
+import threading
+import time
+from instrumentation import get_logger, metrics
+
+logger = get_logger('batch_pipeline')
+
+# Chunks each queue may hold before the stage feeding it blocks
+DEFAULT_QUEUE_DEPTH = 2
+_DONE = object()
+
+class BatchPipeline:
+    """Reader, scorer and writer stages on their own threads
+    
+    ``read_chunks()`` yields input chunks, ``score_chunk(chunk)`` returns that
+    chunk's results and ``write_chunk(results)`` persists them. Each queue
+    holds at most ``depth`` items, so a slow stage blocks the one before it
+    and memory stays at a few chunks regardless of the file size. Parsing
+    and scoring spend much of their time in C code that releases the GIL,
+    which is what lets the stages overlap. The first error in any stage stops
+    the others and is re-raised from ``run``.
+    """
+    
+    def __init__(self, read_chunks, score_chunk, write_chunk, depth=DEFAULT_QUEUE_DEPTH):
+        self.read_chunks = read_chunks
+        self.score_chunk = score_chunk
+        self.write_chunk = write_chunk
+        self.to_score = queue.Queue(maxsize=depth)
+        self.to_write = queue.Queue(maxsize=depth)
+        self.chunks = 0
+        self._failed = threading.Event()
+        self._error = None
+    
+    def _put(self, target, item):
+        """Blocking put that gives up once another stage has failed"""
+        started = time.perf_counter()
+        while not self._failed.is_set():
+            try:
+                target.put(item, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        return time.perf_counter() - started
+    
+    def _get(self, source):
+        while not self._failed.is_set():
+            try:
+                return source.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+    
+    def _stage(self, name, body):
+        try:
+            body()
+        except BaseException as e:
+            logger.error(f"Pipeline {name} stage failed: {e}")
+            if self._error is None:
+                self._error = e
+            self._failed.set()
+    
+    def _read(self):
+        chunks = iter(self.read_chunks())
+        while not self._failed.is_set():
+            with metrics.timer('pipeline_read'):
+                chunk = next(chunks, _DONE)
+            if chunk is _DONE:
+                break
+            metrics.observe('pipeline_blocked_seconds', self._put(self.to_score, chunk), stage='read')
+        self._put(self.to_score, _DONE)
+    
+    def _score(self):
+        while True:
+            chunk = self._get(self.to_score)
+            if chunk is _DONE:
+                break
+            with metrics.timer('pipeline_score'):
+                results = self.score_chunk(chunk)
+            metrics.observe('pipeline_blocked_seconds', self._put(self.to_write, results), stage='score')
+        self._put(self.to_write, _DONE)
+    
+    def _write(self):
+        while True:
+            results = self._get(self.to_write)
+            if results is _DONE:
+                break
+            with metrics.timer('pipeline_write'):
+                self.write_chunk(results)
+            self.chunks += 1
+    
+    def run(self):
+        """Run all stages to completion"""
+        threads = [
+            threading.Thread(target=self._stage, args=(name, body), name=f'v0-pipeline-{name}', daemon=True)
+            for name, body in (('read', self._read), ('score', self._score), ('write', self._write))
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        if self._error is not None:
+            raise self._error
+        return self.chunks
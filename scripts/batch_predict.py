@@ -3,119 +3,387 @@ Batch prediction script for processing multiple students
 Useful for processing entire classes or schools
 """
 
+import argparse
+import time
+from collections import Counter
+import numpy as np
 import pandas as pd
 import sys
-import json
 from predict import DropoutPredictor
+from concurrency import ConcurrencyConfig
+from encoding import UNSEEN_POLICIES
+from risk_aggregates import DEFAULT_GROUP_COLUMNS, DEFAULT_SNAPSHOT_PATH, RiskAggregator
+from prediction_store import DEFAULT_STORE_PATH, PredictionStore
+from risk_ranking import DEFAULT_RANK_COLUMN, DEFAULT_RANKING_PATH, TopKRanker, risk_factors
+from result_writers import OUTPUT_FORMATS, RISK_LEVELS, ResultTable, StreamingResultWriter, write_results
+from shadow_scoring import DEFAULT_CANDIDATES_DIR, DEFAULT_COMPARISON_PATH
+from batch_pipeline import DEFAULT_QUEUE_DEPTH, BatchPipeline
+from feature_store import DEFAULT_FEATURE_STORE_DIR, FeatureStore, FeatureTransform
+from delta_scoring import ScoringManifest, default_manifest_path, score_incrementally, scoring_version
+from instrumentation import get_logger, metrics, setup_instrumentation
+
+logger = get_logger('batch_predict')
+
+# Rows scored per vectorized predictor call
+DEFAULT_CHUNK_SIZE = 10000
 
 def load_students_from_csv(filepath):
     """Load student data from CSV file"""
     try:
-        df = pd.read_csv(filepath)
-        print(f"[v0] Loaded {len(df)} students from {filepath}", file=sys.stderr)
+        with metrics.timer('load_input'):
+            df = pd.read_csv(filepath)
+        logger.info(f"Loaded {len(df)} students from {filepath}")
         return df
     except FileNotFoundError:
-        print(f"[v0] Error: File not found: {filepath}", file=sys.stderr)
+        logger.error(f"File not found: {filepath}")
         sys.exit(1)
     except Exception as e:
-        print(f"[v0] Error loading file: {e}", file=sys.stderr)
+        logger.error(f"Error loading file: {e}")
         sys.exit(1)
 
-def process_batch(predictor, students_df):
-    """Process batch of students and return results"""
+def format_result(student_id, prediction):
+    """Shape a predictor result into a batch output record"""
+    if 'error' in prediction:
+        return {'student_id': student_id, 'error': prediction['error']}
+    return {
+        'student_id': student_id,
+        'risk_level': prediction['risk_level'],
+        'dropout_probability': prediction['dropout_probability'],
+        'graduate_probability': prediction['graduate_probability'],
+        'top_recommendations': [r['action'] for r in prediction['recommendations'][:3]]
+    }
+
+def run_sinks(sinks, student_ids, predictions, chunk):
+    """Pass a scored chunk to each sink; a failing sink is logged and skipped, not fatal to the run"""
+    for sink in sinks:
+        try:
+            sink(student_ids, predictions, chunk)
+        except Exception as e:
+            name = getattr(sink, '__name__', type(sink).__name__)
+            logger.error(f"Sink {name} failed on {len(predictions)} rows: {e}")
+            metrics.increment('sink_errors', sink=name)
+
+def process_rows(predictor, students_df, sinks=()):
+    """Score students one at a time, isolating per-row failures"""
     results = []
     
-    for idx, row in students_df.iterrows():
+    for position, (idx, row) in enumerate(students_df.iterrows()):
         student_data = row.to_dict()
+        student_id = student_data.get('student_id', idx)
         
         try:
             prediction = predictor.predict(student_data)
-            
-            results.append({
-                'student_id': student_data.get('student_id', idx),
-                'risk_level': prediction['risk_level'],
-                'dropout_probability': prediction['dropout_probability'],
-                'graduate_probability': prediction['graduate_probability'],
-                'top_recommendations': [r['action'] for r in prediction['recommendations'][:3]]
-            })
-            
-            if (idx + 1) % 100 == 0:
-                print(f"[v0] Processed {idx + 1}/{len(students_df)} students", file=sys.stderr)
-                
+            results.append(format_result(student_id, prediction))
+            run_sinks(sinks, [student_id], [prediction], students_df.iloc[position:position + 1])
         except Exception as e:
-            print(f"[v0] Error processing student {idx}: {e}", file=sys.stderr)
+            logger.error(f"Error processing student {idx}: {e}")
+            metrics.increment('batch_errors')
             results.append({
-                'student_id': student_data.get('student_id', idx),
+                'student_id': student_id,
                 'error': str(e)
             })
     
     return results
 
-def save_results(results, output_path):
-    """Save results to CSV and JSON"""
-    # Save as CSV
-    csv_path = output_path.replace('.json', '.csv')
-    df = pd.DataFrame(results)
-    df.to_csv(csv_path, index=False)
-    print(f"[v0] Results saved to {csv_path}", file=sys.stderr)
-    
-    # Save as JSON
-    with open(output_path, 'w') as f:
-        json.dump(results, f, indent=2)
-    print(f"[v0] Results saved to {output_path}", file=sys.stderr)
-
-def generate_summary(results):
-    """Generate summary statistics"""
-    df = pd.DataFrame(results)
+def process_batch(predictor, students_df, chunk_size=DEFAULT_CHUNK_SIZE, sinks=(), scorer=None):
+    """Process batch of students and return results
     
-    if 'error' in df.columns:
-        errors = df['error'].notna().sum()
-        print(f"\n[v0] Errors: {errors}", file=sys.stderr)
+    Each sink is called as ``sink(student_ids, predictions, chunk)`` after a
+    chunk is scored, with the raw predictor results. ``scorer(chunk)``
+    replaces ``predictor.predict_frame``, e.g. to read from the feature store.
+    """
+    scorer = scorer or predictor.predict_frame
+    results = []
     
-    if 'risk_level' in df.columns:
-        risk_counts = df['risk_level'].value_counts()
+    for start in range(0, len(students_df), chunk_size):
+        chunk = students_df.iloc[start:start + chunk_size]
+        if 'student_id' in chunk.columns:
+            student_ids = chunk['student_id'].tolist()
+        else:
+            student_ids = chunk.index.tolist()
         
-        print("\n[v0] Risk Level Distribution:", file=sys.stderr)
-        for level, count in risk_counts.items():
-            percentage = (count / len(df)) * 100
-            print(f"  {level}: {count} ({percentage:.1f}%)", file=sys.stderr)
+        try:
+            predictions = scorer(chunk)
+        except Exception as e:
+            # A malformed row fails the vectorized pass; rescore this chunk row by row
+            logger.warning(f"Chunk starting at row {start} failed ({e}); scoring row by row")
+            results.extend(process_rows(predictor, chunk, sinks))
+            continue
+        
+        results.extend(format_result(sid, p) for sid, p in zip(student_ids, predictions))
+        run_sinks(sinks, student_ids, predictions, chunk)
+        logger.debug(f"Processed {min(start + chunk_size, len(students_df))}/{len(students_df)} students")
+    
+    return results
+
+def save_results(results, output_path, formats=('csv', 'json')):
+    """Encode results as typed arrays once, then write each requested format"""
+    with metrics.timer('serialization', format='encode'):
+        table = ResultTable.from_records(results)
+    write_results(table, output_path, formats)
+    return table
+
+def run_pipeline(predictor, input_path, output_path, formats, chunk_size=DEFAULT_CHUNK_SIZE, sinks=(),
+                 depth=DEFAULT_QUEUE_DEPTH):
+    """Stream the CSV through reader, scorer and writer threads; returns the summary counts
+    
+    Results are written chunk by chunk instead of being collected, so memory
+    stays flat for any input size.
+    """
+    writer = StreamingResultWriter(output_path, formats)
+    counts = Counter()
+    
+    def read_chunks():
+        with metrics.timer('load_input'):
+            reader = pd.read_csv(input_path, chunksize=chunk_size)
+        return reader
+    
+    def score_chunk(chunk):
+        return process_batch(predictor, chunk, chunk_size=chunk_size, sinks=sinks)
+    
+    def write_chunk(results):
+        with metrics.timer('serialization', format='encode'):
+            table = ResultTable.from_records(results)
+        writer.write(table)
+        counts.update(summary_counts(table))
+    
+    BatchPipeline(read_chunks, score_chunk, write_chunk, depth=depth).run()
+    writer.close()
+    return counts
+
+def summary_counts(table):
+    """Totals behind the summary; counts from separate chunks add up"""
+    counts = Counter(table.risk_counts())
+    counts['rows'] = len(table)
+    counts['errors'] = int(table.failed.sum())
+    counts['dropout_probability_sum'] = float(np.nansum(table.dropout_probability))
+    return counts
+
+def generate_summary(counts):
+    """Generate summary statistics"""
+    errors = counts['errors']
+    if errors:
+        logger.info(f"Errors: {errors}")
+    
+    scored = counts['rows'] - errors
+    if scored:
+        logger.info("Risk Level Distribution:")
+        risk_counts = sorted(((level, counts[level]) for level in RISK_LEVELS), key=lambda item: item[1],
+                             reverse=True)
+        for level, count in risk_counts:
+            if count:
+                percentage = (count / scored) * 100
+                logger.info(f"  {level}: {count} ({percentage:.1f}%)")
         
-        avg_dropout_prob = df['dropout_probability'].mean()
-        print(f"\n[v0] Average Dropout Probability: {avg_dropout_prob:.2%}", file=sys.stderr)
+        avg_dropout_prob = counts['dropout_probability_sum'] / scored
+        logger.info(f"Average Dropout Probability: {avg_dropout_prob:.2%}")
         
-        high_risk = df[df['risk_level'] == 'High']
-        print(f"[v0] High Risk Students: {len(high_risk)} ({len(high_risk)/len(df)*100:.1f}%)", file=sys.stderr)
+        high_risk = counts['High']
+        logger.info(f"High Risk Students: {high_risk} ({high_risk/scored*100:.1f}%)")
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(
+        description="Batch dropout prediction",
+        epilog="Example: python batch_predict.py data/students.csv results/predictions.json"
+    )
+    parser.add_argument('input_csv', help="CSV file with one student per row")
+    parser.add_argument('output_json', nargs='?', default='results/batch_predictions.json',
+                        help="Output path; each --format is written next to it with its own extension")
+    parser.add_argument('--format', default='csv,json',
+                        help=f"Comma-separated output formats: {', '.join(OUTPUT_FORMATS)} "
+                             "(arrow/parquet need pyarrow)")
+    parser.add_argument('--metrics-out', default=None,
+                        help="Write a metrics snapshot on exit (.prom/.txt for Prometheus text, otherwise JSON)")
+    parser.add_argument('--profile-out', default=None,
+                        help="Run the sampling profiler and write collapsed stacks to this path")
+    parser.add_argument('--unseen-policy', choices=UNSEEN_POLICIES, default='most_frequent',
+                        help="How to encode categories not seen in training (reject marks the row as an error)")
+    parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="Rows per vectorized scoring call")
+    parser.add_argument('--aggregates', default=DEFAULT_SNAPSHOT_PATH,
+                        help="Rolling risk aggregates snapshot read by the dashboard stats API")
+    parser.add_argument('--no-aggregates', action='store_true',
+                        help="Do not update the rolling risk aggregates")
+    parser.add_argument('--group-columns', default=','.join(DEFAULT_GROUP_COLUMNS),
+                        help="Comma-separated input columns to break aggregates down by")
+    parser.add_argument('--store', default=DEFAULT_STORE_PATH,
+                        help="SQLite prediction history store to append results to")
+    parser.add_argument('--no-store', action='store_true',
+                        help="Do not record results in the prediction history store")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Only re-score students whose inputs or model changed since the previous run")
+    parser.add_argument('--manifest', default=None,
+                        help="Run manifest used for incremental scoring (default: next to the output)")
+    parser.add_argument('--shadow', nargs='?', const=DEFAULT_CANDIDATES_DIR, default=None,
+                        help=f"Also score every trained candidate model (default dir: {DEFAULT_CANDIDATES_DIR}) "
+                             "and record live latency and agreement")
+    parser.add_argument('--comparison-out', default=DEFAULT_COMPARISON_PATH,
+                        help="Live model comparison snapshot written in shadow mode")
+    parser.add_argument('--top-k', type=int, default=0,
+                        help="Rank the K highest-risk students per group while scoring (0 disables)")
+    parser.add_argument('--rank-by', default=DEFAULT_RANK_COLUMN,
+                        help="Input column to rank within (all students form one group if it is absent)")
+    parser.add_argument('--ranking-out', default=DEFAULT_RANKING_PATH,
+                        help="Where the top-k lists and their explanations are written")
+    parser.add_argument('--pipeline', action='store_true',
+                        help="Overlap CSV parsing, scoring and writing in threads, streaming results to disk")
+    parser.add_argument('--queue-depth', type=int, default=DEFAULT_QUEUE_DEPTH,
+                        help="Chunks buffered between pipeline stages")
+    parser.add_argument('--feature-store', nargs='?', const=DEFAULT_FEATURE_STORE_DIR, default=None,
+                        help=f"Update the feature store (default dir: {DEFAULT_FEATURE_STORE_DIR}) with the input, "
+                             "transforming only new/changed students, and score from its stored vectors")
+    parser.add_argument('--as-of', default=None, help="Feature store snapshot date (default: today)")
+    parser.add_argument('--cpus', type=int, default=None,
+                        help="CPU budget for scoring threads and native libraries (default: V0_CPUS or all)")
+    parser.add_argument('--pin-cpus', action='store_true', default=None,
+                        help="Pin the process to the CPUs of its budget")
+    args = parser.parse_args(argv)
+    args.formats = [fmt.strip() for fmt in args.format.split(',') if fmt.strip()]
+    unknown = set(args.formats) - set(OUTPUT_FORMATS)
+    if unknown or not args.formats:
+        parser.error(f"--format must be a comma-separated list of {', '.join(OUTPUT_FORMATS)}")
+    if args.pipeline:
+        if args.incremental:
+            parser.error("--incremental needs the whole roster; run it without --pipeline")
+        if args.feature_store:
+            parser.error("--feature-store needs the whole roster; run it without --pipeline")
+        unstreamable = set(args.formats) - set(StreamingResultWriter.FORMATS)
+        if unstreamable:
+            parser.error(f"--pipeline cannot stream {', '.join(sorted(unstreamable))} output")
+        if args.queue_depth < 1:
+            parser.error("--queue-depth must be at least 1")
+    return args
 
 def main():
     """Main batch prediction function"""
-    if len(sys.argv) < 2:
-        print("Usage: python batch_predict.py <input_csv> [output_json]", file=sys.stderr)
-        print("Example: python batch_predict.py data/students.csv results/predictions.json", file=sys.stderr)
-        sys.exit(1)
-    
-    input_path = sys.argv[1]
-    output_path = sys.argv[2] if len(sys.argv) > 2 else 'results/batch_predictions.json'
+    args = parse_args()
+    input_path = args.input_csv
+    output_path = args.output_json
+    setup_instrumentation(metrics_out=args.metrics_out, profile_out=args.profile_out)
     
-    print("[v0] Starting batch prediction...", file=sys.stderr)
+    logger.info("Starting batch prediction...")
+    concurrency = ConcurrencyConfig(cpus=args.cpus, pin=args.pin_cpus).apply()
     
     # Load predictor
-    predictor = DropoutPredictor()
+    predictor = DropoutPredictor(unseen_policy=args.unseen_policy, shadow_dir=args.shadow,
+                                 comparison_path=args.comparison_out, concurrency=concurrency)
     
-    # Load students
-    students_df = load_students_from_csv(input_path)
+    # Load students (the pipeline streams them in chunks instead)
+    started = time.perf_counter()
+    students_df = None if args.pipeline else load_students_from_csv(input_path)
+    
+    sinks = []
+    aggregator = None
+    if not args.no_aggregates:
+        group_columns = [col.strip() for col in args.group_columns.split(',') if col.strip()]
+        aggregator = RiskAggregator.load(args.aggregates, group_columns)
+        sinks.append(aggregator.update)
+    
+    store = None
+    if not args.no_store:
+        store = PredictionStore(args.store)
+        scored_at = time.time()
+        
+        def record_in_store(student_ids, predictions, chunk):
+            # Missing feature columns hash as NaN instead of failing the sink
+            store.record_chunk(student_ids, predictions, chunk.reindex(columns=predictor.feature_names),
+                               predictor.model_version, scored_at)
+        sinks.append(record_in_store)
+    
+    ranker = None
+    if args.top_k > 0:
+        ranker = TopKRanker(args.top_k, args.rank_by, args.ranking_out, feature_columns=predictor.feature_names)
+        sinks.append(ranker.update)
+    
+    scorer = None
+    if args.feature_store:
+        if 'student_id' not in students_df.columns:
+            logger.warning("The feature store needs a student_id column; scoring from raw inputs")
+        else:
+            with metrics.timer('feature_store_update'):
+                snapshot = FeatureStore(args.feature_store).update(
+                    students_df, FeatureTransform.load(unseen_policy=args.unseen_policy), as_of=args.as_of
+                )
+            
+            def scorer(chunk):
+                return predictor.predict_stored(chunk, snapshot)
+    
+    def score(df):
+        return process_batch(predictor, df, chunk_size=args.chunk_size, sinks=sinks, scorer=scorer)
+    
+    manifest_path = args.manifest or default_manifest_path(output_path)
+    # Fingerprints are only computed when a manifest is wanted; pipelined rows are not kept, so they get none
+    want_manifest = args.incremental or args.manifest is not None
+    track_manifest = want_manifest and students_df is not None and 'student_id' in students_df.columns
+    if want_manifest and not track_manifest:
+        logger.warning("Incremental scoring needs a student_id column; scoring all rows without a manifest")
+    
+    # Risk factors go into the manifest so carried-forward students are ranked with the same explanations
+    factors_by_student = {}
+    
+    def collect_risk_factors(student_ids, predictions, chunk):
+        for student_id, prediction in zip(student_ids, predictions):
+            factors_by_student[student_id] = None if 'error' in prediction else risk_factors(prediction)
+    
+    if track_manifest:
+        sinks.append(collect_risk_factors)
     
     # Process batch
-    results = process_batch(predictor, students_df)
+    with metrics.timer('score_batch'):
+        if args.pipeline:
+            counts = run_pipeline(predictor, input_path, output_path, args.formats, args.chunk_size, sinks,
+                                  args.queue_depth)
+        elif track_manifest:
+            previous = ScoringManifest.load(manifest_path) if args.incremental else None
+            # Students carried forward are still ranked; aggregates and history already hold them
+            carried_sinks = [collect_risk_factors] + ([ranker.update] if ranker is not None else [])
+            results, fingerprints = score_incrementally(predictor, students_df, previous, score, carried_sinks)
+        else:
+            results = score(students_df)
+    
+    if store is not None:
+        logger.info(f"Recorded results in {args.store} ({store.count()} predictions stored)")
+        store.close()
+    
+    unseen = predictor.unseen_category_counts()
+    if unseen:
+        logger.warning(f"Unseen categories ({args.unseen_policy} policy): {unseen}")
     
     # Save results
-    os.makedirs(os.path.dirname(output_path), exist_ok=True)
-    save_results(results, output_path)
+    if not args.pipeline:
+        table = save_results(results, output_path, args.formats)
+        counts = summary_counts(table)
+    elapsed = time.perf_counter() - started
+    logger.info(f"Scored {counts['rows']} students in {elapsed:.2f}s ({counts['rows'] / elapsed:,.0f} rows/s)")
+    
+    if track_manifest:
+        with metrics.timer('manifest'):
+            student_ids = students_df['student_id'].tolist()
+            ScoringManifest.from_results(
+                scoring_version(predictor), student_ids, fingerprints, results,
+                [factors_by_student.get(student_id) for student_id in student_ids]
+            ).save(manifest_path)
+    
+    if aggregator is not None:
+        aggregator.save()
+    
+    if ranker is not None:
+        ranker.save()
+    
+    if predictor.shadow is not None:
+        predictor.shadow.save()
+        predictor.shadow.close()
+        logger.info(f"Live model comparison saved to {args.comparison_out}")
     
     # Generate summary
-    generate_summary(results)
+    generate_summary(counts)
+    
+    if metrics.enabled:
+        for line in metrics.summary_lines():
+            logger.info(line)
     
-    print("\n[v0] Batch prediction completed!", file=sys.stderr)
+    logger.info("Batch prediction completed!")
 
 if __name__ == "__main__":
-    import os
     main()
@@ -0,0 +1,139 @@
+"""
+Central CPU budget for training, batch scoring and serving
+Derives process, task and native-library (OpenMP/BLAS/XGBoost) thread counts from one budget
+"""
+
+import os
+from instrumentation import get_logger
+
+logger = get_logger('concurrency')
+
+# Read by OpenMP, the BLAS builds behind NumPy/SciPy and numexpr when they first start their pools
+NATIVE_THREAD_VARS = (
+    'OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS', 'NUMEXPR_NUM_THREADS'
+)
+
+# Estimators whose ``n_jobs`` sets their thread count; elsewhere (e.g. binary
+# LogisticRegression) it has no effect and newer sklearn warns about it
+THREADED_ESTIMATORS = frozenset({
+    'RandomForestClassifier', 'RandomForestRegressor', 'ExtraTreesClassifier', 'ExtraTreesRegressor',
+    'XGBClassifier', 'XGBRegressor', 'GridSearchCV', 'RandomizedSearchCV'
+})
+
+def available_cpus():
+    """CPUs this process may run on (respects affinity masks and container cpusets)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+class ConcurrencyConfig:
+    """One CPU budget split across processes, parallel tasks and native threads
+    
+    ``cpus`` (default ``V0_CPUS`` or every available CPU) is divided evenly
+    between ``processes`` (e.g. pre-fork workers). Inside a process:
+    
+    * ``training=True``: ``n_jobs`` parallel fits (joblib) each run with one
+      native thread, so CV searches never stack thread pools on top of
+      worker processes.
+    * otherwise: one task per process whose estimators, OpenMP and BLAS all
+      get the process's share.
+    
+    With ``pin`` (or ``V0_PIN_CPUS=1``) each process is bound to its own
+    slice of CPUs.
+    """
+    
+    def __init__(self, cpus=None, processes=1, training=False, pin=None):
+        allowed = available_cpus()
+        if cpus is None:
+            cpus = int(os.environ.get('V0_CPUS') or len(allowed))
+        if pin is None:
+            pin = os.environ.get('V0_PIN_CPUS', '').lower() in ('1', 'true', 'yes')
+        if cpus < 1 or processes < 1:
+            raise ValueError("cpus and processes must be at least 1")
+        self.cpus = min(cpus, len(allowed))
+        self.processes = processes
+        self.training = training
+        self.pin = pin
+        self.allowed = allowed[:self.cpus]
+        self.threads_per_process = max(1, self.cpus // processes)
+        if self.cpus < cpus:
+            logger.warning(f"CPU budget {cpus} exceeds the {len(allowed)} CPUs available; using {self.cpus}")
+    
+    @property
+    def n_jobs(self):
+        """Parallel tasks (joblib fits) per process"""
+        return self.threads_per_process if self.training else 1
+    
+    @property
+    def native_threads(self):
+        """Threads for one task's estimator, OpenMP and BLAS pools"""
+        return 1 if self.training else self.threads_per_process
+    
+    def apply(self, worker_index=None):
+        """Limit native thread pools in this process (and its children), pin if requested, log the result
+        
+        Environment variables cover libraries loaded later and child
+        processes such as joblib workers; threadpoolctl caps the pools of
+        libraries that are already loaded.
+        """
+        for var in NATIVE_THREAD_VARS:
+            os.environ[var] = str(self.native_threads)
+        try:
+            from threadpoolctl import threadpool_limits
+            threadpool_limits(limits=self.native_threads)
+        except ImportError:
+            logger.debug("threadpoolctl not installed; relying on environment variables only")
+        if self.pin:
+            self.pin_cpus(worker_index)
+        self.log_settings()
+        return self
+    
+    def cpu_slice(self, worker_index=None):
+        """CPUs for one process: its own slice of the budget when ``worker_index`` is given"""
+        if worker_index is None:
+            return self.allowed
+        start = (worker_index % self.processes) * self.threads_per_process
+        return self.allowed[start:start + self.threads_per_process] or self.allowed
+    
+    def pin_cpus(self, worker_index=None):
+        """Bind this process to its CPU slice (Linux only)"""
+        if not hasattr(os, 'sched_setaffinity'):
+            logger.warning("CPU pinning is not supported on this platform")
+            return
+        os.sched_setaffinity(0, self.cpu_slice(worker_index))
+    
+    def configure(self, estimator):
+        """Set ``n_jobs`` to this process's share on estimators in :data:`THREADED_ESTIMATORS`"""
+        if type(estimator).__name__ in THREADED_ESTIMATORS:
+            estimator.set_params(n_jobs=self.native_threads)
+        return estimator
+    
+    def settings(self):
+        """Effective settings, including what the loaded native libraries report"""
+        settings = {
+            'cpus': self.cpus,
+            'processes': self.processes,
+            'threads_per_process': self.threads_per_process,
+            'n_jobs': self.n_jobs,
+            'native_threads': self.native_threads,
+            'affinity': sorted(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else None
+        }
+        try:
+            from threadpoolctl import threadpool_info
+            settings['native_pools'] = {
+                f"{pool['internal_api']}:{os.path.basename(pool['filepath'])}": pool['num_threads']
+                for pool in threadpool_info()
+            }
+        except ImportError:
+            pass
+        return settings
+    
+    def log_settings(self):
+        settings = self.settings()
+        pools = ', '.join(f"{name}={threads}" for name, threads in settings.get('native_pools', {}).items())
+        logger.info(
+            f"CPU budget {self.cpus}: {self.processes} process(es) x {self.threads_per_process} thread(s), "
+            f"n_jobs={self.n_jobs}, native threads={self.native_threads}, affinity={settings['affinity']}"
+            + (f", pools: {pools}" if pools else "")
+        )
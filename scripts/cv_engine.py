@@ -0,0 +1,175 @@
+"""
+Shared cross-validation engine for model training
+Computes stratified folds once, fits each model configuration once per fold and keeps its out-of-fold probabilities
+"""
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.base import clone
+from sklearn.metrics import accuracy_score, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+from instrumentation import get_logger, metrics
+
+logger = get_logger('cv_engine')
+
+def _rows(data, index):
+    return data.iloc[index] if hasattr(data, 'iloc') else data[index]
+
+def _fit_fold(estimator, X, y, train_index, val_index):
+    """Fit one fold; errors are returned rather than raised so one bad candidate does not stop a search"""
+    model = clone(estimator)
+    try:
+        model.fit(_rows(X, train_index), y[train_index])
+        return model, model.predict_proba(_rows(X, val_index))[:, 1], None
+    except Exception as e:
+        return None, None, e
+
+class CVResult:
+    """Fold models, out-of-fold probabilities and fold AUCs for one estimator configuration"""
+    
+    def __init__(self, name, estimator, params, models, oof_proba, fold_aucs, oof_auc):
+        self.name = name
+        self.estimator = estimator
+        self.params = params
+        self.models = models
+        self.oof_proba = oof_proba
+        self.fold_aucs = fold_aucs
+        self.oof_auc = oof_auc
+    
+    def predict_proba(self, X):
+        """Mean class probabilities of the fold models"""
+        return np.mean([model.predict_proba(X) for model in self.models], axis=0)
+    
+    @property
+    def mean_auc(self):
+        return float(np.mean(self.fold_aucs))
+    
+    @property
+    def std_auc(self):
+        return float(np.std(self.fold_aucs))
+    
+    def summary(self, y):
+        """JSON-ready CV metrics"""
+        return {
+            'params': {key: value.item() if isinstance(value, np.generic) else value
+                       for key, value in self.params.items()},
+            'cv_auc_mean': self.mean_auc,
+            'cv_auc_std': self.std_auc,
+            'fold_aucs': [float(auc) for auc in self.fold_aucs],
+            'oof_auc': float(self.oof_auc),
+            'oof_accuracy': float(accuracy_score(y, self.oof_proba >= 0.5))
+        }
+
+class CVEngine:
+    """Stratified K-fold cross-validation shared by every model family
+    
+    The fold indices are computed once for the training labels, so all
+    families and all search candidates are scored on identical splits.
+    Each configuration is fit once per fold; the winning configuration of a
+    search keeps its fold models and out-of-fold probabilities, which CV
+    AUC, comparison metrics and stacking then read instead of refitting.
+    ``fits_saved`` counts the full-training-set refits avoided by predicting
+    with a configuration's fold models (:meth:`predict_proba`), once per
+    configuration; reading kept results costs no fit and is not counted.
+    """
+    
+    def __init__(self, y, n_splits=5, random_state=None, n_jobs=-1):
+        self.y = np.asarray(y)
+        self.n_splits = n_splits
+        self.n_jobs = n_jobs
+        # Unshuffled by default, matching the cv=5 splits of GridSearchCV
+        splitter = StratifiedKFold(n_splits, shuffle=random_state is not None, random_state=random_state)
+        self.folds = list(splitter.split(np.zeros(len(self.y)), self.y))
+        self.results = {}
+        self.fits = 0
+        self.fits_saved = 0
+        self._fold_predicted = set()
+    
+    def _fold_jobs(self, estimators, X):
+        """Fit every (estimator, fold) pair in parallel, yielding results in order"""
+        jobs = (
+            delayed(_fit_fold)(estimator, X, self.y, train_index, val_index)
+            for estimator in estimators for train_index, val_index in self.folds
+        )
+        return Parallel(n_jobs=self.n_jobs, return_as='generator')(jobs)
+    
+    def _collect(self, name, estimator, params, fold_outputs):
+        """Assemble one configuration's fold outputs into a CVResult, or None if a fold failed"""
+        oof_proba = np.empty(len(self.y))
+        models, fold_aucs = [], []
+        self.fits += len(fold_outputs)
+        for (_, val_index), (model, proba, error) in zip(self.folds, fold_outputs):
+            if error is not None:
+                logger.warning(f"{name} {params} failed on a fold: {error}")
+                metrics.increment('cv_fit_errors', model=name)
+                return None
+            oof_proba[val_index] = proba
+            models.append(model)
+            fold_aucs.append(roc_auc_score(self.y[val_index], proba))
+        return CVResult(name, estimator, params, models, oof_proba, fold_aucs, roc_auc_score(self.y, oof_proba))
+    
+    def cross_validate(self, name, estimator, X):
+        """Fit ``estimator`` once per fold and keep the result under ``name``"""
+        with metrics.timer('cross_validate', model=name):
+            outputs = list(self._fold_jobs([estimator], X))
+            result = self._collect(name, estimator, estimator.get_params(deep=False), outputs)
+        if result is None:
+            raise RuntimeError(f"Cross-validation of {name} failed")
+        metrics.increment('cv_fits', self.n_splits, model=name)
+        self.results[name] = result
+        return result
+    
+    def search(self, name, estimator, candidates, X):
+        """Score every parameter candidate on the shared folds; keep and return the best by mean AUC
+        
+        Only the winner's fold models are retained, so memory holds one
+        configuration per family regardless of the search size.
+        """
+        candidates = list(candidates)
+        logger.info(f"Fitting {self.n_splits} folds for each of {len(candidates)} candidates, "
+                    f"totalling {self.n_splits * len(candidates)} fits")
+        estimators = [clone(estimator).set_params(**params) for params in candidates]
+        
+        best = None
+        with metrics.timer('search', model=name):
+            outputs = self._fold_jobs(estimators, X)
+            for candidate, params in zip(estimators, candidates):
+                fold_outputs = [next(outputs) for _ in self.folds]
+                result = self._collect(name, candidate, params, fold_outputs)
+                # Strictly greater, so ties go to the earlier candidate as in GridSearchCV
+                if result is not None and (best is None or result.mean_auc > best.mean_auc):
+                    best = result
+        metrics.increment('cv_fits', self.n_splits * len(candidates), model=name)
+        
+        if best is None:
+            raise RuntimeError(f"Every {name} candidate failed cross-validation")
+        self.results[name] = best
+        return best
+    
+    def result(self, name):
+        """Kept CV result for ``name``"""
+        return self.results[name]
+    
+    def predict_proba(self, name, X):
+        """Fold-averaged probabilities for ``name``, in place of a model refit on all training rows"""
+        if name not in self._fold_predicted:
+            self._fold_predicted.add(name)
+            self.fits_saved += 1
+            metrics.increment('cv_fits_saved', model=name)
+        return self.results[name].predict_proba(X)
+    
+    def oof_matrix(self, names):
+        """(rows, models) out-of-fold probabilities, e.g. as stacking features"""
+        return np.column_stack([self.result(name).oof_proba for name in names])
+    
+    def refit(self, name, X):
+        """Fit the kept configuration for ``name`` on all training rows"""
+        model = clone(self.results[name].estimator)
+        with metrics.timer('refit', model=name):
+            model.fit(X, self.y)
+        self.fits += 1
+        return model
+    
+    def summary(self):
+        """Fit accounting for the comparison report"""
+        return {'n_splits': self.n_splits, 'fits': self.fits, 'fits_saved': self.fits_saved}
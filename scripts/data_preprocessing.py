@@ -3,33 +3,74 @@ Data Preprocessing Pipeline for Student Dropout Prediction
 Handles data loading, cleaning, normalization, and encoding
 """
 
+import argparse
+import os
+import sys
 import pandas as pd
 import numpy as np
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.model_selection import train_test_split
 import joblib
 import json
+from instrumentation import PeakMemory
+
+# String-like dtypes treated as categorical (pandas 3 reads text as 'str')
+CATEGORICAL_DTYPES = ['object', 'string', 'category']
+
+# Rows converted to float64 at a time when lean scaling
+LEAN_CHUNK_SIZE = 65536
+
+def smallest_code_dtype(n_classes):
+    """Narrowest signed integer dtype that holds category codes"""
+    return np.int8 if n_classes <= np.iinfo(np.int8).max else np.int16
+
+def downcast_frame(df):
+    """Shrink a raw extract in place: text to categoricals, integer counts to the narrowest int"""
+    for col in df.columns:
+        if col == 'student_id':
+            continue
+        if pd.api.types.is_integer_dtype(df[col]):
+            df[col] = pd.to_numeric(df[col], downcast='integer')
+        elif pd.api.types.is_string_dtype(df[col]):
+            df[col] = df[col].astype('category')
+    return df
 
 class DataPreprocessor:
-    """Reusable preprocessing pipeline for training and inference"""
+    """Reusable preprocessing pipeline for training and inference
     
-    def __init__(self):
+    ``lean=True`` keeps the pipeline memory-compact: text columns become
+    categoricals, counts and category codes use int8/int16, transforms work in
+    place, and features are scaled chunk by chunk into a float32 matrix.
+    """
+    
+    def __init__(self, lean=False):
         self.scaler = StandardScaler()
         self.label_encoders = {}
+        self.category_counts = {}
+        self.feature_ranges = {}
+        self.fill_values = {}
         self.feature_names = []
         self.is_fitted = False
+        self.lean = lean
         
     def load_data(self, filepath='data/student_data.csv'):
         """Load student dataset from CSV"""
         try:
-            df = pd.read_csv(filepath)
+            if self.lean:
+                # Parse text columns straight into categoricals instead of one string per cell
+                sample = pd.read_csv(filepath, nrows=1000)
+                text_cols = [col for col in sample.columns
+                             if col != 'student_id' and pd.api.types.is_string_dtype(sample[col])]
+                df = downcast_frame(pd.read_csv(filepath, dtype={col: 'category' for col in text_cols}))
+            else:
+                df = pd.read_csv(filepath)
             print(f"[v0] Loaded {len(df)} records from {filepath}")
             return df
         except FileNotFoundError:
             print(f"[v0] Dataset not found. Generating synthetic data...")
             return self.generate_synthetic_data()
     
-    def generate_synthetic_data(self, n_samples=1000):
+    def generate_synthetic_data(self, n_samples=1000, filepath='data/student_data.csv'):
         """Generate synthetic student data for demonstration"""
         np.random.seed(42)
         
@@ -62,37 +103,58 @@ class DataPreprocessor:
         
         df = pd.DataFrame(data)
         
-        # Save synthetic data
-        df.to_csv('data/student_data.csv', index=False)
-        print(f"[v0] Generated and saved {n_samples} synthetic records")
+        # Save synthetic data (filepath=None only returns it)
+        if filepath:
+            df.to_csv(filepath, index=False)
+            print(f"[v0] Generated and saved {n_samples} synthetic records")
         
         return df
     
-    def handle_missing_values(self, df):
-        """Handle missing values in the dataset"""
+    def handle_missing_values(self, df, fit=True):
+        """Handle missing values in the dataset
+        
+        Fitting remembers the median/mode of every column, so later batches
+        (and the feature store) are filled with training values.
+        """
+        if fit:
+            self.fill_values = {}
+        fill_values = {}
+        
         # Numerical columns: fill with median
         numerical_cols = df.select_dtypes(include=[np.number]).columns
         for col in numerical_cols:
+            if fit:
+                self.fill_values[col] = float(df[col].median())
             if df[col].isnull().any():
-                df[col].fillna(df[col].median(), inplace=True)
+                fill_values[col] = self.fill_values.get(col, df[col].median())
         
         # Categorical columns: fill with mode
-        categorical_cols = df.select_dtypes(include=['object']).columns
+        categorical_cols = df.select_dtypes(include=CATEGORICAL_DTYPES).columns
         for col in categorical_cols:
+            if fit and df[col].notna().any():
+                self.fill_values[col] = df[col].mode()[0]
             if df[col].isnull().any():
-                df[col].fillna(df[col].mode()[0], inplace=True)
+                fill_values[col] = self.fill_values.get(col, df[col].mode()[0])
+        
+        # Rebind columns on the frame itself; chained fillna(inplace=True) is a no-op under copy-on-write
+        for col, value in fill_values.items():
+            df[col] = df[col].fillna(value)
         
         return df
     
     def encode_categorical(self, df, fit=True):
         """Encode categorical variables"""
-        categorical_cols = df.select_dtypes(include=['object']).columns
+        categorical_cols = df.select_dtypes(include=CATEGORICAL_DTYPES).columns
         
         for col in categorical_cols:
             if col == 'student_id':
                 continue
-                
-            if fit:
+            
+            if self.lean:
+                df[col] = self._lean_codes(df[col], col, fit)
+            elif fit:
+                # Training frequencies let inference map unseen values to the most frequent class
+                self.category_counts[col] = {str(k): int(v) for k, v in df[col].value_counts().items()}
                 self.label_encoders[col] = LabelEncoder()
                 df[col] = self.label_encoders[col].fit_transform(df[col])
             else:
@@ -101,8 +163,26 @@ class DataPreprocessor:
         
         return df
     
+    def _lean_codes(self, values, col, fit):
+        """int8/int16 codes equal to LabelEncoder's, without an object-array round trip"""
+        if fit:
+            self.category_counts[col] = {str(k): int(v) for k, v in values.value_counts().items() if v}
+            # LabelEncoder sorts the distinct values, so fitting on them alone gives the same classes_
+            self.label_encoders[col] = LabelEncoder().fit(np.asarray(values.dropna().unique()))
+        if col not in self.label_encoders:
+            return values
+        
+        classes = self.label_encoders[col].classes_
+        codes = pd.Categorical(values, categories=classes).codes
+        if (codes < 0).any():
+            raise ValueError(f"{col} contains previously unseen labels")
+        return codes.astype(smallest_code_dtype(len(classes)), copy=False)
+    
     def normalize_features(self, X, fit=True):
         """Normalize numerical features"""
+        if self.lean:
+            return self._normalize_lean(X, fit)
+        
         if fit:
             X_scaled = self.scaler.fit_transform(X)
         else:
@@ -110,19 +190,42 @@ class DataPreprocessor:
         
         return pd.DataFrame(X_scaled, columns=X.columns, index=X.index)
     
+    def _normalize_lean(self, X, fit):
+        """Scale into a preallocated float32 matrix; only one chunk is ever widened to float64"""
+        n_rows = len(X)
+        if fit:
+            self.scaler = StandardScaler()
+            for start in range(0, n_rows, LEAN_CHUNK_SIZE):
+                self.scaler.partial_fit(X.iloc[start:start + LEAN_CHUNK_SIZE])
+        
+        X_scaled = np.empty((n_rows, X.shape[1]), dtype=np.float32)
+        for start in range(0, n_rows, LEAN_CHUNK_SIZE):
+            X_scaled[start:start + LEAN_CHUNK_SIZE] = self.scaler.transform(X.iloc[start:start + LEAN_CHUNK_SIZE])
+        
+        return pd.DataFrame(X_scaled, columns=X.columns, index=X.index, copy=False)
+    
     def preprocess(self, df, target_col='dropout', fit=True):
         """Complete preprocessing pipeline"""
         # Handle missing values
-        df = self.handle_missing_values(df)
+        df = self.handle_missing_values(df, fit=fit)
         
         # Separate features and target
         if target_col in df.columns:
             y = df[target_col]
+            if self.lean:
+                y = pd.to_numeric(y, downcast='integer')
             X = df.drop([target_col, 'student_id'], axis=1, errors='ignore')
         else:
             y = None
             X = df.drop(['student_id'], axis=1, errors='ignore')
         
+        # Training ranges let inference validate numeric inputs
+        if fit:
+            numeric = X.select_dtypes(include=[np.number])
+            self.feature_ranges = {
+                col: (float(numeric[col].min()), float(numeric[col].max())) for col in numeric.columns
+            }
+        
         # Encode categorical variables
         X = self.encode_categorical(X, fit=fit)
         
@@ -141,6 +244,9 @@ class DataPreprocessor:
         joblib.dump({
             'scaler': self.scaler,
             'label_encoders': self.label_encoders,
+            'category_counts': self.category_counts,
+            'feature_ranges': self.feature_ranges,
+            'fill_values': self.fill_values,
             'feature_names': self.feature_names,
             'is_fitted': self.is_fitted
         }, filepath)
@@ -151,6 +257,9 @@ class DataPreprocessor:
         state = joblib.load(filepath)
         self.scaler = state['scaler']
         self.label_encoders = state['label_encoders']
+        self.category_counts = state.get('category_counts', {})
+        self.feature_ranges = state.get('feature_ranges', {})
+        self.fill_values = state.get('fill_values', {})
         self.feature_names = state['feature_names']
         self.is_fitted = state['is_fitted']
         print(f"[v0] Preprocessor loaded from {filepath}")
@@ -169,18 +278,36 @@ class DataPreprocessor:
         return X
 
 if __name__ == "__main__":
-    # Test preprocessing pipeline
-    preprocessor = DataPreprocessor()
-    df = preprocessor.load_data()
+    parser = argparse.ArgumentParser(description="Preprocess the student dataset")
+    parser.add_argument('--data', default='data/student_data.csv')
+    parser.add_argument('--lean', action='store_true',
+                        help="Compact dtypes (categoricals, int8/int16 codes, float32 features) and in-place transforms")
+    parser.add_argument('--generate-only', action='store_true',
+                        help="Write synthetic data to --data if it does not exist, then exit")
+    args = parser.parse_args()
     
-    print("\n[v0] Dataset Info:")
-    print(df.info())
-    print("\n[v0] Target Distribution:")
-    print(df['dropout'].value_counts())
+    if args.generate_only:
+        if os.path.exists(args.data):
+            print(f"[v0] Dataset already exists: {args.data}")
+        else:
+            DataPreprocessor().generate_synthetic_data(filepath=args.data)
+        sys.exit(0)
     
-    # Preprocess data
-    X, y = preprocessor.preprocess(df)
+    # Test preprocessing pipeline
+    preprocessor = DataPreprocessor(lean=args.lean)
+    with PeakMemory('preprocess', lean=str(args.lean).lower()) as peak:
+        df = preprocessor.load_data(args.data)
+        
+        print("\n[v0] Dataset Info:")
+        print(df.info())
+        print("\n[v0] Target Distribution:")
+        print(df['dropout'].value_counts())
+        
+        # Preprocess data
+        X, y = preprocessor.preprocess(df)
     
+    print(f"\n[v0] Peak traced memory (load + preprocess): {peak.peak / 2**20:.1f} MB")
+    print(f"[v0] Feature matrix: {X.memory_usage(index=False).sum() / 2**20:.1f} MB ({X.dtypes.iloc[0]})")
     print(f"\n[v0] Preprocessed Features Shape: {X.shape}")
     print(f"[v0] Feature Names: {preprocessor.feature_names}")
     
@@ -200,7 +327,9 @@ if __name__ == "__main__":
         'X_train': X_train,
         'X_test': X_test,
         'y_train': y_train,
-        'y_test': y_test
+        'y_test': y_test,
+        # Row label -> student_id, so the similarity index can name historical students
+        'student_id': df['student_id'] if 'student_id' in df.columns else None
     }, 'data/processed_data.pkl')
     
     print("\n[v0] Preprocessing complete!")
@@ -0,0 +1,139 @@
+"""
+Delta re-scoring support for batch predictions
+Compares input fingerprints against the previous run's manifest so only new or changed students are re-scored
+"""
+
+import os
+import numpy as np
+import pandas as pd
+from instrumentation import get_logger, metrics
+from prediction_store import feature_fingerprints
+
+logger = get_logger('delta_scoring')
+
+def default_manifest_path(output_path):
+    """Manifest lives next to the batch output"""
+    return os.path.splitext(output_path)[0] + '.manifest.pkl'
+
+def scoring_version(predictor):
+    """Everything besides the input row that can change a result"""
+    return f"{predictor.model_version}:{predictor.preprocessor_version}:{predictor.unseen_policy}"
+
+class ScoringManifest:
+    """Per-student fingerprints and results from one batch run"""
+    
+    def __init__(self, version, table):
+        self.version = version
+        # Indexed by student_id: features_hash plus the batch output fields
+        self.table = table
+    
+    @classmethod
+    def load(cls, path):
+        """Load a manifest, or return None when there is no usable previous run"""
+        if not os.path.exists(path):
+            return None
+        try:
+            state = pd.read_pickle(path)
+            return cls(state['version'], state['table'])
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable manifest {path}: {e}")
+            return None
+    
+    @classmethod
+    def from_results(cls, version, student_ids, fingerprints, results, risk_factors=None):
+        """``risk_factors`` (one list per row, None for failed rows) keeps carried rankings explained"""
+        table = pd.DataFrame(results)
+        table['features_hash'] = fingerprints
+        if risk_factors is not None:
+            table['risk_factors'] = pd.Series(risk_factors, index=table.index, dtype=object)
+        table.index = pd.Index(student_ids, name='student_id')
+        table = table.drop(columns=['student_id'], errors='ignore')
+        # Keep the last occurrence if the roster repeats a student
+        table = table[~table.index.duplicated(keep='last')]
+        return cls(version, table)
+    
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        pd.to_pickle({'version': self.version, 'table': self.table}, tmp_path)
+        os.replace(tmp_path, path)
+    
+    def unchanged_mask(self, student_ids, fingerprints):
+        """Rows whose student scored successfully last run with identical inputs"""
+        positions = self.table.index.get_indexer(pd.Index(student_ids))
+        known = positions >= 0
+        positions = np.where(known, positions, 0)
+        same = known & (self.table['features_hash'].to_numpy()[positions] == fingerprints)
+        if 'error' in self.table.columns:
+            same &= self.table['error'].isna().to_numpy()[positions]
+        return same
+    
+    @property
+    def has_risk_factors(self):
+        return 'risk_factors' in self.table.columns
+    
+    def carried_results(self, student_ids, with_risk_factors=False):
+        """Previous batch output records for the given students, optionally with their risk factors"""
+        excluded = ('features_hash', 'error') if with_risk_factors else ('features_hash', 'error', 'risk_factors')
+        columns = [col for col in self.table.columns if col not in excluded]
+        positions = self.table.index.get_indexer(pd.Index(student_ids))
+        # Column-wise gather, then one zip per row keeps this cheap for large rosters
+        values = [self.table[col].to_numpy()[positions].tolist() for col in columns]
+        keys = ('student_id', *columns)
+        return [dict(zip(keys, row)) for row in zip(student_ids, *values)]
+
+def score_incrementally(predictor, students_df, manifest, score_fn, carried_sinks=()):
+    """Score only new/changed rows and carry previous results forward for the rest
+    
+    ``score_fn(df)`` scores a DataFrame and returns batch output records in row
+    order. Carried-forward records, with the ``risk_factors`` stored in the
+    manifest, are passed to each of ``carried_sinks`` as
+    ``sink(student_ids, records, rows)``. Returns (results for every row in
+    input order, fingerprints).
+    """
+    student_ids = students_df['student_id'].tolist()
+    with metrics.timer('fingerprint'):
+        # Missing feature columns hash as NaN; those rows fail validation and are rescored each run
+        fingerprints = feature_fingerprints(students_df.reindex(columns=predictor.feature_names))
+    
+    if manifest is None:
+        logger.info("No previous manifest; scoring all rows")
+        return score_fn(students_df), fingerprints
+    
+    if manifest.version != scoring_version(predictor):
+        logger.info(f"Model changed ({manifest.version} -> {scoring_version(predictor)}); scoring all rows")
+        return score_fn(students_df), fingerprints
+    
+    if carried_sinks and not manifest.has_risk_factors:
+        # Carried rows could not be explained like re-scored ones
+        logger.info("Previous manifest has no risk factors; scoring all rows")
+        return score_fn(students_df), fingerprints
+    
+    unchanged = manifest.unchanged_mask(student_ids, fingerprints)
+    changed_positions = np.flatnonzero(~unchanged)
+    carried_positions = np.flatnonzero(unchanged)
+    logger.info(
+        f"Delta scoring: {len(changed_positions)} new/changed rows, "
+        f"{len(carried_positions)} carried forward from the previous run"
+    )
+    metrics.increment('delta_rows_scored', len(changed_positions))
+    metrics.increment('delta_rows_carried', len(carried_positions))
+    
+    results = [None] * len(students_df)
+    if len(changed_positions):
+        scored = score_fn(students_df.iloc[changed_positions])
+        for position, result in zip(changed_positions, scored):
+            results[position] = result
+    if len(carried_positions):
+        carried_ids = [student_ids[i] for i in carried_positions]
+        carried = manifest.carried_results(carried_ids)
+        for position, result in zip(carried_positions, carried):
+            results[position] = result
+        if carried_sinks:
+            explained = manifest.carried_results(carried_ids, with_risk_factors=True)
+            for sink in carried_sinks:
+                sink(carried_ids, explained, students_df.iloc[carried_positions])
+    
+    return results, fingerprints
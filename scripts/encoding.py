@@ -0,0 +1,113 @@
+"""
+Hash-map categorical encoders for inference
+Built once from the fitted LabelEncoders so whole columns encode with vectorized lookups
+"""
+
+import numpy as np
+import pandas as pd
+from instrumentation import get_logger, metrics
+
+logger = get_logger('encoding')
+
+# What to do with a category that was not seen during training
+UNSEEN_POLICIES = ('most_frequent', 'unknown', 'reject')
+
+class UnseenCategoryError(ValueError):
+    """Raised when the reject policy meets a category missing from training data"""
+    
+    def __init__(self, column, values):
+        self.column = column
+        self.values = list(values)
+        super().__init__(f"Unseen category in {column}: {self.values[:5]}")
+
+class HashCategoricalEncoder:
+    """O(1) per-value replacement for ``LabelEncoder.transform``
+    
+    Codes are identical to the LabelEncoder's for known categories. Unseen
+    values are resolved per cell according to ``policy``:
+    
+    - ``most_frequent``: code of the most frequent training category
+    - ``unknown``: a dedicated code one past the last known class
+    - ``reject``: code -1; the caller drops or fails the affected rows
+    """
+    
+    def __init__(self, column, classes, policy='most_frequent', most_frequent=None):
+        if policy not in UNSEEN_POLICIES:
+            raise ValueError(f"Unknown unseen-category policy '{policy}', expected one of {UNSEEN_POLICIES}")
+        
+        self.column = column
+        self.policy = policy
+        self.classes = list(classes)
+        # pandas Index lookups go through a hash table, unlike LabelEncoder's searchsorted
+        self.index = pd.Index(self.classes)
+        self.mapping = {value: code for code, value in enumerate(self.classes)}
+        self.unknown_code = len(self.classes)
+        self.most_frequent_code = self.mapping.get(most_frequent, 0)
+        self.unseen_count = 0
+        self._warned = False
+    
+    @classmethod
+    def from_label_encoder(cls, column, encoder, policy='most_frequent', category_counts=None):
+        """Build from a fitted LabelEncoder and optional training value counts"""
+        most_frequent = None
+        if category_counts:
+            most_frequent = max(category_counts, key=category_counts.get)
+        # Older preprocessor pickles have no counts; fall back to the first class as before
+        return cls(column, encoder.classes_, policy=policy, most_frequent=most_frequent)
+    
+    def encode(self, values):
+        """Encode a column; returns (codes, unseen_mask)"""
+        codes = self.index.get_indexer(pd.Index(values)).astype(np.int64)
+        unseen = codes < 0
+        if unseen.any():
+            values = np.asarray(values, dtype=object)
+            codes, unseen = self._resolve_unseen(codes, unseen, values[unseen])
+        return codes, unseen
+    
+    def _resolve_unseen(self, codes, unseen, unseen_values):
+        n_unseen = int(unseen.sum())
+        self.unseen_count += n_unseen
+        metrics.increment('unseen_categories', n_unseen, column=self.column, policy=self.policy)
+        
+        if not self._warned:
+            # One warning per encoder; afterwards only the counters move
+            logger.warning(
+                f"Unseen category in {self.column} (e.g. {list(unseen_values[:3])}); "
+                f"applying '{self.policy}' policy"
+            )
+            self._warned = True
+        
+        if self.policy == 'reject':
+            return codes, unseen
+        codes = codes.copy()
+        codes[unseen] = self.unknown_code if self.policy == 'unknown' else self.most_frequent_code
+        return codes, unseen
+
+def build_encoders(label_encoders, policy='most_frequent', category_counts=None):
+    """Build hash encoders for every saved LabelEncoder"""
+    category_counts = category_counts or {}
+    return {
+        col: HashCategoricalEncoder.from_label_encoder(
+            col, encoder, policy=policy, category_counts=category_counts.get(col)
+        )
+        for col, encoder in label_encoders.items()
+    }
+
+def encode_frame(df, encoders):
+    """Encode categorical columns of ``df`` in place
+    
+    Returns a boolean mask of rows rejected by a ``reject`` policy encoder.
+    """
+    rejected = np.zeros(len(df), dtype=bool)
+    for col, encoder in encoders.items():
+        if col in df.columns:
+            codes, unseen = encoder.encode(df[col].to_numpy())
+            if encoder.policy == 'reject' and unseen.any():
+                rejected |= unseen
+                codes = np.where(unseen, 0, codes)
+            df[col] = codes
+    return rejected
+
+def unseen_counts(encoders):
+    """Per-column unseen-category totals since the encoders were built"""
+    return {col: encoder.unseen_count for col, encoder in encoders.items() if encoder.unseen_count}
@@ -0,0 +1,172 @@
+"""
+Compiled input schema for the model features
+Validates whole chunks with vectorized null, type, range and category checks before scoring
+"""
+
+import numpy as np
+import pandas as pd
+from instrumentation import get_logger, metrics
+
+logger = get_logger('feature_schema')
+
+# Reason codes are bit flags so one cell or row can carry several
+REASON_MISSING = 1
+REASON_TYPE = 2
+REASON_RANGE = 4
+REASON_CATEGORY = 8
+REASON_NAMES = {
+    REASON_MISSING: 'missing',
+    REASON_TYPE: 'not numeric',
+    REASON_RANGE: 'out of range',
+    REASON_CATEGORY: 'unseen category'
+}
+
+# Hard limits for known features: values outside them are data errors, not unusual students
+FEATURE_LIMITS = {
+    'age': (0, 100),
+    'attendance_rate': (0.0, 1.0),
+    'gpa_semester1': (0.0, 4.0),
+    'gpa_semester2': (0.0, 4.0),
+    'extracurricular': (0, None),
+    'study_hours_weekly': (0, 168),
+    'absences': (0, 366),
+    'behavioral_issues': (0, None),
+    'previous_failures': (0, None)
+}
+
+# Features without hard limits accept this fraction of the training span beyond either end
+RANGE_SLACK = 0.5
+
+def reason_names(code):
+    """Names of the reason bits set in ``code``"""
+    return [name for bit, name in REASON_NAMES.items() if code & bit]
+
+class InvalidInputError(ValueError):
+    """Raised when a single record fails schema validation"""
+    
+    def __init__(self, message, reason_code):
+        self.reason_code = reason_code
+        super().__init__(message)
+
+class ValidationReport:
+    """Per-cell reason codes for one validated chunk"""
+    
+    def __init__(self, columns, cells):
+        self.columns = columns
+        # (rows, features) uint8 array of reason bits
+        self.cells = cells
+        self.reasons = np.bitwise_or.reduce(cells, axis=1) if cells.shape[1] else np.zeros(len(cells), np.uint8)
+        self.valid = self.reasons == 0
+    
+    @property
+    def invalid_positions(self):
+        return np.flatnonzero(~self.valid)
+    
+    def describe(self, position):
+        """Human-readable reasons a row was rejected"""
+        row = self.cells[position]
+        problems = [
+            f"{self.columns[j]} {' and '.join(reason_names(int(row[j])))}" for j in np.flatnonzero(row)
+        ]
+        return f"Invalid input: {', '.join(problems)}"
+    
+    def counts(self):
+        """Rejected cells per (column, reason)"""
+        counts = {}
+        for j, col in enumerate(self.columns):
+            column = self.cells[:, j]
+            if not column.any():
+                continue
+            for bit, name in REASON_NAMES.items():
+                n = int(np.count_nonzero(column & bit))
+                if n:
+                    counts[(col, name)] = n
+        return counts
+
+class FeatureSchema:
+    """Expected type, bounds and categories for each model feature
+    
+    Built once from the preprocessor state. ``validate`` runs a handful of
+    NumPy comparisons per column, so its cost is small next to scoring.
+    Unseen categories are only a rejection reason under the ``reject``
+    policy; the other policies map them at encoding time.
+    """
+    
+    def __init__(self, feature_names, bounds, encoders, training_ranges=None):
+        self.feature_names = list(feature_names)
+        self.bounds = bounds
+        self.encoders = encoders
+        self.training_ranges = training_ranges or {}
+    
+    @classmethod
+    def from_preprocessor_state(cls, state, encoders):
+        """Compile bounds from hard feature limits and the saved training ranges"""
+        training_ranges = state.get('feature_ranges', {})
+        bounds = {}
+        for col in state['feature_names']:
+            if col in encoders:
+                continue
+            low, high = -np.inf, np.inf
+            if col in training_ranges:
+                train_low, train_high = training_ranges[col]
+                slack = (train_high - train_low) * RANGE_SLACK
+                low, high = train_low - slack, train_high + slack
+            if col in FEATURE_LIMITS:
+                limit_low, limit_high = FEATURE_LIMITS[col]
+                low = -np.inf if limit_low is None else limit_low
+                high = np.inf if limit_high is None else limit_high
+            bounds[col] = (low, high)
+        return cls(state['feature_names'], bounds, encoders, training_ranges)
+    
+    def validate(self, df):
+        """Return (features, report): model columns with numerics as float64, and reason codes"""
+        n_rows = len(df)
+        cells = np.zeros((n_rows, len(self.feature_names)), dtype=np.uint8)
+        features = {}
+        outside_training = np.zeros(n_rows, dtype=bool)
+        
+        for j, col in enumerate(self.feature_names):
+            if col not in df.columns:
+                cells[:, j] = REASON_MISSING
+                features[col] = np.full(n_rows, np.nan) if col in self.bounds else np.full(n_rows, None)
+                continue
+            
+            values = df[col]
+            missing = values.isna().to_numpy()
+            cells[missing, j] |= REASON_MISSING
+            
+            if col in self.encoders:
+                encoder = self.encoders[col]
+                if encoder.policy == 'reject':
+                    present = ~missing
+                    _, unseen = encoder.encode(values.to_numpy()[present])
+                    cells[np.flatnonzero(present)[unseen], j] |= REASON_CATEGORY
+                features[col] = values
+                continue
+            
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                numbers = values.to_numpy(dtype=np.float64, na_value=np.nan)
+            else:
+                numbers = pd.to_numeric(values, errors='coerce').to_numpy(dtype=np.float64, na_value=np.nan)
+                cells[np.isnan(numbers) & ~missing, j] |= REASON_TYPE
+            
+            low, high = self.bounds[col]
+            with np.errstate(invalid='ignore'):
+                out_of_range = ~np.isnan(numbers) & ~((numbers >= low) & (numbers <= high) & np.isfinite(numbers))
+            cells[out_of_range, j] |= REASON_RANGE
+            features[col] = numbers
+            
+            if col in self.training_ranges:
+                train_low, train_high = self.training_ranges[col]
+                outside_training |= (numbers < train_low) | (numbers > train_high)
+        
+        report = ValidationReport(self.feature_names, cells)
+        invalid = int(np.count_nonzero(~report.valid))
+        if invalid:
+            metrics.increment('rows_invalid', invalid)
+            for (col, reason), count in report.counts().items():
+                metrics.increment('invalid_cells', count, column=col, reason=reason)
+        # Valid but beyond what the model saw in training: scored, only counted
+        metrics.increment('rows_outside_training_range', int(np.count_nonzero(outside_training & report.valid)))
+        
+        return pd.DataFrame(features, index=df.index), report
@@ -0,0 +1,348 @@
+"""
+Precomputed feature store for recurring students
+Keeps encoded, imputed and scaled feature vectors per student and as-of date, updated incrementally and read as contiguous arrays
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import date
+import joblib
+import numpy as np
+import pandas as pd
+from encoding import build_encoders, encode_frame
+from feature_schema import FeatureSchema
+from instrumentation import get_logger, metrics
+from predict import model_file_version
+from prediction_store import feature_fingerprints
+
+logger = get_logger('feature_store')
+
+DEFAULT_FEATURE_STORE_DIR = 'data/feature_store'
+DEFAULT_PREPROCESSOR_PATH = 'models/preprocessor.pkl'
+TARGET_COLUMN = 'dropout'
+# Stored label for students whose outcome is unknown
+NO_LABEL = -1
+
+# Per-student values derived from raw columns, computed once per change instead of on every scoring pass
+DERIVED_FEATURES = {
+    # Missing semesters default to 4.0, as in DropoutPredictor.generate_recommendations
+    'avg_gpa': lambda raw: (
+        raw.get('gpa_semester1', pd.Series(4.0, index=raw.index)).fillna(4.0)
+        + raw.get('gpa_semester2', pd.Series(4.0, index=raw.index)).fillna(4.0)
+    ).to_numpy(dtype=np.float64) / 2
+}
+
+ARRAYS = ('student_id', 'fingerprint', 'features', 'derived', 'valid', 'imputed', 'label')
+# Bumped when the stored arrays change meaning, so older snapshots are rebuilt on the next update
+STORE_FORMAT = 2
+
+def _student_ids(values):
+    """Sortable ID array: integers stay integers, anything else becomes fixed-width text"""
+    ids = np.asarray(values)
+    return ids.astype(np.int64) if ids.dtype.kind in 'iu' else ids.astype(str)
+
+class FeatureTransform:
+    """Imputation, encoding and scaling exactly as fitted by the saved preprocessor
+    
+    Missing values are filled with the training medians and modes, categories
+    go through the inference hash encoders and rows that still fail the
+    feature schema are stored as invalid. Filled rows are flagged as
+    imputed: training uses their vectors, as data_preprocessing.py would,
+    but scoring rejects missing values, so they are never scored from the store.
+    """
+    
+    def __init__(self, state, preprocessor_version, unseen_policy='most_frequent'):
+        self.feature_names = list(state['feature_names'])
+        self.fill_values = state.get('fill_values', {})
+        self.scaler = state['scaler']
+        self.encoders = build_encoders(state['label_encoders'], policy=unseen_policy,
+                                       category_counts=state.get('category_counts'))
+        self.schema = FeatureSchema.from_preprocessor_state(state, self.encoders)
+        self.preprocessor_version = preprocessor_version
+        self.unseen_policy = unseen_policy
+    
+    @classmethod
+    def load(cls, preprocessor_path=DEFAULT_PREPROCESSOR_PATH, unseen_policy='most_frequent'):
+        return cls(joblib.load(preprocessor_path), model_file_version(preprocessor_path), unseen_policy)
+    
+    @property
+    def version(self):
+        """Everything besides the raw row that changes a stored vector"""
+        return f"{STORE_FORMAT}:{self.preprocessor_version}:{self.unseen_policy}"
+    
+    def transform(self, df):
+        """Returns (scaled float64 features, valid mask, derived features, imputed mask) for a raw frame"""
+        raw = df.reindex(columns=self.feature_names)
+        fills = {col: value for col, value in self.fill_values.items() if col in raw.columns}
+        imputed = np.zeros(len(raw), dtype=bool)
+        if fills:
+            imputed = raw[list(fills)].isna().any(axis=1).to_numpy()
+            raw = raw.fillna(fills)
+        
+        features, report = self.schema.validate(raw)
+        X = np.full((len(raw), len(self.feature_names)), np.nan)
+        valid = report.valid.copy()
+        positions = np.flatnonzero(valid)
+        if len(positions):
+            features = features.iloc[positions].copy()
+            rejected = encode_frame(features, self.encoders)
+            X[positions] = self.scaler.transform(features)
+            X[positions[rejected]] = np.nan
+            valid[positions[rejected]] = False
+        
+        derived = np.column_stack([derive(raw) for derive in DERIVED_FEATURES.values()])
+        return X, valid, derived, imputed
+
+class FeatureSnapshot:
+    """One as-of date of the store: row-aligned arrays sorted by student_id
+    
+    ``features`` is a C-contiguous (students, features) float64 matrix in
+    ``feature_names`` order, ready to pass to a model. Arrays loaded from disk
+    are memory-mapped read-only. Rows that are valid and not imputed can be
+    scored straight from ``features``.
+    """
+    
+    def __init__(self, meta, student_id, fingerprint, features, derived, valid, imputed, label):
+        self.meta = meta
+        self.student_id = student_id
+        self.fingerprint = fingerprint
+        self.features = features
+        self.derived = derived
+        self.valid = valid
+        self.imputed = imputed
+        self.label = label
+    
+    @classmethod
+    def empty(cls, transform):
+        n_features, n_derived = len(transform.feature_names), len(DERIVED_FEATURES)
+        return cls(
+            {'version': None}, np.empty(0, np.int64), np.empty(0, np.uint64),
+            np.empty((0, n_features)), np.empty((0, n_derived)), np.empty(0, bool), np.empty(0, bool),
+            np.empty(0, np.int8)
+        )
+    
+    @classmethod
+    def load(cls, directory, mmap_mode='r'):
+        with open(os.path.join(directory, 'meta.json')) as f:
+            meta = json.load(f)
+        arrays = {}
+        for name in ARRAYS:
+            path = os.path.join(directory, f'{name}.npy')
+            if name == 'imputed' and not os.path.exists(path):
+                # Older format: which rows were imputed is unknown, so none are scored from the store
+                arrays[name] = np.ones(len(arrays['student_id']), dtype=bool)
+                continue
+            arrays[name] = np.load(path, mmap_mode=mmap_mode)
+        return cls(meta, **arrays)
+    
+    def save(self, directory):
+        """Write every array plus meta.json, replacing any previous snapshot for the date"""
+        tmp_dir = f'{directory}.tmp'
+        if os.path.exists(tmp_dir):
+            shutil.rmtree(tmp_dir)
+        os.makedirs(tmp_dir)
+        for name in ARRAYS:
+            np.save(os.path.join(tmp_dir, f'{name}.npy'), np.ascontiguousarray(getattr(self, name)))
+        with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+            json.dump(self.meta, f, indent=2)
+        
+        # A directory cannot be replaced while it has files, so the old one is moved aside first
+        old_dir = f'{directory}.old'
+        if os.path.exists(directory):
+            os.replace(directory, old_dir)
+        os.replace(tmp_dir, directory)
+        if os.path.exists(old_dir):
+            shutil.rmtree(old_dir)
+    
+    @property
+    def as_of(self):
+        return self.meta.get('as_of')
+    
+    @property
+    def feature_names(self):
+        return self.meta.get('feature_names', [])
+    
+    def __len__(self):
+        return len(self.student_id)
+    
+    def positions(self, student_ids):
+        """Row of each student in the snapshot, -1 where absent"""
+        ids = _student_ids(student_ids)
+        if len(self) == 0 or ids.dtype.kind != self.student_id.dtype.kind:
+            return np.full(len(ids), -1, dtype=np.int64)
+        positions = np.searchsorted(self.student_id, ids)
+        positions = np.minimum(positions, len(self) - 1)
+        return np.where(self.student_id[positions] == ids, positions, -1)
+    
+    def derived_column(self, name):
+        return self.derived[:, self.meta['derived_names'].index(name)]
+    
+    def training_data(self):
+        """(X, y) for valid students with a known label, as model-ready frames indexed by student_id"""
+        rows = np.flatnonzero(np.asarray(self.valid) & (np.asarray(self.label) != NO_LABEL))
+        index = pd.Index(self.student_id[rows], name='student_id')
+        X = pd.DataFrame(self.features[rows], columns=self.feature_names, index=index)
+        y = pd.Series(self.label[rows].astype(np.int64), index=index, name=TARGET_COLUMN)
+        return X, y
+
+class FeatureStore:
+    """Directory of snapshots, one per as-of date (``<root>/YYYY-MM-DD/``)
+    
+    ``update`` starts from the latest snapshot at or before the new date and
+    only transforms students whose raw inputs changed or who are new;
+    everyone else is carried forward, including students absent from the
+    update. A preprocessor change rebuilds every row. Readers pick the
+    latest snapshot as of a date, so training can be replayed point-in-time.
+    """
+    
+    def __init__(self, root=DEFAULT_FEATURE_STORE_DIR):
+        self.root = root
+    
+    def dates(self):
+        """As-of dates with a complete snapshot, oldest first"""
+        if not os.path.isdir(self.root):
+            return []
+        dates = []
+        for name in os.listdir(self.root):
+            try:
+                date.fromisoformat(name)
+            except ValueError:
+                continue
+            if os.path.exists(os.path.join(self.root, name, 'meta.json')):
+                dates.append(name)
+        return sorted(dates)
+    
+    def snapshot(self, as_of=None, mmap_mode='r'):
+        """Latest snapshot on or before ``as_of`` (ISO date, default: newest), or None"""
+        dates = [d for d in self.dates() if as_of is None or d <= str(as_of)]
+        if not dates:
+            return None
+        return FeatureSnapshot.load(os.path.join(self.root, dates[-1]), mmap_mode=mmap_mode)
+    
+    def update(self, df, transform, as_of=None):
+        """Fold a raw extract into the snapshot for ``as_of`` (default: today) and return it"""
+        as_of = str(as_of or date.today().isoformat())
+        # Snapshot directories are named by ISO date; anything else raises ValueError here
+        date.fromisoformat(as_of)
+        if 'student_id' not in df.columns:
+            raise ValueError("The feature store needs a student_id column")
+        
+        base = self.snapshot(as_of, mmap_mode=None)
+        if base is None or base.meta.get('version') != transform.version:
+            if base is not None:
+                logger.info(f"Preprocessor changed ({base.meta.get('version')} -> {transform.version}); "
+                            "rebuilding every row")
+            base = FeatureSnapshot.empty(transform)
+        
+        # The last record wins when the extract repeats a student
+        df = df[~df['student_id'].duplicated(keep='last')]
+        ids = _student_ids(df['student_id'])
+        with metrics.timer('fingerprint'):
+            fingerprints = feature_fingerprints(df.reindex(columns=transform.feature_names))
+        
+        if len(base) and ids.dtype.kind != base.student_id.dtype.kind:
+            raise ValueError(f"student_id type changed since the {base.as_of} snapshot")
+        positions = base.positions(ids)
+        known = positions >= 0
+        changed = ~known
+        changed[known] = base.fingerprint[positions[known]] != fingerprints[known]
+        changed_rows = np.flatnonzero(changed)
+        with metrics.timer('feature_transform'):
+            X, valid, derived, imputed = transform.transform(df.iloc[changed_rows])
+        
+        # Known students keep their row; new ones are appended after the carried rows
+        new = ~known
+        n_new = int(new.sum())
+        targets = positions.copy()
+        targets[new] = len(base) + np.arange(n_new)
+        base_ids = base.student_id if len(base) else base.student_id.astype(ids.dtype)
+        arrays = {
+            'student_id': np.concatenate([base_ids, ids[new]]),
+            'fingerprint': np.concatenate([base.fingerprint, np.zeros(n_new, np.uint64)]),
+            'features': np.concatenate([base.features, np.empty((n_new, base.features.shape[1]))]),
+            'derived': np.concatenate([base.derived, np.empty((n_new, base.derived.shape[1]))]),
+            'valid': np.concatenate([base.valid, np.zeros(n_new, bool)]),
+            'imputed': np.concatenate([base.imputed, np.zeros(n_new, bool)]),
+            'label': np.concatenate([base.label, np.full(n_new, NO_LABEL, np.int8)])
+        }
+        rows = targets[changed_rows]
+        arrays['fingerprint'][rows] = fingerprints[changed_rows]
+        arrays['features'][rows] = X
+        arrays['derived'][rows] = derived
+        arrays['valid'][rows] = valid
+        arrays['imputed'][rows] = imputed
+        if TARGET_COLUMN in df.columns:
+            labels = df[TARGET_COLUMN].to_numpy(dtype=np.float64, na_value=np.nan)
+            arrays['label'][targets] = np.where(np.isnan(labels), NO_LABEL, labels).astype(np.int8)
+        
+        order = np.argsort(arrays['student_id'], kind='stable')
+        students = len(order)
+        meta = {
+            'as_of': as_of,
+            'version': transform.version,
+            'preprocessor_version': transform.preprocessor_version,
+            'unseen_policy': transform.unseen_policy,
+            'feature_names': transform.feature_names,
+            'derived_names': list(DERIVED_FEATURES),
+            'students': students,
+            'updated': len(changed_rows),
+            'carried': students - len(changed_rows),
+            'invalid': int(students - arrays['valid'].sum()),
+            'imputed': int(arrays['imputed'].sum()),
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S')
+        }
+        snapshot = FeatureSnapshot(meta, **{name: arrays[name][order] for name in ARRAYS})
+        with metrics.timer('feature_store_write'):
+            snapshot.save(os.path.join(self.root, as_of))
+        metrics.increment('feature_store_updated', len(changed_rows))
+        logger.info(f"Feature store {as_of}: {len(changed_rows)} students transformed, "
+                    f"{meta['carried']} carried forward, {meta['invalid']} invalid, {meta['imputed']} imputed")
+        return snapshot
+    
+    def prune(self, keep):
+        """Delete all but the newest ``keep`` snapshots; returns the removed dates"""
+        removed = self.dates()[:-max(int(keep), 1)]
+        for as_of in removed:
+            shutil.rmtree(os.path.join(self.root, as_of))
+        return removed
+
+def main():
+    """Update or inspect the feature store from the command line"""
+    parser = argparse.ArgumentParser(description="Precomputed per-student feature store")
+    parser.add_argument('--store', default=DEFAULT_FEATURE_STORE_DIR, help="Feature store directory")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    update = commands.add_parser('update', help="Fold a raw CSV extract into the store")
+    update.add_argument('input_csv')
+    update.add_argument('--as-of', default=None, help="Snapshot date (default: today)")
+    update.add_argument('--preprocessor', default=DEFAULT_PREPROCESSOR_PATH)
+    
+    info = commands.add_parser('info', help="Describe the snapshot in effect on a date")
+    info.add_argument('--as-of', default=None, help="Date to look up (default: newest)")
+    
+    prune = commands.add_parser('prune', help="Delete old snapshots")
+    prune.add_argument('--keep', type=int, required=True, help="Snapshots to keep")
+    
+    args = parser.parse_args()
+    store = FeatureStore(args.store)
+    
+    if args.command == 'update':
+        with metrics.timer('load_input'):
+            df = pd.read_csv(args.input_csv)
+        result = store.update(df, FeatureTransform.load(args.preprocessor), as_of=args.as_of).meta
+    elif args.command == 'info':
+        snapshot = store.snapshot(args.as_of)
+        if snapshot is None:
+            print(f"[v0] No feature store snapshot in {args.store}", file=sys.stderr)
+            sys.exit(1)
+        result = {**snapshot.meta, 'snapshots': store.dates()}
+    else:
+        result = {'removed': store.prune(args.keep), 'remaining': store.dates()}
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
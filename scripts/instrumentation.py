@@ -0,0 +1,416 @@
+"""
+Low-overhead instrumentation for prediction and training
+Provides leveled logging, per-stage timers/histograms and an optional sampling profiler
+"""
+
+import atexit
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from bisect import bisect_left
+from collections import Counter
+
+LOG_FORMAT = '[v0] %(levelname)s %(name)s: %(message)s'
+
+# Latency buckets in seconds (upper bounds, Prometheus "le" semantics)
+DEFAULT_BUCKETS = (
+    0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0, 900.0
+)
+
+class JsonLogFormatter(logging.Formatter):
+    """Render log records as one JSON object per line"""
+    
+    def format(self, record):
+        payload = {
+            'ts': round(record.created, 6),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        fields = getattr(record, 'fields', None)
+        if fields:
+            payload.update(fields)
+        return json.dumps(payload, default=str)
+
+def get_logger(name):
+    """Return a leveled logger under the shared "v0" namespace
+    
+    Level comes from V0_LOG_LEVEL (default INFO); set V0_LOG_FORMAT=json for
+    one JSON record per line. Structured fields can be passed with
+    ``logger.info(msg, extra={'fields': {...}})``.
+    """
+    root = logging.getLogger('v0')
+    if not root.handlers:
+        handler = logging.StreamHandler(sys.stderr)
+        if os.environ.get('V0_LOG_FORMAT', '').lower() == 'json':
+            handler.setFormatter(JsonLogFormatter())
+        else:
+            handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+        root.setLevel(os.environ.get('V0_LOG_LEVEL', 'INFO').upper())
+        root.propagate = False
+    return root.getChild(name)
+
+class Histogram:
+    """Fixed-bucket histogram compatible with the Prometheus exposition format"""
+    
+    __slots__ = ('buckets', 'bucket_counts', 'count', 'sum', 'max')
+    
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        # One extra slot for the +Inf bucket
+        self.bucket_counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+    
+    def observe(self, value):
+        """Record a single observation"""
+        self.bucket_counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+    
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside the matching bucket"""
+        if self.count == 0:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        lower = 0.0
+        for i, bucket_count in enumerate(self.bucket_counts):
+            upper = self.buckets[i] if i < len(self.buckets) else self.max
+            if cumulative + bucket_count >= rank and bucket_count > 0:
+                fraction = (rank - cumulative) / bucket_count
+                return min(lower + (upper - lower) * fraction, self.max)
+            cumulative += bucket_count
+            lower = upper
+        return self.max
+    
+    def to_dict(self):
+        """Serialize histogram state"""
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'max': self.max,
+            'p50': self.quantile(0.5),
+            'p95': self.quantile(0.95),
+            'p99': self.quantile(0.99),
+            'buckets': dict(zip([str(b) for b in self.buckets] + ['+Inf'], self.bucket_counts)),
+        }
+
+class _NullTimer:
+    """Shared no-op context manager returned while metrics are disabled"""
+    
+    __slots__ = ()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _StageTimer:
+    """Context manager that records elapsed wall time into a histogram"""
+    
+    __slots__ = ('registry', 'key', 'start')
+    
+    def __init__(self, registry, key):
+        self.registry = registry
+        self.key = key
+        self.start = 0.0
+    
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.registry._observe(self.key, time.perf_counter() - self.start)
+        return False
+
+def _label_key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+def _format_labels(labels, extra=None):
+    items = list(labels) + (list(extra.items()) if extra else [])
+    if not items:
+        return ''
+    escaped = [
+        '{}="{}"'.format(k, str(v).replace('\\', '\\\\').replace('"', '\\"'))
+        for k, v in items
+    ]
+    return '{' + ','.join(escaped) + '}'
+
+class MetricsRegistry:
+    """Process-wide store of stage timers, histograms and counters
+    
+    When disabled every call returns immediately (``timer`` hands back a shared
+    no-op context manager), so call sites can stay in hot paths permanently.
+    """
+    
+    def __init__(self, enabled=False, namespace='v0'):
+        self.enabled = enabled
+        self.namespace = namespace
+        self.histograms = {}
+        self.counters = Counter()
+        self.gauges = {}
+        self._lock = threading.Lock()
+    
+    def enable(self):
+        self.enabled = True
+    
+    def disable(self):
+        self.enabled = False
+    
+    def reset(self):
+        """Drop all recorded values"""
+        with self._lock:
+            self.histograms.clear()
+            self.counters.clear()
+            self.gauges.clear()
+    
+    def timer(self, stage, **labels):
+        """Time a block: ``with metrics.timer('encode'): ...``"""
+        if not self.enabled:
+            return _NULL_TIMER
+        labels['stage'] = stage
+        return _StageTimer(self, _label_key('stage_duration_seconds', labels))
+    
+    def timed(self, stage, **labels):
+        """Decorator form of :meth:`timer`"""
+        def decorator(func):
+            def wrapper(*args, **kwargs):
+                with self.timer(stage, **labels):
+                    return func(*args, **kwargs)
+            wrapper.__name__ = func.__name__
+            wrapper.__doc__ = func.__doc__
+            return wrapper
+        return decorator
+    
+    def observe(self, name, value, **labels):
+        """Record a value into a named histogram"""
+        if self.enabled:
+            self._observe(_label_key(name, labels), value)
+    
+    def _observe(self, key, value):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram()
+            histogram.observe(value)
+    
+    def increment(self, name, amount=1, **labels):
+        """Increase a monotonically growing counter"""
+        if self.enabled:
+            with self._lock:
+                self.counters[_label_key(name, labels)] += amount
+    
+    def set_gauge(self, name, value, **labels):
+        """Set a point-in-time value"""
+        if self.enabled:
+            with self._lock:
+                self.gauges[_label_key(name, labels)] = value
+    
+    def snapshot(self):
+        """Return all metrics as a JSON-serializable dict"""
+        with self._lock:
+            def entries(store, render):
+                return [
+                    {'name': name, 'labels': dict(labels), **render(value)}
+                    for (name, labels), value in sorted(store.items())
+                ]
+            return {
+                'timestamp': time.time(),
+                'pid': os.getpid(),
+                'histograms': entries(self.histograms, lambda h: h.to_dict()),
+                'counters': entries(self.counters, lambda v: {'value': v}),
+                'gauges': entries(self.gauges, lambda v: {'value': v}),
+            }
+    
+    def to_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            seen = set()
+            for (name, labels), value in sorted(self.counters.items()):
+                metric = f'{self.namespace}_{name}_total'
+                if metric not in seen:
+                    lines.append(f'# TYPE {metric} counter')
+                    seen.add(metric)
+                lines.append(f'{metric}{_format_labels(labels)} {value}')
+            for (name, labels), value in sorted(self.gauges.items()):
+                metric = f'{self.namespace}_{name}'
+                if metric not in seen:
+                    lines.append(f'# TYPE {metric} gauge')
+                    seen.add(metric)
+                lines.append(f'{metric}{_format_labels(labels)} {value}')
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                metric = f'{self.namespace}_{name}'
+                if metric not in seen:
+                    lines.append(f'# TYPE {metric} histogram')
+                    seen.add(metric)
+                cumulative = 0
+                for bound, bucket_count in zip(histogram.buckets, histogram.bucket_counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric}_bucket{_format_labels(labels, {"le": bound})} {cumulative}')
+                lines.append(f'{metric}_bucket{_format_labels(labels, {"le": "+Inf"})} {histogram.count}')
+                lines.append(f'{metric}_sum{_format_labels(labels)} {histogram.sum}')
+                lines.append(f'{metric}_count{_format_labels(labels)} {histogram.count}')
+        return '\n'.join(lines) + '\n'
+    
+    def export(self, path):
+        """Write a snapshot; ``.prom``/``.txt`` selects Prometheus text, anything else JSON"""
+        if path.endswith(('.prom', '.txt')):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2)
+        _atomic_write(path, content)
+        return path
+    
+    def summary_lines(self):
+        """Human-readable one-line-per-stage latency summary"""
+        lines = []
+        with self._lock:
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                label_text = ','.join(f'{k}={v}' for k, v in labels)
+                lines.append(
+                    f'{name}[{label_text}] n={histogram.count} '
+                    f'mean={histogram.sum / max(histogram.count, 1) * 1000:.3f}ms '
+                    f'p95={histogram.quantile(0.95) * 1000:.3f}ms '
+                    f'max={histogram.max * 1000:.3f}ms'
+                )
+        return lines
+
+def _atomic_write(path, content):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f'{path}.tmp.{os.getpid()}'
+    with open(tmp_path, 'w') as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+class SamplingProfiler:
+    """Wall-clock sampling profiler based on ``sys._current_frames``
+    
+    A daemon thread snapshots every other thread's stack at a fixed interval
+    and aggregates the samples as collapsed stacks ("a;b;c count"), the input
+    format of flamegraph.pl and speedscope.
+    """
+    
+    def __init__(self, interval=0.005, max_depth=64):
+        self.interval = interval
+        self.max_depth = max_depth
+        self.samples = Counter()
+        self.sample_count = 0
+        self._stop = threading.Event()
+        self._thread = None
+    
+    def start(self):
+        if self._thread is not None:
+            return self
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='v0-sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+    
+    def stop(self):
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        return self
+    
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                    frame = frame.f_back
+                self.samples[';'.join(reversed(stack))] += 1
+            self.sample_count += 1
+    
+    def collapsed(self):
+        """Return samples as collapsed-stack text"""
+        return ''.join(f'{stack} {count}\n' for stack, count in self.samples.most_common())
+    
+    def write(self, path):
+        _atomic_write(path, self.collapsed())
+        return path
+
+# Shared registry used by all pipeline scripts
+metrics = MetricsRegistry(enabled=bool(os.environ.get('V0_METRICS') or os.environ.get('V0_METRICS_OUT')))
+
+class PeakMemory:
+    """Context manager that measures peak traced allocation (Python and NumPy) with tracemalloc
+    
+    After exit ``peak`` holds the high-water mark in bytes above the level at
+    entry; it is also recorded as the ``peak_memory_bytes`` gauge. Tracing slows
+    allocation-heavy code, so wrap whole stages rather than hot loops.
+    """
+    
+    def __init__(self, stage, **labels):
+        self.stage = stage
+        self.labels = labels
+        self.peak = 0
+        self._baseline = 0
+        self._started = False
+    
+    def __enter__(self):
+        self._started = not tracemalloc.is_tracing()
+        if self._started:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self._baseline = tracemalloc.get_traced_memory()[0]
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.peak = tracemalloc.get_traced_memory()[1] - self._baseline
+        if self._started:
+            tracemalloc.stop()
+        metrics.set_gauge('peak_memory_bytes', self.peak, stage=self.stage, **self.labels)
+        return False
+
+def setup_instrumentation(metrics_out=None, profile_out=None, profile_interval=None):
+    """Enable metrics/profiling and register exporters that run at interpreter exit
+    
+    Arguments fall back to V0_METRICS_OUT, V0_PROFILE_OUT and V0_PROFILE_INTERVAL.
+    Returns the started profiler, or None when profiling is off.
+    """
+    logger = get_logger('instrumentation')
+    metrics_out = metrics_out or os.environ.get('V0_METRICS_OUT')
+    profile_out = profile_out or os.environ.get('V0_PROFILE_OUT')
+    profiler = None
+    
+    if metrics_out:
+        metrics.enable()
+        
+        def export_metrics():
+            metrics.export(metrics_out)
+            logger.info(f"Metrics snapshot written to {metrics_out}")
+        atexit.register(export_metrics)
+    
+    if profile_out:
+        interval = float(profile_interval or os.environ.get('V0_PROFILE_INTERVAL', 0.005))
+        profiler = SamplingProfiler(interval=interval).start()
+        
+        def export_profile():
+            profiler.stop().write(profile_out)
+            logger.info(f"Profile ({profiler.sample_count} samples) written to {profile_out}")
+        atexit.register(export_profile)
+    
+    return profiler
@@ -0,0 +1,373 @@
+"""
+Open-loop load generator for the prediction service
+Drives a local DropoutPredictor or a running server at fixed arrival rates and reports latency percentiles and saturation
+"""
+
+import argparse
+import http.client
+import json
+import os
+import platform
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+import numpy as np
+from instrumentation import get_logger
+
+logger = get_logger('load_test')
+
+DEFAULT_OUTPUT_PATH = 'results/load_test.json'
+PERCENTILES = (50, 95, 99, 99.9)
+
+def synthetic_students(n_students=2000):
+    """Feature dicts from the training data generator (nothing is written to disk)"""
+    from data_preprocessing import DataPreprocessor
+    
+    df = DataPreprocessor().generate_synthetic_data(n_students, filepath=None)
+    return df.drop(columns=['dropout']).to_dict('records')
+
+class LocalTarget:
+    """Calls a DropoutPredictor in-process from the load generator's threads"""
+    
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.name = 'local'
+    
+    def single(self, student):
+        self.predictor.predict(student)
+    
+    def batch(self, students):
+        self.predictor.batch_predict(students)
+    
+    def describe(self):
+        return {'target': 'local', 'model_version': self.predictor.model_version}
+
+class HttpTarget:
+    """POSTs to a running ``serve.py``; one keep-alive connection per generator thread"""
+    
+    def __init__(self, url):
+        parsed = urlparse(url)
+        self.host, self.port = parsed.hostname, parsed.port or 80
+        self.name = url
+        self._local = threading.local()
+    
+    def _request(self, method, path, payload=None):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._local.conn = http.client.HTTPConnection(self.host, self.port, timeout=60)
+        body = json.dumps(payload, default=str).encode() if payload is not None else None
+        try:
+            conn.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = conn.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            # Drop the broken connection so the next request reconnects
+            conn.close()
+            self._local.conn = None
+            raise
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}: {data[:200]!r}")
+        return json.loads(data)
+    
+    def single(self, student):
+        self._request('POST', '/predict', student)
+    
+    def batch(self, students):
+        self._request('POST', '/predict', {'students': students})
+    
+    def describe(self):
+        health = self._request('GET', '/health')
+        return {'target': self.name, 'model_version': health.get('active_version')}
+
+def latency_summary(latencies):
+    """Percentiles in milliseconds"""
+    if not len(latencies):
+        return None
+    values = np.percentile(np.asarray(latencies) * 1000, PERCENTILES)
+    summary = {f'p{str(p).replace(".", "_")}': float(v) for p, v in zip(PERCENTILES, values)}
+    summary['mean'] = float(np.mean(latencies) * 1000)
+    summary['max'] = float(np.max(latencies) * 1000)
+    return summary
+
+class LoadGenerator:
+    """Open-loop load: arrivals follow a Poisson schedule regardless of how fast the target answers
+    
+    Latency is measured from each request's scheduled arrival, so time spent
+    queued behind a saturated target is counted rather than hidden (no
+    coordinated omission). A share ``batch_fraction`` of requests carries
+    ``batch_size`` students; the rest score one.
+    """
+    
+    def __init__(self, target, students, batch_fraction=0.1, batch_size=50, max_in_flight=64, seed=42):
+        self.target = target
+        self.students = students
+        self.batch_fraction = batch_fraction
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.rng = np.random.default_rng(seed)
+    
+    def _schedule(self, rate, duration):
+        """(arrival offsets, payloads) for one step, built before the clock starts"""
+        gaps = self.rng.exponential(1.0 / rate, size=int(rate * duration * 1.2) + 16)
+        arrivals = np.cumsum(gaps)
+        arrivals = arrivals[arrivals < duration]
+        is_batch = self.rng.random(len(arrivals)) < self.batch_fraction
+        payloads = [
+            ('batch', [self.students[i] for i in self.rng.integers(len(self.students), size=self.batch_size)])
+            if batch else ('single', self.students[self.rng.integers(len(self.students))])
+            for batch in is_batch
+        ]
+        return arrivals, payloads
+    
+    def _send(self, kind, payload, scheduled):
+        try:
+            if kind == 'batch':
+                self.target.batch(payload)
+            else:
+                self.target.single(payload)
+            ok = True
+        except Exception as e:
+            logger.debug(f"Request failed: {e}")
+            ok = False
+        finished = time.perf_counter()
+        return kind, finished - scheduled, ok, finished
+    
+    def run_step(self, rate, duration, drain_timeout=None):
+        """Offer ``rate`` requests/s for ``duration`` seconds; returns the step report"""
+        arrivals, payloads = self._schedule(rate, duration)
+        drain_timeout = duration if drain_timeout is None else drain_timeout
+        futures = []
+        lag = 0.0
+        
+        executor = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='v0-load')
+        start = time.perf_counter()
+        for offset, (kind, payload) in zip(arrivals, payloads):
+            scheduled = start + offset
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+            futures.append(executor.submit(self._send, kind, payload, scheduled))
+        
+        _, not_done = wait(futures, timeout=drain_timeout)
+        for future in not_done:
+            future.cancel()
+        executor.shutdown(wait=True, cancel_futures=True)
+        
+        outcomes = [future.result() for future in futures if future.done() and not future.cancelled()]
+        end = max([outcome[3] for outcome in outcomes], default=time.perf_counter())
+        elapsed = max(end - start, duration)
+        ok = [outcome for outcome in outcomes if outcome[2]]
+        students = sum(self.batch_size if kind == 'batch' else 1 for kind, _, _, _ in ok)
+        
+        report = {
+            'offered_rps': rate,
+            'requests': len(arrivals),
+            'completed': len(ok),
+            'errors': len(outcomes) - len(ok),
+            'timeouts': len(arrivals) - len(outcomes),
+            'achieved_rps': len(ok) / elapsed,
+            'students_per_s': students / elapsed,
+            'generator_lag_ms': lag * 1000,
+            'latency_ms': {'all': latency_summary([outcome[1] for outcome in ok])}
+        }
+        for kind in ('single', 'batch'):
+            latencies = [latency for k, latency, _, _ in ok if k == kind]
+            if latencies:
+                report['latency_ms'][kind] = latency_summary(latencies)
+        return report
+
+def meets_slo(step, slo_p99_ms, max_error_rate=0.01, min_throughput_ratio=0.95):
+    """Whether a step kept up with its offered rate within the latency SLO"""
+    latency = step['latency_ms']['all']
+    failed = step['errors'] + step['timeouts']
+    return (
+        latency is not None
+        and latency['p99'] <= slo_p99_ms
+        and failed <= max_error_rate * step['requests']
+        and step['achieved_rps'] >= min_throughput_ratio * step['offered_rps']
+    )
+
+def run_logged_step(generator, rate, duration, slo_p99_ms):
+    step = generator.run_step(rate, duration)
+    step['meets_slo'] = meets_slo(step, slo_p99_ms)
+    latency = step['latency_ms']['all'] or {}
+    logger.info(
+        f"{rate:>9.1f} req/s offered -> {step['achieved_rps']:8.1f} req/s, "
+        f"{step['students_per_s']:9.1f} students/s | p50 {latency.get('p50', float('nan')):8.2f} "
+        f"p95 {latency.get('p95', float('nan')):8.2f} p99 {latency.get('p99', float('nan')):8.2f} "
+        f"p99.9 {latency.get('p99_9', float('nan')):8.2f} ms | errors {step['errors'] + step['timeouts']}"
+        f"{'' if step['meets_slo'] else '  (SLO missed)'}"
+    )
+    return step
+
+def find_saturation(generator, rates, duration, slo_p99_ms, refine_steps=2):
+    """Step through increasing rates until the SLO breaks, then bisect between the last good and first bad rate
+    
+    Returns (steps, saturation) where saturation describes the highest
+    offered rate that met the SLO, or None if even the first rate failed.
+    """
+    steps = []
+    last_good, first_bad = None, None
+    for rate in rates:
+        step = run_logged_step(generator, rate, duration, slo_p99_ms)
+        steps.append(step)
+        if step['meets_slo']:
+            last_good = step
+        else:
+            first_bad = step
+            break
+    
+    if last_good is not None and first_bad is not None:
+        low, high = last_good['offered_rps'], first_bad['offered_rps']
+        for _ in range(refine_steps):
+            step = run_logged_step(generator, round((low + high) / 2, 2), duration, slo_p99_ms)
+            steps.append(step)
+            if step['meets_slo']:
+                last_good, low = step, step['offered_rps']
+            else:
+                high = step['offered_rps']
+    
+    steps.sort(key=lambda step: step['offered_rps'])
+    if last_good is None:
+        return steps, None
+    return steps, {
+        'offered_rps': last_good['offered_rps'],
+        'achieved_rps': last_good['achieved_rps'],
+        'students_per_s': last_good['students_per_s'],
+        'p99_ms': last_good['latency_ms']['all']['p99'],
+        'bounded_by': None if first_bad is None else 'slo'
+    }
+
+def environment():
+    """What a comparison across releases needs to know about this run"""
+    import sklearn
+    
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'sklearn': sklearn.__version__,
+        'platform': platform.platform(),
+        'cpus': len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count()
+    }
+
+def compare_reports(baseline, report):
+    """Lines comparing saturation and per-rate p99 with a previous report"""
+    lines = []
+    old, new = baseline.get('saturation'), report.get('saturation')
+    if old and new:
+        change = (new['achieved_rps'] - old['achieved_rps']) / old['achieved_rps'] * 100
+        lines.append(f"Saturation: {old['achieved_rps']:.1f} -> {new['achieved_rps']:.1f} req/s ({change:+.1f}%) "
+                     f"[model {baseline['target'].get('model_version')} -> {report['target'].get('model_version')}]")
+    old_steps = {step['offered_rps']: step for step in baseline.get('steps', [])}
+    for step in report['steps']:
+        previous = old_steps.get(step['offered_rps'])
+        if previous and previous['latency_ms']['all'] and step['latency_ms']['all']:
+            lines.append(f"  {step['offered_rps']:>9.1f} req/s p99: {previous['latency_ms']['all']['p99']:.2f} -> "
+                         f"{step['latency_ms']['all']['p99']:.2f} ms")
+    return lines
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Open-loop load test with latency SLO and saturation search")
+    parser.add_argument('--url', default=None,
+                        help="Server to drive (e.g. http://127.0.0.1:8000); default scores a local DropoutPredictor")
+    parser.add_argument('--rates', default=None,
+                        help="Comma-separated request rates to step through (default: geometric ramp)")
+    parser.add_argument('--start-rate', type=float, default=10.0)
+    parser.add_argument('--growth', type=float, default=2.0, help="Ramp multiplier between steps")
+    parser.add_argument('--max-rate', type=float, default=5000.0)
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per rate step")
+    parser.add_argument('--batch-fraction', type=float, default=0.1, help="Share of requests that are batches")
+    parser.add_argument('--batch-size', type=int, default=50, help="Students per batch request")
+    parser.add_argument('--max-in-flight', type=int, default=64, help="Concurrent requests the generator may hold")
+    parser.add_argument('--slo-p99-ms', type=float, default=100.0, help="p99 latency a step must stay under")
+    parser.add_argument('--refine-steps', type=int, default=2,
+                        help="Bisection steps between the last passing and first failing rate")
+    parser.add_argument('--students', type=int, default=2000, help="Synthetic students to draw requests from")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default=DEFAULT_OUTPUT_PATH, help="JSON report path")
+    parser.add_argument('--baseline', default=None, help="Previous JSON report to compare against")
+    args = parser.parse_args(argv)
+    if not 0 <= args.batch_fraction <= 1:
+        parser.error("--batch-fraction must be between 0 and 1")
+    if args.rates:
+        args.rate_steps = sorted(float(rate) for rate in args.rates.split(',') if rate.strip())
+    else:
+        args.rate_steps = []
+        rate = args.start_rate
+        while rate <= args.max_rate:
+            args.rate_steps.append(round(rate, 2))
+            rate *= args.growth
+    if not args.rate_steps or min(args.rate_steps) <= 0:
+        parser.error("rates must be positive")
+    return args
+
+def main():
+    """Run the saturation search and write the report"""
+    args = parse_args()
+    
+    if args.url:
+        target = HttpTarget(args.url)
+    else:
+        from concurrency import ConcurrencyConfig
+        from predict import DropoutPredictor
+        
+        target = LocalTarget(DropoutPredictor(concurrency=ConcurrencyConfig().apply()))
+    try:
+        target_info = target.describe()
+    except Exception as e:
+        logger.error(f"Target {target.name} is not reachable: {e}")
+        sys.exit(1)
+    
+    students = synthetic_students(args.students)
+    generator = LoadGenerator(target, students, args.batch_fraction, args.batch_size, args.max_in_flight, args.seed)
+    
+    # Warm caches and connections outside the measured steps
+    for student in students[:20]:
+        target.single(student)
+    
+    logger.info(f"Load testing {target.name}: {args.batch_fraction:.0%} batches of {args.batch_size}, "
+                f"{args.duration:g}s per step, p99 SLO {args.slo_p99_ms:g} ms")
+    steps, saturation = find_saturation(generator, args.rate_steps, args.duration, args.slo_p99_ms, args.refine_steps)
+    
+    report = {
+        'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'target': target_info,
+        'environment': environment(),
+        'config': {
+            'batch_fraction': args.batch_fraction,
+            'batch_size': args.batch_size,
+            'duration_s': args.duration,
+            'max_in_flight': args.max_in_flight,
+            'slo_p99_ms': args.slo_p99_ms,
+            'seed': args.seed
+        },
+        'steps': steps,
+        'saturation': saturation
+    }
+    
+    if saturation is None:
+        logger.warning(f"Even {args.rate_steps[0]:g} req/s missed the SLO")
+    else:
+        bound = 'SLO' if saturation['bounded_by'] else 'highest rate tested, SLO never missed'
+        logger.info(f"Saturation ({bound}): {saturation['achieved_rps']:.1f} req/s, "
+                    f"{saturation['students_per_s']:.1f} students/s at p99 {saturation['p99_ms']:.2f} ms")
+    
+    directory = os.path.dirname(args.out)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    logger.info(f"Report saved to {args.out}")
+    
+    if args.baseline:
+        with open(args.baseline) as f:
+            for line in compare_reports(json.load(f), report):
+                logger.info(line)
+
+if __name__ == "__main__":
+    main()
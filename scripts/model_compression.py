@@ -0,0 +1,518 @@
+"""
+Post-training model compression
+Builds pruned, depth-capped and quantized variants of the trained model and keeps those close to the original
+"""
+
+import os
+import pickle
+import re
+import time
+import warnings
+import joblib
+import numpy as np
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.metrics import roc_auc_score
+from sklearn.svm import SVC
+from instrumentation import get_logger, metrics
+from predict import risk_levels
+
+logger = get_logger('model_compression')
+
+DEFAULT_AUC_TOLERANCE = 0.005
+# Serving buckets risk levels on absolute probabilities, so ranking quality (AUC) alone is not enough
+DEFAULT_MAX_PROBABILITY_DRIFT = 0.05
+DEFAULT_MIN_RISK_AGREEMENT = 0.99
+DEFAULT_COMPRESSED_DIR = 'models/compressed'
+DEFAULT_REPORT_PATH = 'models/compression_report.json'
+
+# Variant grids: share of trees / boosting rounds / support vectors kept, and depth caps
+TREE_FRACTIONS = (1.0, 0.5, 0.25)
+DEPTH_CAPS = (None, 12, 8, 6)
+ROUND_FRACTIONS = (1.0, 0.75, 0.5)
+SUPPORT_VECTOR_FRACTIONS = (0.5, 0.25)
+
+# Training rows used to rank trees; ranking is O(trees^2 * rows)
+RANKING_ROWS = 5000
+# Bounds the (rows, trees) node index matrix walked per step
+WALK_ELEMENTS = 1 << 20
+# libsvm never returns pairwise probabilities closer than this to 0 or 1
+PLATT_MIN_PROBABILITY = 1e-7
+
+def _model_input(model, X):
+    """``X`` as ``model`` was fitted on: a DataFrame with its training columns when it recorded them"""
+    columns = getattr(model, 'feature_names_in_', None)
+    return X if columns is None else pd.DataFrame(X, columns=columns)
+
+def _float32_at_most(threshold):
+    """Largest float32 <= threshold, so ``x32 > t32`` decides exactly like ``x32 > t64``"""
+    t32 = threshold.astype(np.float32)
+    return np.where(t32 > threshold, np.nextafter(t32, np.float32(-np.inf)), t32)
+
+def _breadth_first(roots, left, right, leaf):
+    """(old node ids in new order, new id of each kept node's first child)
+    
+    Trees are renumbered level by level so every internal node's two
+    children are adjacent; unreachable nodes are dropped.
+    """
+    order = [roots]
+    first_child = np.full(len(leaf), -1, dtype=np.int64)
+    level, next_id = roots, len(roots)
+    while len(level):
+        internal = level[~leaf[level]]
+        children = np.empty(2 * len(internal), dtype=np.int64)
+        children[0::2], children[1::2] = left[internal], right[internal]
+        first_child[internal] = next_id + 2 * np.arange(len(internal))
+        next_id += len(children)
+        order.append(children)
+        level = children
+    order = np.concatenate(order)
+    return order, first_child[order]
+
+class CompactTrees:
+    """Tree ensemble flattened into one node table with 16-bit feature ids and leaf values
+    
+    Thresholds are float32 (the precision sklearn and XGBoost compare
+    features at) and leaf values are int16 codes on a linear scale. Nodes are
+    laid out breadth-first with each node's children adjacent, and leaves
+    point to themselves, so one level of every tree is walked for a block of
+    rows with four vectorized gathers instead of a Python call per tree.
+    ``aggregate`` is ``'mean'`` for forests (averaged class-1 probabilities)
+    or ``'margin'`` for boosted trees (summed log-odds plus ``offset``).
+    Inputs are expected to be complete; NaN features go left.
+    """
+    
+    def __init__(self, roots, feature, threshold, left, right, leaf, leaf_value, aggregate, offset=0.0,
+                 classes=(0, 1)):
+        order, first_child = _breadth_first(np.asarray(roots), left, right, leaf)
+        leaf, leaf_value = leaf[order], leaf_value[order]
+        nodes = np.arange(len(order))
+        
+        low, high = float(leaf_value[leaf].min()), float(leaf_value[leaf].max())
+        self.leaf_scale = (high - low) / 65535 or 1.0
+        self.leaf_zero = low
+        codes = np.round((leaf_value - low) / self.leaf_scale) - 32768
+        self.leaf_code = np.where(leaf, codes, 0).astype(np.int16)
+        
+        self.n_trees = len(roots)
+        self.feature = np.where(leaf, 0, feature[order]).astype(np.int16)
+        self.threshold = np.where(leaf, np.float32(np.inf), _float32_at_most(threshold[order])).astype(np.float32)
+        # x > threshold adds one, stepping to the right child; leaves step to themselves
+        self.child = np.where(leaf, nodes, first_child).astype(np.intp)
+        self.depth = self._depth(leaf)
+        self.aggregate = aggregate
+        self.offset = offset
+        self.classes_ = np.asarray(classes)
+    
+    def _depth(self, leaf):
+        """Levels in the deepest tree (roots are the first ``n_trees`` nodes)"""
+        level = np.flatnonzero(~leaf[:self.n_trees])
+        depth = 0
+        while len(level):
+            depth += 1
+            children = np.concatenate([self.child[level], self.child[level] + 1])
+            level = children[~leaf[children]]
+        return depth
+    
+    @classmethod
+    def from_forest(cls, forest, trees=None, max_depth=None):
+        """From a fitted RandomForestClassifier; ``trees`` selects estimators and ``max_depth`` caps depth"""
+        estimators = [forest.estimators_[i] for i in (range(len(forest.estimators_)) if trees is None else trees)]
+        parts = {name: [] for name in ('feature', 'threshold', 'left', 'right', 'leaf', 'value')}
+        roots = []
+        offset = 0
+        for estimator in estimators:
+            tree = estimator.tree_
+            leaf = tree.children_left < 0
+            if max_depth is not None:
+                # Node depths, one level at a time; nodes at the cap become leaves holding their training value
+                depth = np.zeros(tree.node_count, dtype=np.int64)
+                level = np.array([0])
+                while len(level):
+                    level = level[tree.children_left[level] >= 0]
+                    children = np.concatenate([tree.children_left[level], tree.children_right[level]])
+                    depth[children] = np.tile(depth[level], 2) + 1
+                    level = children
+                leaf = leaf | (depth >= max_depth)
+            value = tree.value[:, 0, :]
+            
+            roots.append(offset)
+            parts['feature'].append(tree.feature)
+            parts['threshold'].append(tree.threshold)
+            parts['left'].append(tree.children_left + offset)
+            parts['right'].append(tree.children_right + offset)
+            parts['leaf'].append(leaf)
+            parts['value'].append(value[:, 1] / value.sum(axis=1))
+            offset += tree.node_count
+        
+        arrays = {name: np.concatenate(values) for name, values in parts.items()}
+        return cls(np.array(roots), arrays['feature'], arrays['threshold'], arrays['left'], arrays['right'],
+                   arrays['leaf'], arrays['value'], 'mean', classes=forest.classes_)
+    
+    @classmethod
+    def from_booster(cls, model, X_reference, n_trees=None):
+        """From a fitted binary XGBClassifier, keeping the first ``n_trees`` boosting rounds
+        
+        The base margin is read back from the booster's own output on
+        ``X_reference`` rather than parsed from its configuration.
+        """
+        booster = model.get_booster()
+        nodes = booster.trees_to_dataframe()
+        if n_trees is not None:
+            nodes = nodes[nodes['Tree'] < n_trees].reset_index(drop=True)
+        feature_names = booster.feature_names or [f'f{i}' for i in range(booster.num_features())]
+        
+        index = pd.MultiIndex.from_arrays([nodes['Tree'], nodes['Node']])
+        leaf = (nodes['Feature'] == 'Leaf').to_numpy()
+        
+        def child(column):
+            targets = nodes[column].fillna('0-0').str.split('-', expand=True).astype(int)
+            return index.get_indexer(pd.MultiIndex.from_arrays([targets[0], targets[1]]))
+        
+        feature = nodes['Feature'].map({name: i for i, name in enumerate(feature_names)}).fillna(0).to_numpy(int)
+        split = nodes['Split'].fillna(np.inf).to_numpy(np.float32)
+        # XGBoost sends x < split left, i.e. right when x > the next float32 below split
+        threshold = np.nextafter(split, np.float32(-np.inf)).astype(np.float64)
+        roots = np.flatnonzero(nodes['Node'].to_numpy() == 0)
+        compact = cls(roots, feature, threshold, child('Yes'), child('No'), leaf,
+                      nodes['Gain'].to_numpy(np.float64), 'margin', classes=model.classes_)
+        
+        X_reference = np.asarray(X_reference, dtype=np.float32)[:64]
+        full = booster.predict(_dmatrix(X_reference, feature_names), output_margin=True,
+                               iteration_range=(0, n_trees or 0))
+        compact.offset = float(np.median(full - compact._raw(X_reference)))
+        return compact
+    
+    def __len__(self):
+        return self.n_trees
+    
+    def _raw(self, X):
+        """Mean leaf value ('mean') or summed leaf values ('margin') per row"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_rows, n_features = X.shape
+        out = np.empty(n_rows)
+        block = max(1, WALK_ELEMENTS // self.n_trees)
+        for start in range(0, n_rows, block):
+            values = X[start:start + block]
+            # Each row's features start at row * n_features in the flattened block
+            row_offsets = (np.arange(len(values)) * n_features)[:, None]
+            values = values.ravel()
+            nodes = np.tile(np.arange(self.n_trees), (len(row_offsets), 1))
+            for _ in range(self.depth):
+                goes_right = values[row_offsets + self.feature[nodes]] > self.threshold[nodes]
+                nodes = self.child[nodes] + goes_right
+            leaves = (self.leaf_code[nodes] + 32768.0) * self.leaf_scale + self.leaf_zero
+            out[start:start + block] = leaves.mean(axis=1) if self.aggregate == 'mean' else leaves.sum(axis=1)
+        return out
+    
+    def predict_proba(self, X):
+        raw = self._raw(X)
+        positive = raw if self.aggregate == 'mean' else 1.0 / (1.0 + np.exp(-(raw + self.offset)))
+        return np.column_stack([1.0 - positive, positive])
+    
+    def predict(self, X):
+        return self.classes_[(self.predict_proba(X)[:, 1] > 0.5).astype(int)]
+
+def _platt(decision, prob_a, prob_b):
+    """libsvm's sigmoid, clipped like its pairwise probabilities"""
+    with np.errstate(over='ignore'):
+        probability = 1.0 / (1.0 + np.exp(decision * prob_a + prob_b))
+    return np.clip(probability, PLATT_MIN_PROBABILITY, 1 - PLATT_MIN_PROBABILITY)
+
+class ReducedSVC:
+    """Binary SVC decision function over a subset of its support vectors, keeping the original Platt calibration
+    
+    Support vectors are stored as float32. A linear kernel collapses exactly
+    into one weight vector, so no support vectors are kept at all. After
+    pruning, the kept vectors' coefficients and the intercept are refit by
+    least squares to the original decision values on the reference rows.
+    """
+    
+    def __init__(self, model, support_vectors, dual_coef):
+        self.kernel = model.kernel
+        self.gamma = float(model._gamma)
+        self.degree = model.degree
+        self.coef0 = model.coef0
+        self.support_vectors = np.asarray(support_vectors, dtype=np.float32)
+        self.squared_norms = (self.support_vectors.astype(np.float64) ** 2).sum(axis=1)
+        self.dual_coef = np.asarray(dual_coef, dtype=np.float64)
+        self.intercept = float(model.intercept_[0])
+        with warnings.catch_warnings():
+            # Deprecated along with SVC(probability=True) in sklearn 1.9, but still the model's calibration
+            warnings.simplefilter('ignore', FutureWarning)
+            self.prob_a = float(model.probA_[0])
+            self.prob_b = float(model.probB_[0])
+        self.sign, self.complement = 1.0, False
+        self.classes_ = model.classes_
+    
+    @classmethod
+    def from_svc(cls, model, X_reference, keep=None):
+        """``keep`` indexes ``support_vectors_`` (all when None); a linear kernel without ``keep`` collapses to weights"""
+        if len(model.classes_) != 2 or not model.probability:
+            raise ValueError("Only binary SVCs trained with probability=True can be reduced")
+        X_reference = np.asarray(X_reference, dtype=np.float64)[:RANKING_ROWS]
+        dual = model.dual_coef_[0]
+        if model.kernel == 'linear' and keep is None:
+            reduced = cls(model, (dual @ model.support_vectors_)[None, :], [1.0])
+        else:
+            keep = np.arange(len(dual)) if keep is None else np.asarray(keep)
+            reduced = cls(model, model.support_vectors_[keep], dual[keep])
+        
+        full = model.decision_function(_model_input(model, X_reference))
+        if reduced.kernel == 'linear' and len(reduced.dual_coef) == 1:
+            reduced.intercept += float(np.mean(full - reduced.decision_function(X_reference)))
+        else:
+            # Reduced-set refit: coefficients of the kept vectors that best reproduce the full decision values
+            design = np.column_stack([reduced._kernel(X_reference), np.ones(len(X_reference))])
+            solution = np.linalg.lstsq(design, full, rcond=None)[0]
+            reduced.dual_coef, reduced.intercept = solution[:-1], float(solution[-1])
+        
+        # sklearn's binary probabilities are a Platt sigmoid of the decision value, up to libsvm's
+        # iterative pairwise coupling (~1e-4); find which orientation it uses
+        expected = model.predict_proba(_model_input(model, X_reference))[:, 1]
+        orientations = [(sign, complement) for sign in (1.0, -1.0) for complement in (False, True)]
+        errors = []
+        for sign, complement in orientations:
+            platt = _platt(sign * full, reduced.prob_a, reduced.prob_b)
+            errors.append(np.abs((1.0 - platt if complement else platt) - expected).max())
+        if min(errors) > 1e-2:
+            raise ValueError("Could not reproduce the SVC's probability calibration")
+        reduced.sign, reduced.complement = orientations[int(np.argmin(errors))]
+        return reduced
+    
+    def _kernel(self, X):
+        dot = X @ self.support_vectors.T.astype(np.float64)
+        if self.kernel == 'linear':
+            return dot
+        if self.kernel == 'rbf':
+            distances = (X ** 2).sum(axis=1)[:, None] - 2 * dot + self.squared_norms
+            return np.exp(-self.gamma * np.maximum(distances, 0))
+        if self.kernel == 'poly':
+            return (self.gamma * dot + self.coef0) ** self.degree
+        if self.kernel == 'sigmoid':
+            return np.tanh(self.gamma * dot + self.coef0)
+        raise ValueError(f"Unsupported kernel: {self.kernel}")
+    
+    def decision_function(self, X):
+        return self._kernel(np.asarray(X, dtype=np.float64)) @ self.dual_coef + self.intercept
+    
+    def predict_proba(self, X):
+        platt = _platt(self.sign * self.decision_function(X), self.prob_a, self.prob_b)
+        positive = 1.0 - platt if self.complement else platt
+        return np.column_stack([1.0 - positive, positive])
+    
+    def predict(self, X):
+        # SVC.predict follows the decision value, not the calibrated probability
+        return self.classes_[(self.decision_function(X) > 0).astype(int)]
+
+def _dmatrix(X, feature_names):
+    from xgboost import DMatrix
+    return DMatrix(X, feature_names=feature_names)
+
+def rank_trees(forest, X):
+    """Trees in order of importance to the forest's output
+    
+    Greedy forward selection: each step adds the tree that brings the running
+    sub-forest's mean probability closest to the full forest's on the
+    training rows, so any prefix is a good smaller forest (ties in accuracy
+    go to diverse trees rather than near-duplicates of the consensus).
+    """
+    X = np.asarray(X, dtype=np.float32)[:RANKING_ROWS]
+    per_tree = np.stack([tree.predict_proba(X)[:, 1] for tree in forest.estimators_])
+    target = per_tree.mean(axis=0)
+    
+    remaining = list(range(len(per_tree)))
+    order, running = [], np.zeros(X.shape[0])
+    while remaining:
+        candidates = (running + per_tree[remaining]) / (len(order) + 1)
+        best = remaining[int(np.argmin(((candidates - target) ** 2).sum(axis=1)))]
+        order.append(best)
+        running += per_tree[best]
+        remaining.remove(best)
+    return order
+
+def forest_variants(forest, X_train, y_train):
+    """Compact forests for each kept-tree share and depth cap"""
+    order = rank_trees(forest, X_train)
+    for fraction in TREE_FRACTIONS:
+        n_trees = max(1, int(round(len(order) * fraction)))
+        for max_depth in DEPTH_CAPS:
+            name = f"{n_trees} trees, " + (f"depth <= {max_depth}" if max_depth else "full depth")
+            yield name, lambda n=n_trees, d=max_depth: CompactTrees.from_forest(forest, order[:n], d)
+
+def booster_variants(model, X_train, y_train):
+    """Compact boosters for each kept share of boosting rounds"""
+    n_rounds = model.get_booster().num_boosted_rounds()
+    for fraction in ROUND_FRACTIONS:
+        n_trees = max(1, int(round(n_rounds * fraction)))
+        yield f"{n_trees} rounds", lambda n=n_trees: CompactTrees.from_booster(model, X_train, n)
+
+def svm_variants(model, X_train, y_train):
+    """Exact weight collapse for linear kernels, then the support vectors contributing most to the decision"""
+    if model.kernel == 'linear':
+        yield "linear weights", lambda: ReducedSVC.from_svc(model, X_train)
+    # Contribution: |dual coefficient| times the vector's mean kernel value on training rows
+    reference = np.asarray(X_train, dtype=np.float64)[:RANKING_ROWS]
+    kernel = ReducedSVC(model, model.support_vectors_, model.dual_coef_[0])._kernel(reference)
+    contribution = np.abs(model.dual_coef_[0]) * np.abs(kernel).mean(axis=0)
+    ranked = np.argsort(-contribution, kind='stable')
+    for fraction in SUPPORT_VECTOR_FRACTIONS:
+        keep = ranked[:max(1, int(round(len(ranked) * fraction)))]
+        yield (f"{len(keep)} of {len(ranked)} support vectors",
+               lambda keep=keep: ReducedSVC.from_svc(model, X_train, keep))
+
+def _variant_builder(model):
+    """Variant generator for ``model``, or None when it has no compressed form"""
+    if isinstance(model, RandomForestClassifier):
+        return forest_variants
+    if isinstance(model, SVC):
+        return svm_variants
+    if type(model).__name__ == 'XGBClassifier' and len(model.classes_) == 2:
+        return booster_variants
+    return None
+
+def compressible(model):
+    """Whether :func:`model_variants` has any compression for ``model``"""
+    return _variant_builder(model) is not None
+
+def model_variants(model, X_train, y_train):
+    """(name, build) pairs for the compressions that apply to ``model``"""
+    builder = _variant_builder(model)
+    return iter(()) if builder is None else builder(model, X_train, y_train)
+
+def model_size(model):
+    """Serialized size in bytes"""
+    return len(pickle.dumps(model, protocol=pickle.HIGHEST_PROTOCOL))
+
+def measure_latency(model, X, single_calls=200, batch_rows=10000, repeats=3):
+    """Single-row p50/p99 latency and batch throughput of ``predict_proba``
+    
+    Inputs are built up front in the form the model was fitted on, so
+    DataFrame construction is not timed.
+    """
+    X = np.ascontiguousarray(X, dtype=np.float64)
+    model.predict_proba(_model_input(model, X[:1]))
+    
+    rows = [_model_input(model, X[i % len(X)][None, :]) for i in range(single_calls)]
+    single = []
+    for row in rows:
+        started = time.perf_counter()
+        model.predict_proba(row)
+        single.append(time.perf_counter() - started)
+    
+    batch = _model_input(model, np.resize(X, (batch_rows, X.shape[1])))
+    batch_seconds = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        model.predict_proba(batch)
+        batch_seconds.append(time.perf_counter() - started)
+    
+    single_ms = np.percentile(np.array(single) * 1000, [50, 99])
+    return {
+        'single_p50_ms': float(single_ms[0]),
+        'single_p99_ms': float(single_ms[1]),
+        'batch_rows_per_s': batch_rows / min(batch_seconds)
+    }
+
+class ModelCompressor:
+    """Measures compressed variants against the original and keeps those within tolerance
+    
+    Each variant's test AUC, single-row latency, batch throughput and
+    serialized size are reported next to the original's, with how far its
+    test probabilities move from the original's and how often its risk level
+    agrees. Variants more than ``auc_tolerance`` below the original's AUC,
+    moving any probability by more than ``max_probability_drift`` or agreeing
+    on fewer than ``min_risk_agreement`` of the risk levels are reported but
+    not saved.
+    """
+    
+    def __init__(self, auc_tolerance=DEFAULT_AUC_TOLERANCE, output_dir=DEFAULT_COMPRESSED_DIR,
+                 max_probability_drift=DEFAULT_MAX_PROBABILITY_DRIFT,
+                 min_risk_agreement=DEFAULT_MIN_RISK_AGREEMENT):
+        self.auc_tolerance = auc_tolerance
+        self.output_dir = output_dir
+        self.max_probability_drift = max_probability_drift
+        self.min_risk_agreement = min_risk_agreement
+    
+    def _measure(self, name, model, X_test, y_test):
+        """(report row, test dropout probabilities) for one model"""
+        with metrics.timer('compress_evaluate', variant=name):
+            X_input = _model_input(model, np.asarray(X_test, dtype=np.float64))
+            probabilities = model.predict_proba(X_input)[:, 1]
+            auc = roc_auc_score(y_test, probabilities)
+            return {'variant': name, 'auc_roc': float(auc), 'size_bytes': model_size(model),
+                    **measure_latency(model, X_test)}, probabilities
+    
+    def _rejections(self, row, floor):
+        """Tolerances a variant's row misses"""
+        reasons = []
+        if row['auc_roc'] < floor:
+            reasons.append("AUC")
+        if row['max_probability_drift'] > self.max_probability_drift:
+            reasons.append("probability drift")
+        if row['risk_level_agreement'] < self.min_risk_agreement:
+            reasons.append("risk level agreement")
+        return reasons
+    
+    def run(self, model_name, model, X_train, y_train, X_test, y_test):
+        """Returns (report, {variant name: model}) for the variants within tolerance"""
+        original, original_probabilities = self._measure('original', model, X_test, y_test)
+        original_levels = risk_levels(original_probabilities)
+        floor = original['auc_roc'] - self.auc_tolerance
+        rows, accepted = [original], {}
+        
+        for name, build in model_variants(model, X_train, y_train):
+            try:
+                with metrics.timer('compress_build', variant=name):
+                    variant = build()
+            except Exception as e:
+                logger.warning(f"Could not build {model_name} variant '{name}': {e}")
+                continue
+            row, probabilities = self._measure(name, variant, X_test, y_test)
+            drift = np.abs(probabilities - original_probabilities)
+            row['auc_delta'] = row['auc_roc'] - original['auc_roc']
+            row['max_probability_drift'] = float(drift.max())
+            row['mean_probability_drift'] = float(drift.mean())
+            row['risk_level_agreement'] = float(np.mean(risk_levels(probabilities) == original_levels))
+            row['size_ratio'] = row['size_bytes'] / original['size_bytes']
+            row['speedup_single'] = original['single_p50_ms'] / row['single_p50_ms']
+            row['speedup_batch'] = row['batch_rows_per_s'] / original['batch_rows_per_s']
+            rejections = self._rejections(row, floor)
+            row['accepted'] = not rejections
+            rows.append(row)
+            if row['accepted']:
+                accepted[name] = variant
+            logger.info(
+                f"{model_name} [{name}]: AUC {row['auc_roc']:.4f} ({row['auc_delta']:+.4f}), "
+                f"single {row['single_p50_ms']:.3f} ms ({row['speedup_single']:.1f}x), "
+                f"batch {row['batch_rows_per_s']:,.0f} rows/s ({row['speedup_batch']:.1f}x), "
+                f"max |dp| {row['max_probability_drift']:.4f}, risk levels {row['risk_level_agreement']:.1%}, "
+                f"size {row['size_ratio']:.0%}"
+                + (f"  (outside {' and '.join(rejections)} tolerance)" if rejections else "")
+            )
+        
+        report = {
+            'model': model_name,
+            'auc_tolerance': self.auc_tolerance,
+            'max_probability_drift': self.max_probability_drift,
+            'min_risk_level_agreement': self.min_risk_agreement,
+            'variants': rows,
+            'selected': None
+        }
+        if accepted:
+            # Serving is latency-bound: the fastest single-row variant wins, then the smallest
+            best = min((row for row in rows if row.get('accepted')),
+                       key=lambda row: (row['single_p50_ms'], row['size_bytes']))
+            report['selected'] = best['variant']
+        return report, accepted
+    
+    def save(self, accepted, selected=None):
+        """Write each accepted variant to ``output_dir``; returns the selected variant's path"""
+        os.makedirs(self.output_dir, exist_ok=True)
+        selected_path = None
+        for name, model in accepted.items():
+            path = os.path.join(self.output_dir, re.sub(r'[^a-z0-9]+', '_', name.lower()).strip('_') + '.pkl')
+            joblib.dump(model, path)
+            if name == selected:
+                selected_path = path
+        return selected_path
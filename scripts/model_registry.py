@@ -0,0 +1,323 @@
+"""
+Versioned model registry with zero-downtime hot reload
+Long-running predictors watch the registry, warm and validate new versions in the background and swap atomically
+"""
+
+import json
+import os
+import shutil
+import threading
+import time
+import numpy as np
+from predict import DropoutPredictor, model_file_version
+from instrumentation import get_logger, metrics
+from shadow_scoring import DEFAULT_COMPARISON_PATH
+from similarity_index import DEFAULT_NEIGHBORS
+
+logger = get_logger('model_registry')
+
+DEFAULT_REGISTRY_ROOT = 'models/registry'
+MODEL_FILE = 'final_model.pkl'
+PREPROCESSOR_FILE = 'preprocessor.pkl'
+METADATA_FILE = 'metadata.json'
+
+# Representative students used to warm and validate a candidate model before it takes traffic
+CANARY_STUDENTS = [
+    {
+        'age': 16, 'gender': 'Female', 'attendance_rate': 0.75, 'gpa_semester1': 2.1,
+        'gpa_semester2': 2.3, 'parent_education': 'High School', 'family_income': 'Low',
+        'extracurricular': 1, 'study_hours_weekly': 8, 'absences': 15,
+        'behavioral_issues': 5, 'previous_failures': 1
+    },
+    {
+        'age': 17, 'gender': 'Male', 'attendance_rate': 0.97, 'gpa_semester1': 3.8,
+        'gpa_semester2': 3.9, 'parent_education': 'Master', 'family_income': 'High',
+        'extracurricular': 4, 'study_hours_weekly': 25, 'absences': 1,
+        'behavioral_issues': 0, 'previous_failures': 0
+    },
+    {
+        'age': 15, 'gender': 'Male', 'attendance_rate': 0.88, 'gpa_semester1': 2.9,
+        'gpa_semester2': 2.6, 'parent_education': 'Bachelor', 'family_income': 'Medium',
+        'extracurricular': 2, 'study_hours_weekly': 12, 'absences': 7,
+        'behavioral_issues': 2, 'previous_failures': 0
+    },
+]
+
+def _write_pointer(path, value):
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        f.write(value)
+    os.replace(tmp_path, path)
+
+def _read_pointer(path):
+    try:
+        with open(path) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+class ModelRegistry:
+    """Directory of immutable model versions plus ACTIVE/PREVIOUS pointers
+    
+    Layout::
+        
+        models/registry/<version>/final_model.pkl
+        models/registry/<version>/preprocessor.pkl
+        models/registry/<version>/metadata.json
+        models/registry/ACTIVE      # version serving traffic
+        models/registry/PREVIOUS    # rollback target
+    
+    Versions are the content hash of the model file, so republishing the same
+    model is a no-op. Pointers are swapped with an atomic rename.
+    """
+    
+    def __init__(self, root=DEFAULT_REGISTRY_ROOT):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.active_path = os.path.join(root, 'ACTIVE')
+        self.previous_path = os.path.join(root, 'PREVIOUS')
+    
+    def paths(self, version):
+        """(model_path, preprocessor_path) for a version"""
+        directory = os.path.join(self.root, version)
+        return os.path.join(directory, MODEL_FILE), os.path.join(directory, PREPROCESSOR_FILE)
+    
+    def versions(self):
+        """Published versions, oldest first"""
+        entries = [
+            entry for entry in os.listdir(self.root)
+            if not entry.startswith('.') and os.path.isfile(os.path.join(self.root, entry, MODEL_FILE))
+        ]
+        return sorted(entries, key=lambda v: os.path.getmtime(os.path.join(self.root, v)))
+    
+    def metadata(self, version):
+        try:
+            with open(os.path.join(self.root, version, METADATA_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+    
+    def active_version(self):
+        return _read_pointer(self.active_path)
+    
+    def previous_version(self):
+        return _read_pointer(self.previous_path)
+    
+    def publish(self, model_path='models/final_model.pkl', preprocessor_path='models/preprocessor.pkl',
+                metadata=None, activate=True):
+        """Copy a trained model into a new immutable version directory"""
+        version = model_file_version(model_path)
+        directory = os.path.join(self.root, version)
+        
+        if not os.path.isdir(directory):
+            staging = os.path.join(self.root, f'.staging-{version}-{os.getpid()}')
+            os.makedirs(staging, exist_ok=True)
+            shutil.copy2(model_path, os.path.join(staging, MODEL_FILE))
+            shutil.copy2(preprocessor_path, os.path.join(staging, PREPROCESSOR_FILE))
+            with open(os.path.join(staging, METADATA_FILE), 'w') as f:
+                json.dump({'published_at': time.time(), **(metadata or {})}, f, indent=2)
+            os.replace(staging, directory)
+            logger.info(f"Published model version {version}")
+        else:
+            logger.info(f"Model version {version} already published")
+        
+        if activate:
+            self.activate(version)
+        return version
+    
+    def activate(self, version):
+        """Point ACTIVE at ``version``, remembering the old one for rollback"""
+        if not os.path.isfile(self.paths(version)[0]):
+            raise ValueError(f"Unknown model version: {version}")
+        current = self.active_version()
+        if current == version:
+            return version
+        if current:
+            _write_pointer(self.previous_path, current)
+        _write_pointer(self.active_path, version)
+        logger.info(f"Activated model version {version} (previous: {current})")
+        return version
+    
+    def rollback(self):
+        """Swap ACTIVE and PREVIOUS"""
+        previous = self.previous_version()
+        if not previous:
+            raise ValueError("No previous model version to roll back to")
+        return self.activate(previous)
+    
+    def bootstrap(self, model_path='models/final_model.pkl', preprocessor_path='models/preprocessor.pkl'):
+        """Publish the standalone model files if the registry has no active version yet"""
+        if self.active_version() is None:
+            self.publish(model_path, preprocessor_path, metadata={'source': 'bootstrap'})
+        return self.active_version()
+
+def validate_candidate(predictor, canary_students=CANARY_STUDENTS):
+    """Warm a freshly loaded predictor and sanity-check it on the canary batch
+    
+    Returns (ok, details). Scoring runs through the same vectorized and single-row
+    paths that live traffic uses, so lazily initialized state is built here.
+    """
+    started = time.perf_counter()
+    try:
+        results = predictor.batch_predict(canary_students)
+        predictor.predict(canary_students[0])
+    except Exception as e:
+        return False, {'error': f'canary scoring failed: {e}'}
+    
+    errors = [r['error'] for r in results if 'error' in r]
+    if errors:
+        return False, {'error': f'canary rows failed: {errors}'}
+    
+    probabilities = np.array([r['dropout_probability'] for r in results])
+    if not np.all(np.isfinite(probabilities)) or np.any((probabilities < 0) | (probabilities > 1)):
+        return False, {'error': f'invalid canary probabilities: {probabilities.tolist()}'}
+    
+    return True, {
+        'canary_latency_ms': (time.perf_counter() - started) * 1000,
+        'canary_risk_levels': [r['risk_level'] for r in results]
+    }
+
+class HotReloadingPredictor:
+    """DropoutPredictor facade that follows the registry's ACTIVE pointer
+    
+    A daemon thread polls the pointer; a new version is loaded, warmed and
+    validated off the request path and then swapped in with a single reference
+    assignment, so in-flight requests finish on the model they started with.
+    Every result carries the ``model_version`` that produced it.
+    """
+    
+    def __init__(self, registry=None, poll_interval=5.0, unseen_policy='most_frequent',
+                 canary_students=CANARY_STUDENTS, watch=True, mmap_mode=None, shadow_dir=None,
+                 comparison_path=DEFAULT_COMPARISON_PATH, concurrency=None):
+        self.registry = registry or ModelRegistry()
+        self.poll_interval = poll_interval
+        self.unseen_policy = unseen_policy
+        self.mmap_mode = mmap_mode
+        self.shadow_dir = shadow_dir
+        self.comparison_path = comparison_path
+        self.concurrency = concurrency
+        self.canary_students = canary_students
+        self.failed_versions = {}
+        self.loaded_at = None
+        self._swap_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        
+        version = self.registry.active_version()
+        if version is None:
+            version = self.registry.bootstrap()
+        self._current = self._load(version)
+        # Kept warm so a rollback swaps back without a cold load
+        self._previous = None
+        self.loaded_at = time.time()
+        
+        if watch:
+            self.start()
+    
+    @property
+    def predictor(self):
+        """The predictor currently serving traffic"""
+        return self._current
+    
+    @property
+    def active_version(self):
+        return self._current.model_version
+    
+    def _load(self, version):
+        model_path, preprocessor_path = self.registry.paths(version)
+        with metrics.timer('model_load', version=version):
+            return DropoutPredictor(model_path, preprocessor_path, unseen_policy=self.unseen_policy,
+                                    mmap_mode=self.mmap_mode, shadow_dir=self.shadow_dir,
+                                    comparison_path=self.comparison_path, concurrency=self.concurrency)
+    
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch, name='v0-model-watcher', daemon=True)
+            self._thread.start()
+        return self
+    
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+    
+    def _watch(self):
+        while not self._stop.wait(self.poll_interval):
+            try:
+                self.check_for_update()
+            except Exception as e:
+                logger.error(f"Model watcher error: {e}")
+    
+    def check_for_update(self):
+        """Load, validate and swap in the registry's active version if it changed"""
+        target = self.registry.active_version()
+        if not target or target == self._current.model_version or target in self.failed_versions:
+            return False
+        
+        with self._swap_lock:
+            if target == self._current.model_version:
+                return False
+            if self._previous is not None and self._previous.model_version == target:
+                candidate = self._previous
+            else:
+                logger.info(f"Loading model version {target} in the background")
+                try:
+                    candidate = self._load(target)
+                except Exception as e:
+                    self._reject(target, f'load failed: {e}')
+                    return False
+            
+            ok, details = validate_candidate(candidate, self.canary_students)
+            if not ok:
+                self._reject(target, details['error'])
+                return False
+            
+            previous = self._current
+            # Single reference assignment: requests already holding `previous` finish on it
+            self._current = candidate
+            self._previous = previous
+            self.loaded_at = time.time()
+            metrics.increment('model_swaps')
+            logger.info(
+                f"Swapped model {previous.model_version} -> {candidate.model_version} "
+                f"(canary {details['canary_latency_ms']:.1f}ms)"
+            )
+            return True
+    
+    def _reject(self, version, reason):
+        self.failed_versions[version] = reason
+        metrics.increment('model_swap_failures')
+        logger.error(f"Model version {version} rejected, keeping {self._current.model_version}: {reason}")
+    
+    def rollback(self):
+        """Re-activate the previous version and swap to it immediately"""
+        version = self.registry.rollback()
+        self.failed_versions.pop(version, None)
+        self.check_for_update()
+        return self.active_version
+    
+    def predict(self, input_data):
+        predictor = self._current
+        result = predictor.predict(input_data)
+        result['model_version'] = predictor.model_version
+        return result
+    
+    def batch_predict(self, input_data_list):
+        predictor = self._current
+        results = predictor.batch_predict(input_data_list)
+        for result in results:
+            result['model_version'] = predictor.model_version
+        return results
+    
+    def similar_students(self, input_data_list, k=DEFAULT_NEIGHBORS):
+        return self._current.similar_students(input_data_list, k)
+    
+    def status(self):
+        return {
+            'active_version': self._current.model_version,
+            'registry_active': self.registry.active_version(),
+            'registry_previous': self.registry.previous_version(),
+            'loaded_at': self.loaded_at,
+            'failed_versions': dict(self.failed_versions)
+        }
@@ -3,75 +3,185 @@ Inference script for making predictions with trained model
 Loads the saved model and preprocessor for real-time predictions
 """
 
+import hashlib
+import os
 import joblib
 import numpy as np
 import pandas as pd
-import sys
 import json
+from concurrency import ConcurrencyConfig
+from instrumentation import get_logger, metrics
+from encoding import UNSEEN_POLICIES, UnseenCategoryError, build_encoders, encode_frame, unseen_counts
+from feature_schema import FeatureSchema, InvalidInputError
+from shadow_scoring import DEFAULT_COMPARISON_PATH, ShadowScorer
+from similarity_index import DEFAULT_NEIGHBORS, DEFAULT_SIMILARITY_INDEX_PATH, SimilarityIndex
+
+logger = get_logger('predict')
+
+# Dropout probability thresholds for the risk levels
+HIGH_RISK_THRESHOLD = 0.7
+MEDIUM_RISK_THRESHOLD = 0.4
+
+def model_file_version(path):
+    """Short content hash identifying a model file"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()[:12]
+
+def risk_levels(dropout_probs):
+    """Vectorized risk level assignment"""
+    return np.select(
+        [dropout_probs >= HIGH_RISK_THRESHOLD, dropout_probs >= MEDIUM_RISK_THRESHOLD],
+        ['High', 'Medium'],
+        default='Low'
+    )
 
 class DropoutPredictor:
     """Load trained model and make predictions"""
     
-    def __init__(self, model_path='models/final_model.pkl', preprocessor_path='models/preprocessor.pkl'):
-        """Initialize predictor with saved model and preprocessor"""
+    def __init__(self, model_path='models/final_model.pkl', preprocessor_path='models/preprocessor.pkl',
+                 unseen_policy='most_frequent', mmap_mode=None, shadow_dir=None,
+                 comparison_path=DEFAULT_COMPARISON_PATH, concurrency=None,
+                 similarity_index_path=DEFAULT_SIMILARITY_INDEX_PATH):
+        """Initialize predictor with saved model and preprocessor
+        
+        ``mmap_mode='r'`` memory-maps the large arrays stored in the joblib files
+        (support vectors, coefficients, scaler parameters) instead of copying them
+        onto the heap, so processes serving the same model share those pages.
+        
+        ``shadow_dir`` (e.g. ``models/candidates``) turns on shadow scoring: every
+        batch is also scored by the other trained candidates and their live latency
+        and agreement are written to ``comparison_path``. Results still come from
+        the primary model.
+        
+        ``concurrency`` (a :class:`ConcurrencyConfig`) sets the models' ``n_jobs``;
+        the entry point is expected to have applied it to the process.
+        
+        The similarity index at ``similarity_index_path`` (built by
+        train_models.py) is loaded when it exists and matches the preprocessor;
+        :meth:`similar_students` needs it.
+        """
+        if unseen_policy not in UNSEEN_POLICIES:
+            raise ValueError(f"unseen_policy must be one of {UNSEEN_POLICIES}")
+        self.concurrency = concurrency or ConcurrencyConfig()
+        
         try:
-            self.model = joblib.load(model_path)
-            preprocessor_state = joblib.load(preprocessor_path)
+            with metrics.timer('load'):
+                self.model = joblib.load(model_path, mmap_mode=mmap_mode)
+                preprocessor_state = joblib.load(preprocessor_path, mmap_mode=mmap_mode)
             
+            self.concurrency.configure(self.model)
             self.scaler = preprocessor_state['scaler']
             self.label_encoders = preprocessor_state['label_encoders']
             self.feature_names = preprocessor_state['feature_names']
+            self.model_version = model_file_version(model_path)
+            self.preprocessor_version = model_file_version(preprocessor_path)
+            
+            # Hash-map encoders replace LabelEncoder.transform at inference time
+            self.unseen_policy = unseen_policy
+            self.encoders = build_encoders(
+                self.label_encoders,
+                policy=unseen_policy,
+                category_counts=preprocessor_state.get('category_counts')
+            )
+            # Vectorized type/range/null/category checks run before the model sees a row
+            self.schema = FeatureSchema.from_preprocessor_state(preprocessor_state, self.encoders)
+            
+            logger.info(f"Model {self.model_version} loaded successfully from {model_path}")
+            logger.debug(f"Expected features: {self.feature_names}")
+            
+            self.similarity = None
+            if similarity_index_path and os.path.exists(similarity_index_path):
+                self.similarity = self.load_similarity_index(similarity_index_path, mmap_mode)
             
-            print(f"[v0] Model loaded successfully from {model_path}", file=sys.stderr)
-            print(f"[v0] Expected features: {self.feature_names}", file=sys.stderr)
+            self.shadow = None
+            if shadow_dir:
+                self.shadow = ShadowScorer.from_candidates(self, shadow_dir, comparison_path, mmap_mode)
             
         except FileNotFoundError as e:
-            print(f"[v0] Error: Model files not found. Please run train_models.py first.", file=sys.stderr)
+            logger.error("Model files not found. Please run train_models.py first.")
             raise e
     
-    def preprocess_input(self, input_data):
-        """Preprocess input data for prediction"""
-        # Convert to DataFrame
-        df = pd.DataFrame([input_data])
-        
-        # Encode categorical variables
-        for col, encoder in self.label_encoders.items():
-            if col in df.columns:
-                try:
-                    df[col] = encoder.transform(df[col])
-                except ValueError:
-                    # Handle unseen categories
-                    print(f"[v0] Warning: Unseen category in {col}, using most frequent", file=sys.stderr)
-                    df[col] = encoder.transform([encoder.classes_[0]])[0]
+    def load_similarity_index(self, path, mmap_mode=None):
+        """Load a similarity index, or None if it was built with another preprocessor"""
+        index = SimilarityIndex.load(path, mmap_mode=mmap_mode)
+        if index.meta.get('preprocessor_version') != self.preprocessor_version:
+            logger.warning(f"Ignoring similarity index {path}: built with another preprocessor")
+            return None
+        logger.debug(f"Similarity index with {len(index)} students loaded from {path}")
+        return index
+    
+    def preprocess_frame(self, df):
+        """Preprocess a DataFrame of students; returns (X_scaled, rejected_mask)"""
+        # Work on the model columns only so the caller's frame is left untouched
+        df = df[self.feature_names].copy()
         
-        # Ensure correct feature order
-        df = df[self.feature_names]
+        # Encode categorical variables, one vectorized lookup per column
+        with metrics.timer('encode'):
+            rejected = encode_frame(df, self.encoders)
         
         # Scale features
-        X_scaled = self.scaler.transform(df)
+        with metrics.timer('scale'):
+            X_scaled = self.scaler.transform(df)
         
-        return X_scaled
+        return X_scaled, rejected
+    
+    def validate_frame(self, df):
+        """Schema-check a DataFrame; returns (model feature frame, ValidationReport)"""
+        with metrics.timer('validate'):
+            return self.schema.validate(df)
+    
+    @staticmethod
+    def _recommendation_records(df, features):
+        """Row dicts for recommendations: validated model features (numerics coerced) over the other raw columns"""
+        others = df.drop(columns=features.columns, errors='ignore').reset_index(drop=True)
+        return pd.concat([others, features.reset_index(drop=True)], axis=1).to_dict('records')
+    
+    def preprocess_input(self, input_data):
+        """Preprocess input data for prediction"""
+        return self._preprocess_record(input_data)[0]
+    
+    def _preprocess_record(self, input_data):
+        """(scaled features, validated record) for one student"""
+        df = pd.DataFrame([input_data])
+        features, report = self.validate_frame(df)
+        if not report.valid[0]:
+            raise InvalidInputError(report.describe(0), int(report.reasons[0]))
+        X_scaled, rejected = self.preprocess_frame(features)
+        if rejected[0]:
+            unseen = {
+                col: input_data.get(col) for col, encoder in self.encoders.items()
+                if input_data.get(col) not in encoder.mapping
+            }
+            raise UnseenCategoryError(', '.join(unseen), unseen.values())
+        return X_scaled, self._recommendation_records(df, features)[0]
+    
+    def score(self, X, valid=None):
+        """Primary model predictions and probabilities, shadow-scored when enabled"""
+        if self.shadow is not None:
+            return self.shadow.score(self.model, X, valid)
+        return self.model.predict(X), self.model.predict_proba(X)
     
     def predict(self, input_data):
         """Make prediction for a single student"""
         # Preprocess input
-        X = self.preprocess_input(input_data)
+        with metrics.timer('preprocess'):
+            X, record = self._preprocess_record(input_data)
         
         # Get prediction and probability
-        prediction = self.model.predict(X)[0]
-        probability = self.model.predict_proba(X)[0]
+        with metrics.timer('model'):
+            predictions, probabilities = self.score(X)
+            prediction, probability = predictions[0], probabilities[0]
         
         # Determine risk level
         dropout_prob = probability[1]
-        if dropout_prob >= 0.7:
-            risk_level = "High"
-        elif dropout_prob >= 0.4:
-            risk_level = "Medium"
-        else:
-            risk_level = "Low"
+        risk_level = str(risk_levels(np.array([dropout_prob]))[0])
         
         # Generate recommendations
-        recommendations = self.generate_recommendations(input_data, dropout_prob)
+        with metrics.timer('recommendations'):
+            recommendations = self.generate_recommendations(record, dropout_prob)
         
         return {
             'prediction': int(prediction),
@@ -81,8 +191,11 @@ class DropoutPredictor:
             'recommendations': recommendations
         }
     
-    def generate_recommendations(self, input_data, dropout_prob):
-        """Generate personalized intervention recommendations"""
+    def generate_recommendations(self, input_data, dropout_prob, avg_gpa=None):
+        """Generate personalized intervention recommendations
+        
+        ``avg_gpa`` may be passed precomputed (e.g. from the feature store).
+        """
         recommendations = []
         
         # Attendance-based recommendations
@@ -95,7 +208,8 @@ class DropoutPredictor:
             })
         
         # GPA-based recommendations
-        avg_gpa = (input_data.get('gpa_semester1', 4.0) + input_data.get('gpa_semester2', 4.0)) / 2
+        if avg_gpa is None:
+            avg_gpa = (input_data.get('gpa_semester1', 4.0) + input_data.get('gpa_semester2', 4.0)) / 2
         if avg_gpa < 2.5:
             recommendations.append({
                 'category': 'Academic',
@@ -164,15 +278,137 @@ class DropoutPredictor:
         
         return recommendations
     
+    def predict_frame(self, df):
+        """Make predictions for a DataFrame of students in one vectorized pass
+        
+        Returns one result per row, shaped like :meth:`predict`. Rows that fail
+        schema validation (or the unseen-category ``reject`` policy) never reach
+        the model and get ``error`` and ``reason_codes`` entries instead.
+        """
+        features, report = self.validate_frame(df)
+        results = [None] * len(df)
+        for position in report.invalid_positions:
+            results[position] = {'error': report.describe(position), 'reason_codes': int(report.reasons[position])}
+        
+        # Invalid rows are counted by the schema (rows_invalid); rows_rejected counts policy rejections only
+        valid_positions = np.flatnonzero(report.valid)
+        if len(valid_positions) == 0:
+            return results
+        if len(valid_positions) < len(df):
+            features = features.iloc[valid_positions]
+            df = df.iloc[valid_positions]
+        
+        with metrics.timer('preprocess'):
+            X, rejected = self.preprocess_frame(features)
+        
+        with metrics.timer('model'):
+            predictions, probabilities = self.score(X, ~rejected)
+        
+        self._fill_results(results, valid_positions, self._recommendation_records(df, features),
+                           predictions, probabilities, rejected)
+        metrics.increment('rows_rejected', int(rejected.sum()))
+        return results
+    
+    def _fill_results(self, results, positions, records, predictions, probabilities, rejected=None,
+                      avg_gpas=None):
+        """Write one result per scored row into ``results`` at ``positions``"""
+        dropout_probs = probabilities[:, 1]
+        levels = risk_levels(dropout_probs)
+        
+        with metrics.timer('recommendations'):
+            for i, (position, input_data) in enumerate(zip(positions, records)):
+                if rejected is not None and rejected[i]:
+                    results[position] = {'error': 'Unseen category rejected by policy'}
+                    continue
+                results[position] = {
+                    'prediction': int(predictions[i]),
+                    'dropout_probability': float(dropout_probs[i]),
+                    'graduate_probability': float(probabilities[i, 0]),
+                    'risk_level': str(levels[i]),
+                    'recommendations': self.generate_recommendations(
+                        input_data, dropout_probs[i], None if avg_gpas is None else avg_gpas[i]
+                    )
+                }
+    
+    def predict_stored(self, df, snapshot):
+        """Like :meth:`predict_frame`, reading known students' features from a feature store snapshot
+        
+        The snapshot must already hold these rows (``FeatureStore.update``);
+        its scaled vectors and derived features are used as stored. Students it
+        lacks, stores as invalid or had to impute go through :meth:`predict_frame`,
+        so every row gets the same result as without the store.
+        """
+        if snapshot.meta.get('preprocessor_version') != self.preprocessor_version:
+            raise ValueError(f"Feature store snapshot {snapshot.as_of} was built with another preprocessor")
+        
+        rows = snapshot.positions(df['student_id'])
+        stored = rows >= 0
+        candidates = rows[stored]
+        stored[stored] = snapshot.valid[candidates] & ~snapshot.imputed[candidates]
+        hits = np.flatnonzero(stored)
+        misses = np.flatnonzero(~stored)
+        metrics.increment('feature_store_hits', len(hits))
+        
+        results = [None] * len(df)
+        if len(misses):
+            for position, result in zip(misses, self.predict_frame(df.iloc[misses])):
+                results[position] = result
+        if len(hits):
+            rows = rows[hits]
+            with metrics.timer('model'):
+                predictions, probabilities = self.score(snapshot.features[rows])
+            # Raw cells may be text (e.g. a column with one bad value); recommendations read them coerced
+            hit_rows = df.iloc[hits]
+            features, _ = self.validate_frame(hit_rows)
+            self._fill_results(results, hits, self._recommendation_records(hit_rows, features),
+                               predictions, probabilities, avg_gpas=snapshot.derived_column('avg_gpa')[rows])
+        return results
+    
+    def similar_students(self, input_data_list, k=DEFAULT_NEIGHBORS):
+        """The ``k`` most similar historical students of each student, with their outcomes
+        
+        All valid rows are looked up in one batched query. Rows failing
+        validation get ``error`` entries, as in :meth:`predict_frame`.
+        """
+        if self.similarity is None:
+            raise FileNotFoundError("No similarity index loaded. Please run train_models.py first.")
+        df = pd.DataFrame(input_data_list)
+        features, report = self.validate_frame(df)
+        results = [None] * len(df)
+        for position in report.invalid_positions:
+            results[position] = {'error': report.describe(position), 'reason_codes': int(report.reasons[position])}
+        
+        valid_positions = np.flatnonzero(report.valid)
+        if len(valid_positions) == 0:
+            return results
+        with metrics.timer('preprocess'):
+            X, rejected = self.preprocess_frame(features.iloc[valid_positions])
+        with metrics.timer('similar'):
+            neighbors = self.similarity.neighbors(X, k)
+        for position, rejected_row, result in zip(valid_positions, rejected, neighbors):
+            results[position] = {'error': 'Unseen category rejected by policy'} if rejected_row else result
+        return results
+    
+    def unseen_category_counts(self):
+        """Unseen-category totals per column since the predictor was loaded"""
+        return unseen_counts(self.encoders)
+    
     def batch_predict(self, input_data_list):
         """Make predictions for multiple students"""
+        try:
+            return self.predict_frame(pd.DataFrame(input_data_list))
+        except Exception as e:
+            # Fall back to row-by-row scoring so one malformed record cannot sink the batch
+            logger.warning(f"Vectorized batch failed ({e}); scoring row by row")
+        
         results = []
         for input_data in input_data_list:
             try:
                 result = self.predict(input_data)
                 results.append(result)
             except Exception as e:
-                print(f"[v0] Error predicting for student: {e}", file=sys.stderr)
+                logger.error(f"Error predicting for student: {e}")
+                metrics.increment('prediction_errors')
                 results.append({'error': str(e)})
         
         return results
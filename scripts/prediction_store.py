@@ -0,0 +1,244 @@
+"""
+Append-only prediction history store backed by SQLite
+Records every scored result with its timestamp, model version and features hash
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from instrumentation import get_logger, metrics
+
+logger = get_logger('prediction_store')
+
+DEFAULT_STORE_PATH = 'data/predictions.db'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS predictions (
+    id INTEGER PRIMARY KEY,
+    student_id TEXT NOT NULL,
+    scored_at REAL NOT NULL,
+    model_version TEXT NOT NULL,
+    features_hash TEXT NOT NULL,
+    risk_level TEXT NOT NULL,
+    dropout_probability REAL NOT NULL,
+    graduate_probability REAL NOT NULL,
+    recommendations TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_predictions_student_time ON predictions (student_id, scored_at);
+CREATE INDEX IF NOT EXISTS idx_predictions_time ON predictions (scored_at);
+CREATE INDEX IF NOT EXISTS idx_predictions_risk_time ON predictions (risk_level, scored_at);
+"""
+
+COLUMNS = (
+    'student_id', 'scored_at', 'model_version', 'features_hash', 'risk_level',
+    'dropout_probability', 'graduate_probability', 'recommendations'
+)
+
+def feature_fingerprints(features_df):
+    """Stable per-row uint64 fingerprint of the model input features
+    
+    Numeric columns are cast to float64 first so int/float parsing differences
+    between extracts do not change the hash.
+    """
+    normalized = features_df.copy()
+    for col in normalized.columns:
+        if pd.api.types.is_numeric_dtype(normalized[col]):
+            normalized[col] = normalized[col].astype(np.float64)
+        else:
+            normalized[col] = normalized[col].astype(str)
+    return pd.util.hash_pandas_object(normalized, index=False).to_numpy()
+
+def features_hash(features_df):
+    """Per-row feature fingerprints as 16-character hex strings"""
+    return [f'{h:016x}' for h in feature_fingerprints(features_df)]
+
+def _timestamp(value):
+    """Accept epoch seconds, datetimes or ISO strings"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.timestamp()
+
+class PredictionStore:
+    """Embedded, indexed history of scored predictions
+    
+    Rows are only ever appended; ``compact`` trims old history while always
+    keeping each student's latest result. Lookups by student, time window and
+    risk level are served from B-tree indexes.
+    """
+    
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.row_factory = sqlite3.Row
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA temp_store=MEMORY')
+        self.conn.executescript(SCHEMA)
+    
+    def close(self):
+        self.conn.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+    
+    def insert(self, rows):
+        """Bulk insert an iterable of row tuples (see COLUMNS) in one transaction"""
+        with metrics.timer('store_insert'):
+            with self.conn:
+                cursor = self.conn.executemany(
+                    f"INSERT INTO predictions ({', '.join(COLUMNS)}) VALUES ({', '.join('?' * len(COLUMNS))})",
+                    rows
+                )
+        metrics.increment('store_rows', cursor.rowcount)
+        return cursor.rowcount
+    
+    def record_chunk(self, student_ids, predictions, features_df, model_version, scored_at=None):
+        """Append a scored chunk; rows that failed to score are skipped"""
+        scored_at = scored_at or time.time()
+        hashes = features_hash(features_df)
+        rows = [
+            (
+                str(student_id), scored_at, model_version, feature_hash, prediction['risk_level'],
+                float(prediction['dropout_probability']), float(prediction['graduate_probability']),
+                json.dumps([r['action'] for r in prediction['recommendations'][:3]])
+            )
+            for student_id, prediction, feature_hash in zip(student_ids, predictions, hashes)
+            if 'error' not in prediction
+        ]
+        return self.insert(rows)
+    
+    def latest(self, student_id):
+        """Most recent prediction for a student, or None"""
+        row = self.conn.execute(
+            "SELECT * FROM predictions WHERE student_id = ? ORDER BY scored_at DESC LIMIT 1",
+            (str(student_id),)
+        ).fetchone()
+        return self._to_dict(row) if row else None
+    
+    def history(self, student_id, limit=None):
+        """All predictions for a student, newest first"""
+        query = "SELECT * FROM predictions WHERE student_id = ? ORDER BY scored_at DESC"
+        params = [str(student_id)]
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [self._to_dict(row) for row in self.conn.execute(query, params)]
+    
+    def by_risk(self, risk_level, since=None, until=None, limit=None):
+        """Predictions at a risk level within a time window, newest first"""
+        query = "SELECT * FROM predictions WHERE risk_level = ? AND scored_at >= ? AND scored_at < ?"
+        params = [risk_level, _timestamp(since) or 0.0, _timestamp(until) or float('inf')]
+        query += " ORDER BY scored_at DESC"
+        if limit:
+            query += " LIMIT ?"
+            params.append(int(limit))
+        return [self._to_dict(row) for row in self.conn.execute(query, params)]
+    
+    def students_at_risk(self, risk_level, since=None, until=None):
+        """Distinct students with at least one prediction at ``risk_level`` in the window"""
+        rows = self.conn.execute(
+            "SELECT DISTINCT student_id FROM predictions "
+            "WHERE risk_level = ? AND scored_at >= ? AND scored_at < ?",
+            (risk_level, _timestamp(since) or 0.0, _timestamp(until) or float('inf'))
+        )
+        return [row['student_id'] for row in rows]
+    
+    def count(self):
+        return self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+    
+    def compact(self, keep_per_student=None, older_than=None, vacuum=True):
+        """Trim history; each student's latest prediction is always kept
+        
+        ``keep_per_student`` keeps only the N newest rows per student and
+        ``older_than`` (epoch seconds, datetime or ISO string) drops rows scored
+        before that time. VACUUM then returns freed pages to the filesystem.
+        """
+        removed = 0
+        with metrics.timer('store_compact'):
+            with self.conn:
+                if keep_per_student:
+                    removed += self.conn.execute(
+                        "DELETE FROM predictions WHERE id IN ("
+                        " SELECT id FROM ("
+                        "  SELECT id, ROW_NUMBER() OVER ("
+                        "   PARTITION BY student_id ORDER BY scored_at DESC, id DESC) AS rank"
+                        "  FROM predictions)"
+                        " WHERE rank > ?)",
+                        (max(int(keep_per_student), 1),)
+                    ).rowcount
+                if older_than is not None:
+                    removed += self.conn.execute(
+                        "DELETE FROM predictions WHERE scored_at < ? AND id NOT IN ("
+                        " SELECT MAX(id) FROM predictions GROUP BY student_id)",
+                        (_timestamp(older_than),)
+                    ).rowcount
+            if vacuum:
+                self.conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+                self.conn.execute('VACUUM')
+            self.conn.execute('PRAGMA optimize')
+        logger.info(f"Compacted prediction store: removed {removed} rows, {self.count()} remain")
+        return removed
+    
+    @staticmethod
+    def _to_dict(row):
+        record = dict(row)
+        if record.get('recommendations'):
+            record['recommendations'] = json.loads(record['recommendations'])
+        return record
+
+def main():
+    """Query or compact the prediction store from the command line"""
+    parser = argparse.ArgumentParser(description="Prediction history store")
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help="SQLite database path")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    latest = commands.add_parser('latest', help="Latest prediction for a student")
+    latest.add_argument('student_id')
+    
+    history = commands.add_parser('history', help="Prediction history for a student")
+    history.add_argument('student_id')
+    history.add_argument('--limit', type=int, default=None)
+    
+    risk = commands.add_parser('risk', help="Students at a risk level within a time window")
+    risk.add_argument('risk_level', choices=['High', 'Medium', 'Low'])
+    risk.add_argument('--since', default=None, help="ISO date/time, inclusive")
+    risk.add_argument('--until', default=None, help="ISO date/time, exclusive")
+    
+    compact = commands.add_parser('compact', help="Trim history and reclaim space")
+    compact.add_argument('--keep', type=int, default=None, help="Rows to keep per student")
+    compact.add_argument('--older-than', default=None, help="Drop rows before this ISO date/time")
+    
+    args = parser.parse_args()
+    
+    with PredictionStore(args.db) as store:
+        if args.command == 'latest':
+            result = store.latest(args.student_id)
+        elif args.command == 'history':
+            result = store.history(args.student_id, args.limit)
+        elif args.command == 'risk':
+            result = store.students_at_risk(args.risk_level, args.since, args.until)
+        else:
+            result = {'removed': store.compact(args.keep, args.older_than), 'remaining': store.count()}
+    
+    if result is None:
+        print(f"[v0] No predictions for student {args.student_id}", file=sys.stderr)
+        sys.exit(1)
+    print(json.dumps(result, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,281 @@
+"""
+Copy-on-write friendly multi-worker serving
+Loads the model once in a parent process and forks workers that share its memory pages
+"""
+
+import argparse
+import gc
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+from instrumentation import get_logger
+
+logger = get_logger('prefork')
+
+# Workers forward /admin/reload and /admin/rollback to the parent, which owns the shared model
+ADMIN_SIGNALS = {'reload': signal.SIGUSR1, 'rollback': signal.SIGUSR2}
+
+def memory_usage(pid=None):
+    """RSS, PSS and USS (unique set size) in bytes from /proc/<pid>/smaps_rollup
+    
+    USS counts only pages private to the process, i.e. the memory a worker
+    really adds; shared model pages are split across processes in PSS.
+    Returns None where smaps_rollup is unavailable (non-Linux).
+    """
+    pid = pid or os.getpid()
+    fields = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) >= 2 and parts[0].endswith(':') and parts[1].isdigit():
+                    fields[parts[0][:-1]] = int(parts[1]) * 1024
+    except FileNotFoundError:
+        return None
+    return {
+        'rss': fields.get('Rss', 0),
+        'pss': fields.get('Pss', 0),
+        'uss': fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0)
+    }
+
+def freeze_heap():
+    """Move every live object into the permanent GC generation before forking
+    
+    Without this the first collection in a child writes to the GC header of every
+    inherited object, which copies those pages into each worker.
+    """
+    gc.collect()
+    gc.freeze()
+
+class PreforkServer:
+    """Fork N workers that serve from one bound socket and one pre-loaded model
+    
+    The parent loads and warms the model, freezes its heap and forks. Workers
+    only read the inherited model pages, so they stay shared. The parent never
+    serves traffic: it respawns workers that die and, when the registry's
+    active version changes, loads the new model itself and replaces the
+    workers in a rolling restart so the new pages are shared too. Admin
+    reload/rollback requests reach one worker, which signals the parent
+    (:data:`ADMIN_SIGNALS`) instead of loading a private copy.
+    """
+    
+    def __init__(self, server, service, workers=2, poll_interval=5.0, concurrency=None):
+        self.server = server
+        self.service = service
+        self.num_workers = workers
+        self.poll_interval = poll_interval
+        self.concurrency = concurrency
+        self.workers = {}
+        # Worker index per pid, so a respawned worker takes over the same CPU slice
+        self.slots = {}
+        self._stopping = False
+        self._pending = set()
+        self._wake = threading.Event()
+    
+    def _spawn(self, slot):
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)
+        self.workers[pid] = self.service.predictor.active_version
+        self.slots[pid] = slot
+        return pid
+    
+    def _run_worker(self, slot):
+        if self.concurrency is not None:
+            self.concurrency.apply(worker_index=slot)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        for signum in ADMIN_SIGNALS.values():
+            signal.signal(signum, signal.SIG_IGN)
+        self.service.supervisor_pid = os.getppid()
+        # shutdown() blocks until serve_forever returns, so call it off the signal frame
+        signal.signal(signal.SIGTERM, lambda *_: threading.Thread(target=self.server.shutdown).start())
+        # Track request threads so a graceful stop lets in-flight requests finish
+        self.server.daemon_threads = False
+        code = 0
+        try:
+            self.server.serve_forever()
+            self.server.server_close()
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} crashed: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    
+    def _spawn_all(self):
+        freeze_heap()
+        pids = [self._spawn(slot) for slot in range(self.num_workers)]
+        logger.info(f"Started workers {pids} on model {self.service.predictor.active_version}")
+        return pids
+    
+    def _stop_workers(self, pids):
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+            self.workers.pop(pid, None)
+            self.slots.pop(pid, None)
+    
+    def _reap(self):
+        """Respawn workers that exited unexpectedly"""
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.slots.pop(pid, 0)
+            if self.workers.pop(pid, None) is not None and not self._stopping:
+                logger.warning(f"Worker {pid} exited with status {status}; respawning")
+                self._spawn(slot)
+    
+    def memory_report(self):
+        """Per-process memory figures for the parent and each worker"""
+        return {
+            'parent': memory_usage(os.getpid()),
+            'workers': {pid: memory_usage(pid) for pid in self.workers}
+        }
+    
+    def _handle_admin(self):
+        """Apply requested rollbacks and poll the registry; returns True if the parent's model changed"""
+        pending, self._pending = self._pending, set()
+        if 'rollback' in pending:
+            try:
+                self.service.predictor.rollback()
+            except ValueError as e:
+                logger.warning(f"Rollback ignored: {e}")
+        self.service.predictor.check_for_update()
+        return any(version != self.service.predictor.active_version for version in self.workers.values())
+    
+    def run(self):
+        """Supervise workers until SIGINT/SIGTERM"""
+        def stop(*_):
+            self._stopping = True
+            self._wake.set()
+        
+        def request(signum, _frame):
+            self._pending.update(action for action, admin_signum in ADMIN_SIGNALS.items() if admin_signum == signum)
+            self._wake.set()
+        
+        signal.signal(signal.SIGTERM, stop)
+        signal.signal(signal.SIGINT, stop)
+        for signum in ADMIN_SIGNALS.values():
+            signal.signal(signum, request)
+        
+        self._spawn_all()
+        try:
+            while not self._stopping:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                if self._stopping:
+                    break
+                self._reap()
+                if self._handle_admin():
+                    old = list(self.workers)
+                    self._spawn_all()
+                    self._stop_workers(old)
+                    logger.info(f"Rolled workers onto model {self.service.predictor.active_version}")
+        finally:
+            self._stopping = True
+            self._stop_workers(list(self.workers))
+            self.server.server_close()
+
+_NAIVE_WORKER = """
+import sys, warnings
+warnings.filterwarnings('ignore')
+sys.path.insert(0, {scripts!r})
+from predict import DropoutPredictor
+from model_registry import CANARY_STUDENTS
+predictor = DropoutPredictor({model!r}, {preprocessor!r}, mmap_mode={mmap!r})
+predictor.batch_predict(CANARY_STUDENTS)
+print('ready', flush=True)
+sys.stdin.read()
+"""
+
+def _summarize(samples):
+    uss = [s['uss'] for s in samples]
+    return {
+        'workers': len(samples),
+        'mean_uss_mb': sum(uss) / len(uss) / 2**20,
+        'total_uss_mb': sum(uss) / 2**20,
+        'total_pss_mb': sum(s['pss'] for s in samples) / 2**20
+    }
+
+def compare_memory(workers=4, model_path='models/final_model.pkl',
+                   preprocessor_path='models/preprocessor.pkl', mmap_mode=None):
+    """Measure per-worker unique memory: N independent loads vs N forks of one load"""
+    from predict import DropoutPredictor
+    from model_registry import CANARY_STUDENTS
+    
+    scripts_dir = os.path.dirname(os.path.abspath(__file__))
+    code = _NAIVE_WORKER.format(scripts=scripts_dir, model=model_path,
+                                preprocessor=preprocessor_path, mmap=mmap_mode)
+    
+    # Naive: every worker unpickles its own copy
+    procs = [
+        subprocess.Popen([sys.executable, '-c', code], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                         stderr=subprocess.DEVNULL, text=True)
+        for _ in range(workers)
+    ]
+    for proc in procs:
+        proc.stdout.readline()
+    naive = _summarize([memory_usage(proc.pid) for proc in procs])
+    for proc in procs:
+        proc.stdin.close()
+        proc.wait()
+    
+    # Pre-fork: load once, freeze the heap, fork workers that score the same canary
+    predictor = DropoutPredictor(model_path, preprocessor_path, mmap_mode=mmap_mode)
+    predictor.batch_predict(CANARY_STUDENTS)
+    freeze_heap()
+    children = []
+    for _ in range(workers):
+        ready_r, ready_w = os.pipe()
+        release_r, release_w = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            predictor.batch_predict(CANARY_STUDENTS)
+            os.write(ready_w, b'1')
+            os.read(release_r, 1)
+            os._exit(0)
+        children.append((pid, ready_r, release_w))
+    for _, ready_r, _ in children:
+        os.read(ready_r, 1)
+    prefork = _summarize([memory_usage(pid) for pid, _, _ in children])
+    for pid, _, release_w in children:
+        os.write(release_w, b'1')
+        os.waitpid(pid, 0)
+    
+    return {'model': model_path, 'mmap_mode': mmap_mode, 'naive': naive, 'prefork': prefork}
+
+def main():
+    """Print a naive vs pre-fork per-worker memory comparison"""
+    parser = argparse.ArgumentParser(description="Compare per-worker memory of naive and pre-fork serving")
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--model', default='models/final_model.pkl')
+    parser.add_argument('--preprocessor', default='models/preprocessor.pkl')
+    parser.add_argument('--mmap', action='store_true', help="Memory-map model arrays in both modes")
+    args = parser.parse_args()
+    
+    if memory_usage() is None:
+        print("[v0] /proc/<pid>/smaps_rollup is required (Linux)", file=sys.stderr)
+        sys.exit(1)
+    
+    report = compare_memory(args.workers, args.model, args.preprocessor, 'r' if args.mmap else None)
+    print(json.dumps(report, indent=2))
+    saved = report['naive']['mean_uss_mb'] - report['prefork']['mean_uss_mb']
+    print(f"[v0] Unique memory per worker: naive {report['naive']['mean_uss_mb']:.1f} MB, "
+          f"pre-fork {report['prefork']['mean_uss_mb']:.1f} MB ({saved:.1f} MB saved per worker)",
+          file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
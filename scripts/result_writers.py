@@ -0,0 +1,396 @@
+"""
+Columnar batch results and their output writers
+Holds batch output as typed arrays with recommendations encoded against a shared lookup table
+"""
+
+import json
+import os
+import numpy as np
+from instrumentation import get_logger, metrics
+
+logger = get_logger('result_writers')
+
+RISK_LEVELS = ('Low', 'Medium', 'High')
+TOP_RECOMMENDATIONS = 3
+# Code for "no value" in the risk, recommendation and error code arrays
+MISSING = -1
+
+class ResultTable:
+    """Batch output as parallel typed arrays
+    
+    ``risk_codes`` index :data:`RISK_LEVELS`; ``recommendation_codes`` is an
+    (n, 3) array indexing ``recommendation_lookup``; ``error_codes`` index
+    ``error_lookup``. Failed rows have ``MISSING`` risk and NaN probabilities.
+    """
+    
+    def __init__(self, student_ids, risk_codes, dropout_probability, graduate_probability,
+                 recommendation_codes, recommendation_lookup, error_codes, error_lookup):
+        self.student_ids = student_ids
+        self.risk_codes = risk_codes
+        self.dropout_probability = dropout_probability
+        self.graduate_probability = graduate_probability
+        self.recommendation_codes = recommendation_codes
+        self.recommendation_lookup = recommendation_lookup
+        self.error_codes = error_codes
+        self.error_lookup = error_lookup
+    
+    def __len__(self):
+        return len(self.student_ids)
+    
+    @classmethod
+    def from_records(cls, results):
+        """Encode batch output records (see ``format_result``) in one pass"""
+        n = len(results)
+        student_ids = [None] * n
+        risk_codes = np.full(n, MISSING, dtype=np.int8)
+        dropout = np.full(n, np.nan)
+        graduate = np.full(n, np.nan)
+        recommendation_codes = np.full((n, TOP_RECOMMENDATIONS), MISSING, dtype=np.int16)
+        error_codes = np.full(n, MISSING, dtype=np.int16)
+        risk_index = {level: code for code, level in enumerate(RISK_LEVELS)}
+        recommendation_index = {}
+        error_index = {}
+        
+        for i, result in enumerate(results):
+            student_ids[i] = result['student_id']
+            error = result.get('error')
+            if isinstance(error, str):
+                error_codes[i] = error_index.setdefault(error, len(error_index))
+                continue
+            risk_codes[i] = risk_index[result['risk_level']]
+            dropout[i] = result['dropout_probability']
+            graduate[i] = result['graduate_probability']
+            for j, action in enumerate(result['top_recommendations'][:TOP_RECOMMENDATIONS]):
+                recommendation_codes[i, j] = recommendation_index.setdefault(action, len(recommendation_index))
+        
+        student_ids = np.asarray(student_ids)
+        if student_ids.dtype == object:
+            student_ids = student_ids.astype(str)
+        return cls(student_ids, risk_codes, dropout, graduate, recommendation_codes,
+                   list(recommendation_index), error_codes, list(error_index))
+    
+    @property
+    def failed(self):
+        return self.error_codes != MISSING
+    
+    def risk_counts(self):
+        """Rows per risk level, failed rows excluded"""
+        counts = np.bincount(self.risk_codes[~self.failed], minlength=len(RISK_LEVELS))
+        return dict(zip(RISK_LEVELS, counts.tolist()))
+    
+    def records(self):
+        """Yield batch output records, shaped like ``format_result``"""
+        lookup = self.recommendation_lookup
+        columns = zip(
+            self.student_ids.tolist(), self.risk_codes.tolist(), self.dropout_probability.tolist(),
+            self.graduate_probability.tolist(), self.recommendation_codes.tolist(), self.error_codes.tolist()
+        )
+        for student_id, risk, dropout, graduate, codes, error in columns:
+            if error != MISSING:
+                yield {'student_id': student_id, 'error': self.error_lookup[error]}
+                continue
+            yield {
+                'student_id': student_id,
+                'risk_level': RISK_LEVELS[risk],
+                'dropout_probability': dropout,
+                'graduate_probability': graduate,
+                'top_recommendations': [lookup[code] for code in codes if code != MISSING]
+            }
+
+def _json_lines(table):
+    """Compact JSON text per record, built from the columns
+    
+    Recommendation lists repeat heavily, so each distinct combination is
+    encoded once and reused.
+    """
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    combos, combo_index = np.unique(table.recommendation_codes, axis=0, return_inverse=True)
+    lookup = table.recommendation_lookup
+    combo_json = [dumps([lookup[code] for code in combo if code != MISSING]) for combo in combos.tolist()]
+    error_json = [dumps(error) for error in table.error_lookup]
+    ids = table.student_ids.tolist()
+    ids = map(str, ids) if table.student_ids.dtype.kind in 'iu' else map(dumps, ids)
+    
+    columns = zip(
+        ids, table.risk_codes.tolist(), table.dropout_probability.tolist(),
+        table.graduate_probability.tolist(), combo_index.ravel().tolist(), table.error_codes.tolist()
+    )
+    for student_id, risk, dropout, graduate, combo, error in columns:
+        if error != MISSING:
+            yield f'{{"student_id":{student_id},"error":{error_json[error]}}}'
+        else:
+            yield (
+                f'{{"student_id":{student_id},"risk_level":"{RISK_LEVELS[risk]}",'
+                f'"dropout_probability":{dropout!r},"graduate_probability":{graduate!r},'
+                f'"top_recommendations":{combo_json[combo]}}}'
+            )
+
+def _write_json(table, path):
+    """Compact JSON array of records"""
+    with open(path, 'w') as f:
+        f.write('[')
+        f.write(',\n'.join(_json_lines(table)))
+        f.write(']\n')
+
+def _write_jsonl(table, path):
+    """One JSON record per line"""
+    with open(path, 'w') as f:
+        for line in _json_lines(table):
+            f.write(line)
+            f.write('\n')
+
+def _csv_frame(table, error_column=None):
+    """Frame in the original batch CSV layout: recommendations as one list column
+    
+    The ``error`` column is only added when a row failed, as the record-based
+    writer did; ``error_column=True`` always adds it (streamed output, where
+    later chunks may fail).
+    """
+    import pandas as pd
+    
+    combos, combo_index = np.unique(table.recommendation_codes, axis=0, return_inverse=True)
+    lookup = table.recommendation_lookup
+    combo_text = np.array([str([lookup[code] for code in combo if code != MISSING]) for combo in combos.tolist()]
+                          + [None], dtype=object)
+    # Failed rows index the trailing None, which is written as an empty cell
+    combo_index = np.where(table.failed, len(combos), combo_index.ravel())
+    risk = np.array(list(RISK_LEVELS) + [None], dtype=object)
+    columns = {
+        'student_id': table.student_ids,
+        'risk_level': risk[table.risk_codes],
+        'dropout_probability': table.dropout_probability,
+        'graduate_probability': table.graduate_probability,
+        'top_recommendations': combo_text[combo_index]
+    }
+    if error_column or (error_column is None and table.failed.any()):
+        errors = np.array(table.error_lookup + [None], dtype=object)
+        columns['error'] = errors[table.error_codes]
+    return pd.DataFrame(columns)
+
+def _flat_csv_frame(table):
+    """Flat frame with one column per recommendation slot"""
+    import pandas as pd
+    
+    # Lookups are padded with '' so MISSING (-1) codes index the blank entry
+    lookup = np.array(table.recommendation_lookup + [''], dtype=object)
+    risk = np.array(list(RISK_LEVELS) + [''], dtype=object)
+    errors = np.array(table.error_lookup + [''], dtype=object)
+    columns = {
+        'student_id': table.student_ids,
+        'risk_level': risk[table.risk_codes],
+        'dropout_probability': table.dropout_probability,
+        'graduate_probability': table.graduate_probability
+    }
+    for j in range(TOP_RECOMMENDATIONS):
+        columns[f'recommendation_{j + 1}'] = lookup[table.recommendation_codes[:, j]]
+    columns['error'] = errors[table.error_codes]
+    return pd.DataFrame(columns)
+
+def _write_csv(table, path):
+    """CSV with the recommendations as one list column"""
+    _csv_frame(table).to_csv(path, index=False)
+
+def _write_csv_flat(table, path):
+    """Flat CSV with one column per recommendation slot"""
+    _flat_csv_frame(table).to_csv(path, index=False)
+
+def _write_npz(table, path):
+    """Typed arrays plus lookup tables in one compressed NumPy archive"""
+    np.savez_compressed(
+        path,
+        student_id=table.student_ids,
+        risk_code=table.risk_codes,
+        risk_lookup=np.array(RISK_LEVELS),
+        dropout_probability=table.dropout_probability,
+        graduate_probability=table.graduate_probability,
+        recommendation_codes=table.recommendation_codes,
+        recommendation_lookup=np.array(table.recommendation_lookup, dtype=str),
+        error_code=table.error_codes,
+        error_lookup=np.array(table.error_lookup, dtype=str)
+    )
+
+def _arrow_table(table):
+    """Arrow table with dictionary-encoded risk, recommendation and error columns"""
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Arrow/Parquet output needs pyarrow (pip install pyarrow)") from None
+    
+    def dictionary(codes, lookup):
+        # MISSING codes become nulls; every recommendation column shares one dictionary
+        return pa.DictionaryArray.from_arrays(
+            pa.array(codes, mask=codes == MISSING), pa.array(lookup, type=pa.string())
+        )
+    
+    columns = {
+        'student_id': pa.array(table.student_ids),
+        'risk_level': dictionary(table.risk_codes, list(RISK_LEVELS)),
+        'dropout_probability': pa.array(table.dropout_probability, from_pandas=True),
+        'graduate_probability': pa.array(table.graduate_probability, from_pandas=True)
+    }
+    for j in range(TOP_RECOMMENDATIONS):
+        columns[f'recommendation_{j + 1}'] = dictionary(table.recommendation_codes[:, j],
+                                                       table.recommendation_lookup)
+    columns['error'] = dictionary(table.error_codes, table.error_lookup)
+    return pa.table(columns)
+
+def _write_arrow(table, path):
+    """Arrow IPC file"""
+    arrow_table = _arrow_table(table)
+    import pyarrow as pa
+    
+    with pa.OSFile(path, 'wb') as sink:
+        with pa.ipc.new_file(sink, arrow_table.schema) as writer:
+            writer.write_table(arrow_table)
+
+def _write_parquet(table, path):
+    """Parquet with dictionary-encoded string columns"""
+    arrow_table = _arrow_table(table)
+    import pyarrow.parquet as pq
+    
+    pq.write_table(arrow_table, path, compression='zstd')
+
+WRITERS = {
+    'json': ('.json', _write_json),
+    'jsonl': ('.jsonl', _write_jsonl),
+    'csv': ('.csv', _write_csv),
+    'csv_flat': ('.flat.csv', _write_csv_flat),
+    'npz': ('.npz', _write_npz),
+    'arrow': ('.arrow', _write_arrow),
+    'parquet': ('.parquet', _write_parquet)
+}
+OUTPUT_FORMATS = tuple(WRITERS)
+
+def output_path_for(output_path, output_format):
+    """Swap the output extension for the one matching ``output_format``"""
+    return os.path.splitext(output_path)[0] + WRITERS[output_format][0]
+
+def write_results(table, output_path, formats=('csv', 'json')):
+    """Write ``table`` once per requested format; returns the written paths"""
+    directory = os.path.dirname(output_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    paths = []
+    for output_format in formats:
+        path = output_path_for(output_path, output_format)
+        with metrics.timer('serialization', format=output_format):
+            WRITERS[output_format][1](table, path)
+        logger.info(f"Results saved to {path}")
+        paths.append(path)
+    return paths
+
+class StreamingResultWriter:
+    """Appends result chunks to every requested format as they arrive
+    
+    Used by the pipelined batch mode so results never accumulate in memory.
+    Arrow and Parquet keep one growing lookup per dictionary column, so each
+    chunk only adds dictionary deltas. NPZ is written in one piece and
+    cannot be streamed.
+    """
+    
+    FORMATS = ('json', 'jsonl', 'csv', 'csv_flat', 'arrow', 'parquet')
+    
+    def __init__(self, output_path, formats=('csv', 'json')):
+        unsupported = set(formats) - set(self.FORMATS)
+        if unsupported:
+            raise ValueError(f"Formats {sorted(unsupported)} cannot be streamed")
+        directory = os.path.dirname(output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.output_path = output_path
+        self.formats = list(formats)
+        self.paths = [output_path_for(output_path, output_format) for output_format in self.formats]
+        self.rows = 0
+        self._files = {}
+        self._arrow_writers = {}
+        self._recommendation_index = {}
+        self._error_index = {}
+    
+    def write(self, table):
+        """Append one chunk's ResultTable to every output"""
+        if not len(table):
+            return
+        global_table = None
+        for output_format, path in zip(self.formats, self.paths):
+            with metrics.timer('serialization', format=output_format):
+                if output_format in ('arrow', 'parquet'):
+                    if global_table is None:
+                        global_table = self._global_codes(table)
+                    self._append_arrow(output_format, path, global_table)
+                else:
+                    getattr(self, f'_append_{output_format}')(self._file(output_format, path), table)
+        self.rows += len(table)
+    
+    def _file(self, output_format, path):
+        f = self._files.get(output_format)
+        if f is None:
+            f = self._files[output_format] = open(path, 'w')
+            if output_format == 'json':
+                f.write('[')
+        elif output_format == 'json':
+            f.write(',\n')
+        return f
+    
+    def _append_json(self, f, table):
+        f.write(',\n'.join(_json_lines(table)))
+    
+    def _append_jsonl(self, f, table):
+        for line in _json_lines(table):
+            f.write(line)
+            f.write('\n')
+    
+    def _append_csv(self, f, table):
+        _csv_frame(table, error_column=True).to_csv(f, header=self.rows == 0, index=False)
+    
+    def _append_csv_flat(self, f, table):
+        _flat_csv_frame(table).to_csv(f, header=self.rows == 0, index=False)
+    
+    def _global_codes(self, table):
+        """Re-code a chunk against lookups that only grow"""
+        def remap(lookup, index):
+            # Trailing MISSING so MISSING (-1) codes map to themselves
+            codes = [index.setdefault(value, len(index)) for value in lookup]
+            return np.array(codes + [MISSING], dtype=np.int16)
+        
+        recommendation_map = remap(table.recommendation_lookup, self._recommendation_index)
+        error_map = remap(table.error_lookup, self._error_index)
+        return ResultTable(
+            table.student_ids, table.risk_codes, table.dropout_probability, table.graduate_probability,
+            recommendation_map[table.recommendation_codes], list(self._recommendation_index),
+            error_map[table.error_codes], list(self._error_index)
+        )
+    
+    def _append_arrow(self, output_format, path, table):
+        arrow_table = _arrow_table(table)
+        writer = self._arrow_writers.get(output_format)
+        if writer is None:
+            if output_format == 'parquet':
+                import pyarrow.parquet as pq
+                
+                writer = pq.ParquetWriter(path, arrow_table.schema, compression='zstd')
+            else:
+                import pyarrow as pa
+                
+                self._files[output_format] = sink = pa.OSFile(path, 'wb')
+                options = pa.ipc.IpcWriteOptions(emit_dictionary_deltas=True)
+                writer = pa.ipc.new_file(sink, arrow_table.schema, options=options)
+            self._arrow_writers[output_format] = writer
+        writer.write_table(arrow_table)
+    
+    def close(self):
+        """Finish every output; returns the written paths"""
+        if not self.rows:
+            # Nothing streamed: write the empty outputs in one piece
+            self.paths = write_results(ResultTable.from_records([]), self.output_path, self.formats)
+            return self.paths
+        # Arrow writers first: they finish into their sink files
+        for writer in self._arrow_writers.values():
+            writer.close()
+        for output_format, f in self._files.items():
+            if output_format == 'json':
+                f.write(']\n')
+            f.close()
+        for path in self.paths:
+            logger.info(f"Results saved to {path}")
+        return self.paths
@@ -0,0 +1,172 @@
+"""
+Rolling risk aggregates for the dashboard stats API
+Maintains running totals per school and cohort that are updated incrementally as students are scored
+"""
+
+import json
+import os
+import time
+import joblib
+from instrumentation import get_logger, metrics
+
+logger = get_logger('risk_aggregates')
+
+DEFAULT_SNAPSHOT_PATH = 'data/risk_aggregates.json'
+DEFAULT_GROUP_COLUMNS = ('school', 'cohort')
+RISK_KEYS = {'High': 'high', 'Medium': 'medium', 'Low': 'low'}
+
+def _empty_bucket():
+    return {
+        'students': 0,
+        'high': 0,
+        'medium': 0,
+        'low': 0,
+        'probability_sum': 0.0,
+        'intervention_students': 0,
+        'interventions': {}
+    }
+
+def _apply(bucket, contribution, sign):
+    """Add (sign=1) or retract (sign=-1) one student's contribution"""
+    risk_key, probability, categories, needs_intervention = contribution
+    bucket['students'] += sign
+    bucket[risk_key] += sign
+    bucket['probability_sum'] += sign * probability
+    bucket['intervention_students'] += sign * needs_intervention
+    interventions = bucket['interventions']
+    for category in categories:
+        count = interventions.get(category, 0) + sign
+        if count:
+            interventions[category] = count
+        else:
+            interventions.pop(category, None)
+
+def _render(bucket):
+    students = bucket['students']
+    return {
+        'students': students,
+        'high_risk': bucket['high'],
+        'medium_risk': bucket['medium'],
+        'low_risk': bucket['low'],
+        'mean_dropout_probability': bucket['probability_sum'] / students if students else 0.0,
+        'intervention_students': bucket['intervention_students'],
+        'interventions': dict(sorted(bucket['interventions'].items()))
+    }
+
+class RiskAggregator:
+    """Running High/Medium/Low totals, mean dropout probability and intervention counts
+    
+    Each student's latest contribution is remembered, so re-scoring a student
+    retracts the old contribution before adding the new one; totals are never
+    recomputed from raw results. Totals are kept overall and per value of each
+    grouping column (school and cohort by default).
+    """
+    
+    def __init__(self, snapshot_path=DEFAULT_SNAPSHOT_PATH, group_columns=DEFAULT_GROUP_COLUMNS):
+        self.snapshot_path = snapshot_path
+        self.state_path = os.path.splitext(snapshot_path)[0] + '_state.pkl'
+        self.group_columns = tuple(group_columns)
+        self.overall = _empty_bucket()
+        self.groups = {col: {} for col in self.group_columns}
+        # student_id -> (group values, contribution)
+        self.students = {}
+        self.dirty = False
+    
+    @classmethod
+    def load(cls, snapshot_path=DEFAULT_SNAPSHOT_PATH, group_columns=DEFAULT_GROUP_COLUMNS):
+        """Resume from persisted state, or start empty"""
+        aggregator = cls(snapshot_path, group_columns)
+        if os.path.exists(aggregator.state_path):
+            state = joblib.load(aggregator.state_path)
+            if tuple(state['group_columns']) == aggregator.group_columns:
+                aggregator.overall = state['overall']
+                aggregator.groups = state['groups']
+                aggregator.students = state['students']
+                logger.info(f"Resumed risk aggregates for {len(aggregator.students)} students")
+            else:
+                logger.warning(
+                    f"Grouping changed from {state['group_columns']} to {aggregator.group_columns}; "
+                    "starting fresh aggregates"
+                )
+        return aggregator
+    
+    def record(self, student_id, prediction, group_values=None):
+        """Fold one predictor result (as returned by DropoutPredictor.predict) into the totals"""
+        if 'error' in prediction:
+            return
+        
+        recommendations = prediction.get('recommendations', [])
+        contribution = (
+            RISK_KEYS[prediction['risk_level']],
+            float(prediction['dropout_probability']),
+            tuple(sorted({r['category'] for r in recommendations})),
+            int(any(r['priority'] in ('High', 'Medium') for r in recommendations))
+        )
+        group_values = group_values or {}
+        groups = tuple(str(group_values.get(col, 'unknown')) for col in self.group_columns)
+        
+        previous = self.students.get(student_id)
+        if previous is not None:
+            self._apply_all(previous[0], previous[1], -1)
+        self._apply_all(groups, contribution, 1)
+        self.students[student_id] = (groups, contribution)
+        self.dirty = True
+    
+    def update(self, student_ids, predictions, groups_df=None):
+        """Fold a scored chunk into the totals
+        
+        ``groups_df`` holds the grouping columns for the chunk, row-aligned with
+        ``predictions``; missing columns are recorded as "unknown".
+        """
+        with metrics.timer('aggregate'):
+            group_rows = [{}] * len(predictions)
+            if groups_df is not None:
+                present = [col for col in self.group_columns if col in groups_df.columns]
+                if present:
+                    group_rows = groups_df[present].to_dict('records')
+            for student_id, prediction, group_values in zip(student_ids, predictions, group_rows):
+                self.record(student_id, prediction, group_values)
+    
+    def _apply_all(self, groups, contribution, sign):
+        _apply(self.overall, contribution, sign)
+        for col, value in zip(self.group_columns, groups):
+            bucket = self.groups[col].get(value)
+            if bucket is None:
+                bucket = self.groups[col][value] = _empty_bucket()
+            _apply(bucket, contribution, sign)
+            if bucket['students'] == 0:
+                del self.groups[col][value]
+    
+    def snapshot(self):
+        """Compact dashboard view of the current totals"""
+        return {
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'overall': _render(self.overall),
+            'groups': {
+                col: {value: _render(bucket) for value, bucket in sorted(buckets.items())}
+                for col, buckets in self.groups.items()
+            }
+        }
+    
+    def save(self):
+        """Persist the dashboard snapshot and the resumable state atomically"""
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        
+        tmp_path = f'{self.state_path}.tmp'
+        joblib.dump({
+            'group_columns': self.group_columns,
+            'overall': self.overall,
+            'groups': self.groups,
+            'students': self.students
+        }, tmp_path)
+        os.replace(tmp_path, self.state_path)
+        
+        tmp_path = f'{self.snapshot_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, separators=(',', ':'))
+        os.replace(tmp_path, self.snapshot_path)
+        
+        self.dirty = False
+        logger.info(f"Risk aggregates saved to {self.snapshot_path}")
@@ -0,0 +1,163 @@
+"""
+Streaming top-k ranking of at-risk students
+Keeps one bounded heap per group while chunks are scored, so memory is O(groups x k) rather than O(rows)
+"""
+
+import heapq
+import json
+import os
+import time
+import numpy as np
+import pandas as pd
+from instrumentation import get_logger, metrics
+
+logger = get_logger('risk_ranking')
+
+DEFAULT_RANKING_PATH = 'results/top_risk_students.json'
+DEFAULT_RANK_COLUMN = 'school'
+# Group used when the input has no grouping column
+ALL_STUDENTS = 'all'
+
+def _native(value):
+    """NumPy scalars to plain Python for JSON"""
+    return value.item() if isinstance(value, np.generic) else value
+
+def risk_factors(prediction):
+    """Categories of a prediction's High/Medium priority recommendations
+    
+    Batch output records carried forward by delta scoring have no
+    recommendations, only the ``risk_factors`` stored in the manifest.
+    """
+    recommendations = prediction.get('recommendations')
+    if recommendations is None:
+        return list(prediction.get('risk_factors') or [])
+    return [r['category'] for r in recommendations if r['priority'] in ('High', 'Medium')]
+
+class TopKRanker:
+    """Highest dropout-probability students per group, maintained incrementally
+    
+    Each group holds a min-heap of at most ``k`` entries keyed on dropout
+    probability, so a new row only costs a comparison with the heap's floor.
+    Within a chunk the candidates are pre-selected with one vectorized sort,
+    and only rows that enter a heap keep their feature values; explanations
+    are rendered once, when the rankings are read. On ties the student
+    earlier in the input keeps the place: the chunk's integer index labels
+    give the input row, so delta runs that feed re-scored rows before carried
+    ones rank exactly like a full run.
+    """
+    
+    def __init__(self, k=200, group_column=DEFAULT_RANK_COLUMN, output_path=DEFAULT_RANKING_PATH,
+                 feature_columns=()):
+        if k < 1:
+            raise ValueError("k must be at least 1")
+        self.k = k
+        self.group_column = group_column
+        self.output_path = output_path
+        self.feature_columns = list(feature_columns)
+        self.heaps = {}
+        self.rows_seen = 0
+        self._sequence = 0
+    
+    def update(self, student_ids, predictions, chunk=None):
+        """Fold a scored chunk in; usable as a ``process_batch`` sink
+        
+        ``predictions`` may be predictor results or batch output records;
+        rows carrying an ``error`` are skipped.
+        """
+        with metrics.timer('rank'):
+            n_rows = len(predictions)
+            probabilities = np.fromiter(
+                (p.get('dropout_probability', np.nan) if 'error' not in p else np.nan for p in predictions),
+                dtype=np.float64, count=n_rows
+            )
+            if chunk is not None and self.group_column in chunk.columns:
+                group_codes, group_values = pd.factorize(chunk[self.group_column], use_na_sentinel=False)
+            else:
+                group_codes, group_values = np.zeros(n_rows, dtype=np.intp), [ALL_STUDENTS]
+            
+            arrival = self._sequence + np.arange(n_rows)
+            if chunk is not None and len(chunk.index) == n_rows and chunk.index.dtype.kind in 'iu':
+                input_rows = chunk.index.to_numpy()
+            else:
+                input_rows = arrival
+            
+            scored = np.flatnonzero(~np.isnan(probabilities))
+            # Sort by group, then by descending probability, then by input row
+            order = scored[np.lexsort((input_rows[scored], -probabilities[scored], group_codes[scored]))]
+            sorted_codes = group_codes[order]
+            starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]]) if len(order) else []
+            
+            features = None
+            for start, end in zip(starts, list(starts[1:]) + [len(order)]):
+                group = _native(group_values[sorted_codes[start]])
+                heap = self.heaps.setdefault(group, [])
+                for position in order[start:min(end, start + self.k)]:
+                    probability = probabilities[position]
+                    if len(heap) >= self.k and (probability, -input_rows[position]) <= heap[0][:2]:
+                        # Later candidates in this group rank no higher
+                        break
+                    if features is None:
+                        columns, features = self._feature_rows(chunk, n_rows)
+                    # Explanations are rendered at the end; keep only this row's values, not the chunk
+                    entry = (probability, -input_rows[position], -arrival[position],
+                             (student_ids[position], predictions[position], columns, features[position].copy()))
+                    if len(heap) < self.k:
+                        heapq.heappush(heap, entry)
+                    else:
+                        heapq.heapreplace(heap, entry)
+            
+            self._sequence += n_rows
+            self.rows_seen += n_rows
+    
+    def _feature_rows(self, chunk, n_rows):
+        """(columns, row-major object array) of the explanation features present in ``chunk``"""
+        present = [col for col in self.feature_columns if chunk is not None and col in chunk.columns]
+        if not present:
+            return present, np.empty((n_rows, 0), dtype=object)
+        return present, chunk[present].to_numpy(dtype=object)
+    
+    def _render(self, student_id, prediction, columns, values):
+        """Ranking entry with its explanation"""
+        recommendations = prediction.get('recommendations')
+        if recommendations is not None:
+            actions = [r['action'] for r in recommendations[:3]]
+        else:
+            # Batch output records only carry the recommended actions
+            actions = list(prediction.get('top_recommendations', []))
+        return {
+            'student_id': _native(student_id),
+            'dropout_probability': float(prediction['dropout_probability']),
+            'risk_level': prediction['risk_level'],
+            'explanation': {
+                'risk_factors': risk_factors(prediction),
+                'recommendations': actions,
+                'features': {col: _native(value) for col, value in zip(columns, values)}
+            }
+        }
+    
+    def rankings(self):
+        """Top-k lists per group, highest risk first"""
+        rankings = {}
+        for group, heap in self.heaps.items():
+            ranked = sorted(heap, reverse=True)
+            rankings[str(group)] = [
+                {'rank': rank, **self._render(*row)} for rank, (_, _, _, row) in enumerate(ranked, 1)
+            ]
+        return dict(sorted(rankings.items()))
+    
+    def save(self):
+        """Write the rankings atomically"""
+        directory = os.path.dirname(self.output_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.output_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                'k': self.k,
+                'group_column': self.group_column,
+                'rows_ranked': self.rows_seen,
+                'groups': self.rankings()
+            }, f, indent=2)
+        os.replace(tmp_path, self.output_path)
+        logger.info(f"Top {self.k} students for {len(self.heaps)} groups saved to {self.output_path}")
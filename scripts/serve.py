@@ -0,0 +1,227 @@
+"""
+Long-running prediction server
+Serves DropoutPredictor over HTTP with hot model reload from the model registry
+"""
+
+import argparse
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from concurrency import ConcurrencyConfig
+from encoding import UNSEEN_POLICIES
+from instrumentation import get_logger, metrics, setup_instrumentation
+from model_registry import DEFAULT_REGISTRY_ROOT, HotReloadingPredictor, ModelRegistry
+from risk_aggregates import DEFAULT_GROUP_COLUMNS, RiskAggregator
+from shadow_scoring import DEFAULT_CANDIDATES_DIR, DEFAULT_COMPARISON_PATH
+from similarity_index import DEFAULT_NEIGHBORS
+from prefork import ADMIN_SIGNALS, PreforkServer, memory_usage
+
+logger = get_logger('serve')
+
+class PredictionHandler(BaseHTTPRequestHandler):
+    """JSON endpoints: POST /predict, POST /similar, GET /health, GET /metrics, POST /admin/reload, POST /admin/rollback"""
+    
+    server_version = 'DropoutPredictor/1.0'
+    protocol_version = 'HTTP/1.1'
+    
+    def log_message(self, format, *args):
+        logger.debug(format % args)
+    
+    def _send(self, status, payload, content_type='application/json', model_version=None):
+        body = payload if isinstance(payload, bytes) else json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        if model_version:
+            self.send_header('X-Model-Version', model_version)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def _read_json(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        return json.loads(self.rfile.read(length) or b'{}')
+    
+    def do_GET(self):
+        app = self.server.app
+        if self.path == '/health':
+            self._send(200, {'status': 'ok', 'pid': os.getpid(), 'memory': memory_usage(),
+                             **app.predictor.status()},
+                       model_version=app.predictor.active_version)
+        elif self.path == '/metrics':
+            self._send(200, metrics.to_prometheus().encode(), content_type='text/plain; version=0.0.4')
+        else:
+            self._send(404, {'error': 'Not found'})
+    
+    def do_POST(self):
+        app = self.server.app
+        try:
+            if self.path == '/predict':
+                with metrics.timer('request', endpoint='predict'):
+                    status, payload, version = app.handle_predict(self._read_json())
+                self._send(status, payload, model_version=version)
+            elif self.path == '/similar':
+                with metrics.timer('request', endpoint='similar'):
+                    status, payload = app.handle_similar(self._read_json())
+                self._send(status, payload)
+            elif self.path in ('/admin/reload', '/admin/rollback'):
+                status, payload = app.handle_admin(self.path.rsplit('/', 1)[1])
+                self._send(status, payload)
+            else:
+                self._send(404, {'error': 'Not found'})
+        except (ValueError, KeyError) as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            logger.error(f"Request failed: {e}")
+            self._send(500, {'error': 'Prediction failed'})
+
+class PredictionService:
+    """Owns the hot-reloading predictor, the optional risk aggregator and shadow comparison"""
+    
+    def __init__(self, predictor, aggregator=None, flush_interval=30.0):
+        self.predictor = predictor
+        self.aggregator = aggregator
+        self.flush_interval = flush_interval
+        # Set in pre-fork workers: admin actions are forwarded to the supervising parent
+        self.supervisor_pid = None
+        self._aggregate_lock = threading.Lock()
+        self._stop = threading.Event()
+        if aggregator is not None or predictor.shadow_dir:
+            threading.Thread(target=self._flush_loop, name='v0-aggregate-flush', daemon=True).start()
+    
+    def handle_predict(self, payload):
+        """Score one student (a feature dict) or many ({"students": [...]})"""
+        if isinstance(payload, dict) and 'students' in payload:
+            students = payload['students']
+            results = self.predictor.batch_predict(students)
+            self._aggregate(students, results)
+            version = results[0]['model_version'] if results else self.predictor.active_version
+            return 200, {'model_version': version, 'results': results}, version
+        
+        result = self.predictor.predict(payload)
+        self._aggregate([payload], [result])
+        return 200, result, result['model_version']
+    
+    def handle_admin(self, action):
+        """Reload or roll back the model; in a pre-fork worker the parent does it for every worker"""
+        if self.supervisor_pid is not None:
+            os.kill(self.supervisor_pid, ADMIN_SIGNALS[action])
+            return 202, {'accepted': action, 'active_version': self.predictor.active_version,
+                         'note': 'applied by the parent process; workers are replaced once it has loaded'}
+        if action == 'reload':
+            swapped = self.predictor.check_for_update()
+            return 200, {'swapped': swapped, **self.predictor.status()}
+        self.predictor.rollback()
+        return 200, self.predictor.status()
+    
+    def handle_similar(self, payload):
+        """Nearest historical students of one student or many ({"students": [...], "k": 5})"""
+        if self.predictor.predictor.similarity is None:
+            return 503, {'error': 'No similarity index loaded'}
+        k = int(payload.pop('k', DEFAULT_NEIGHBORS)) if isinstance(payload, dict) else DEFAULT_NEIGHBORS
+        if isinstance(payload, dict) and 'students' in payload:
+            return 200, {'results': self.predictor.similar_students(payload['students'], k)}
+        return 200, self.predictor.similar_students([payload], k)[0]
+    
+    def _aggregate(self, students, results):
+        if self.aggregator is None:
+            return
+        with self._aggregate_lock:
+            for student, result in zip(students, results):
+                if 'student_id' in student:
+                    self.aggregator.record(student['student_id'], result, student)
+    
+    def _flush_loop(self):
+        while not self._stop.wait(self.flush_interval):
+            self.flush()
+    
+    def flush(self):
+        if self.aggregator is not None and self.aggregator.dirty:
+            with self._aggregate_lock:
+                self.aggregator.save()
+        shadow = self.predictor.predictor.shadow
+        if shadow is not None and shadow.dirty:
+            shadow.save()
+    
+    def shutdown(self):
+        self._stop.set()
+        self.predictor.stop()
+        self.flush()
+
+def build_service(args, watch=True, concurrency=None):
+    """Create the predictor (and aggregator) described by the CLI arguments"""
+    predictor = HotReloadingPredictor(
+        ModelRegistry(args.registry), poll_interval=args.poll_interval, unseen_policy=args.unseen_policy,
+        watch=watch, mmap_mode='r' if args.mmap else None, shadow_dir=args.shadow,
+        comparison_path=args.comparison_out, concurrency=concurrency
+    )
+    aggregator = None
+    if args.aggregates:
+        group_columns = [col.strip() for col in args.group_columns.split(',') if col.strip()]
+        aggregator = RiskAggregator.load(args.aggregates, group_columns)
+    return PredictionService(predictor, aggregator)
+
+def parse_args(argv=None):
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Dropout prediction server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--registry', default=DEFAULT_REGISTRY_ROOT, help="Model registry directory")
+    parser.add_argument('--poll-interval', type=float, default=5.0,
+                        help="Seconds between checks for a new active model version")
+    parser.add_argument('--unseen-policy', choices=UNSEEN_POLICIES, default='most_frequent')
+    parser.add_argument('--aggregates', default=None,
+                        help="Fold predictions carrying a student_id into this risk aggregates snapshot")
+    parser.add_argument('--group-columns', default=','.join(DEFAULT_GROUP_COLUMNS))
+    parser.add_argument('--metrics-out', default=None)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="Pre-fork this many worker processes sharing one loaded model")
+    parser.add_argument('--mmap', action='store_true',
+                        help="Memory-map model arrays from the joblib files instead of copying them")
+    parser.add_argument('--shadow', nargs='?', const=DEFAULT_CANDIDATES_DIR, default=None,
+                        help="Also score every trained candidate model and record live latency and agreement")
+    parser.add_argument('--comparison-out', default=DEFAULT_COMPARISON_PATH,
+                        help="Live model comparison snapshot written in shadow mode")
+    parser.add_argument('--cpus', type=int, default=None,
+                        help="CPU budget shared by all workers (default: V0_CPUS or every available CPU)")
+    parser.add_argument('--pin-cpus', action='store_true', default=None,
+                        help="Pin each worker to its own slice of the CPU budget")
+    args = parser.parse_args(argv)
+    if args.workers > 1 and args.aggregates:
+        parser.error("--aggregates needs a single process; run batch_predict.py to aggregate with --workers")
+    if args.workers > 1 and args.shadow:
+        parser.error("--shadow needs a single process so one comparison snapshot covers all traffic")
+    return args
+
+def main():
+    """Run the prediction server until interrupted"""
+    args = parse_args()
+    # Request metrics are always on for the /metrics endpoint
+    metrics.enable()
+    setup_instrumentation(metrics_out=args.metrics_out)
+    # Native thread pools are sized before the model is loaded; each worker gets an equal share
+    concurrency = ConcurrencyConfig(cpus=args.cpus, processes=args.workers, pin=args.pin_cpus)
+    concurrency.apply()
+    
+    # Pre-fork mode: the parent supervises and reloads, workers must not start watcher threads
+    service = build_service(args, watch=args.workers == 1, concurrency=concurrency)
+    server = ThreadingHTTPServer((args.host, args.port), PredictionHandler)
+    server.app = service
+    server.daemon_threads = True
+    
+    logger.info(f"Serving model {service.predictor.active_version} on http://{args.host}:{args.port}")
+    if args.workers > 1:
+        PreforkServer(server, service, workers=args.workers, poll_interval=args.poll_interval,
+                      concurrency=concurrency).run()
+        return
+    
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        logger.info("Shutting down")
+    finally:
+        server.server_close()
+        service.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,27 @@
 """
 Setup script to initialize the ML system
-Creates directories, generates data, and trains models
+Creates directories, generates data, and trains models as a stage graph with live output and resume
 """
 
+import argparse
+import importlib.util
+import json
 import os
 import sys
 import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Per-stage status and timings of the last run, read by --resume
+STATE_PATH = 'logs/setup_state.json'
+
+_print_lock = threading.Lock()
+
+def log(stage_name, message):
+    """Print one line tagged with its stage; stages run concurrently"""
+    with _print_lock:
+        print(f"[{stage_name}] {message}", flush=True)
 
 def create_directories():
     """Create required directories"""
@@ -14,80 +30,55 @@ def create_directories():
     for directory in directories:
         if not os.path.exists(directory):
             os.makedirs(directory)
-            print(f"[v0] Created directory: {directory}")
+            log('directories', f"[v0] Created directory: {directory}")
         else:
-            print(f"[v0] Directory already exists: {directory}")
+            log('directories', f"[v0] Directory already exists: {directory}")
+    return True
 
 def check_dependencies():
-    """Check if required Python packages are installed"""
+    """Check if required Python packages are installed, without importing them"""
     required_packages = [
-        'pandas', 'numpy', 'sklearn', 'xgboost', 
+        'pandas', 'numpy', 'sklearn', 'xgboost',
         'matplotlib', 'seaborn', 'joblib'
     ]
     
     missing_packages = []
     
     for package in required_packages:
-        try:
-            __import__(package)
-            print(f"[v0] ✓ {package} is installed")
-        except ImportError:
+        # find_spec only locates the package; importing sklearn or matplotlib takes seconds
+        if importlib.util.find_spec(package) is not None:
+            log('dependencies', f"[v0] ✓ {package} is installed")
+        else:
             missing_packages.append(package)
-            print(f"[v0] ✗ {package} is NOT installed")
+            log('dependencies', f"[v0] ✗ {package} is NOT installed")
     
     if missing_packages:
-        print(f"\n[v0] Missing packages: {', '.join(missing_packages)}")
-        print("[v0] Install them with: pip install -r requirements.txt")
+        log('dependencies', f"[v0] Missing packages: {', '.join(missing_packages)}")
+        log('dependencies', "[v0] Install them with: pip install -r requirements.txt")
         return False
     
-    print("\n[v0] All dependencies are installed!")
+    log('dependencies', "[v0] All dependencies are installed!")
     return True
 
-def run_preprocessing():
-    """Run data preprocessing script"""
-    print("\n[v0] Running data preprocessing...")
+def run_script(stage_name, command):
+    """Run a child Python script, streaming its output live as it is produced"""
+    env = dict(os.environ, PYTHONUNBUFFERED='1')
     try:
-        result = subprocess.run(
-            [sys.executable, 'scripts/data_preprocessing.py'],
-            capture_output=True,
-            text=True
+        process = subprocess.Popen(
+            [sys.executable, *command],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.STDOUT,
+            text=True,
+            bufsize=1,
+            env=env
         )
-        
-        if result.returncode == 0:
-            print("[v0] ✓ Data preprocessing completed successfully")
-            print(result.stdout)
-            return True
-        else:
-            print("[v0] ✗ Data preprocessing failed")
-            print(result.stderr)
-            return False
     except Exception as e:
-        print(f"[v0] Error running preprocessing: {e}")
+        log(stage_name, f"[v0] Error running {command[0]}: {e}")
         return False
-
-def run_training():
-    """Run model training script"""
-    print("\n[v0] Running model training...")
-    print("[v0] This may take several minutes...")
     
-    try:
-        result = subprocess.run(
-            [sys.executable, 'scripts/train_models.py'],
-            capture_output=True,
-            text=True
-        )
-        
-        if result.returncode == 0:
-            print("[v0] ✓ Model training completed successfully")
-            print(result.stdout)
-            return True
-        else:
-            print("[v0] ✗ Model training failed")
-            print(result.stderr)
-            return False
-    except Exception as e:
-        print(f"[v0] Error running training: {e}")
-        return False
+    for line in process.stdout:
+        log(stage_name, line.rstrip())
+    return process.wait() == 0
 
 def verify_setup():
     """Verify that all required files exist"""
@@ -99,52 +90,168 @@ def verify_setup():
         'models/model_comparison.json'
     ]
     
-    print("\n[v0] Verifying setup...")
     all_exist = True
     
     for filepath in required_files:
         if os.path.exists(filepath):
             size = os.path.getsize(filepath)
-            print(f"[v0] ✓ {filepath} ({size} bytes)")
+            log('verify', f"[v0] ✓ {filepath} ({size} bytes)")
         else:
-            print(f"[v0] ✗ {filepath} NOT FOUND")
+            log('verify', f"[v0] ✗ {filepath} NOT FOUND")
             all_exist = False
     
     return all_exist
 
+class Stage:
+    """One node of the setup graph
+    
+    ``action`` is a callable returning True on success. A stage is skipped
+    on ``--resume`` when it succeeded last time, its ``outputs`` still exist
+    and none of its dependencies had to run again.
+    """
+    
+    def __init__(self, name, description, action, deps=(), outputs=()):
+        self.name = name
+        self.description = description
+        self.action = action
+        self.deps = tuple(deps)
+        self.outputs = tuple(outputs)
+
+# In dependency order; stages whose dependencies are met run concurrently
+STAGES = [
+    Stage('directories', "Creating directories", create_directories,
+          outputs=['data', 'models', 'logs']),
+    Stage('dependencies', "Checking dependencies", check_dependencies),
+    Stage('generate_data', "Generating data",
+          lambda: run_script('generate_data', ['scripts/data_preprocessing.py', '--generate-only']),
+          deps=['directories'], outputs=['data/student_data.csv']),
+    Stage('preprocess', "Preprocessing data",
+          lambda: run_script('preprocess', ['scripts/data_preprocessing.py']),
+          deps=['dependencies', 'generate_data'], outputs=['data/processed_data.pkl', 'models/preprocessor.pkl']),
+    Stage('train', "Training models (this may take several minutes)",
+          lambda: run_script('train', ['scripts/train_models.py']),
+          deps=['preprocess'], outputs=['models/final_model.pkl', 'models/model_comparison.json']),
+    Stage('verify', "Verifying setup", verify_setup, deps=['train'])
+]
+
+class SetupRunner:
+    """Runs the stage graph, recording status and timings after every stage"""
+    
+    def __init__(self, stages, state_path=STATE_PATH, resume=False):
+        self.stages = {stage.name: stage for stage in stages}
+        self.state_path = state_path
+        self.resume = resume
+        self.state = {}
+    
+    def _load_previous(self):
+        if not (self.resume and os.path.exists(self.state_path)):
+            return {}
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)['stages']
+        except (ValueError, KeyError) as e:
+            print(f"[v0] Ignoring unreadable setup state {self.state_path}: {e}")
+            return {}
+    
+    def _save_state(self):
+        directory = os.path.dirname(self.state_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.state_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'), 'stages': self.state}, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+    
+    def _reusable(self, stage, previous, skipped):
+        return (
+            previous.get(stage.name, {}).get('status') in ('ok', 'skipped')
+            and all(dep in skipped for dep in stage.deps)
+            and all(os.path.exists(path) for path in stage.outputs)
+        )
+    
+    def _run_stage(self, stage):
+        log(stage.name, f"{stage.description}...")
+        started = time.perf_counter()
+        try:
+            ok = bool(stage.action())
+        except Exception as e:
+            log(stage.name, f"[v0] Error: {e}")
+            ok = False
+        return ok, time.perf_counter() - started
+    
+    def run(self):
+        """Run every stage not reusable from the previous run; returns True if all succeeded"""
+        previous = self._load_previous()
+        done = set()
+        for stage in self.stages.values():
+            if self._reusable(stage, previous, done):
+                done.add(stage.name)
+                self.state[stage.name] = {**previous[stage.name], 'status': 'skipped'}
+                log(stage.name, "[v0] Completed in a previous run; skipping")
+        
+        pending = [name for name in self.stages if name not in done]
+        running = {}
+        failed = []
+        with ThreadPoolExecutor(max_workers=len(self.stages)) as executor:
+            while pending or running:
+                if not failed:
+                    for name in [name for name in pending if set(self.stages[name].deps) <= done]:
+                        pending.remove(name)
+                        self.state[name] = {'status': 'running', 'started_at': time.time()}
+                        running[executor.submit(self._run_stage, self.stages[name])] = name
+                if not running:
+                    break
+                
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    ok, seconds = future.result()
+                    self.state[name].update(status='ok' if ok else 'failed', seconds=round(seconds, 3))
+                    if ok:
+                        done.add(name)
+                        log(name, f"[v0] ✓ Done in {seconds:.1f}s")
+                    else:
+                        failed.append(name)
+                        log(name, f"[v0] ✗ Failed after {seconds:.1f}s")
+                self._save_state()
+        
+        for name in pending:
+            self.state[name] = {'status': 'not run'}
+        self._save_state()
+        return not failed
+    
+    def timing_lines(self):
+        """Per-stage status and duration"""
+        return [
+            f"{name:<14} {entry['status']:<8} {entry['seconds']:>8.1f}s" if 'seconds' in entry
+            else f"{name:<14} {entry['status']}"
+            for name, entry in self.state.items()
+        ]
+
 def main():
     """Main setup function"""
+    parser = argparse.ArgumentParser(description="Initialize the ML system")
+    parser.add_argument('--resume', action='store_true',
+                        help="Skip stages that succeeded in the previous run and continue from the first failure")
+    parser.add_argument('--state', default=STATE_PATH, help="Where stage status and timings are recorded")
+    args = parser.parse_args()
+    
     print("=" * 60)
     print("Student Dropout Prediction System - Setup")
     print("=" * 60)
     
-    # Step 1: Create directories
-    print("\n[Step 1/5] Creating directories...")
-    create_directories()
+    started = time.perf_counter()
+    runner = SetupRunner(STAGES, state_path=args.state, resume=args.resume)
+    succeeded = runner.run()
     
-    # Step 2: Check dependencies
-    print("\n[Step 2/5] Checking dependencies...")
-    if not check_dependencies():
-        print("\n[v0] Setup failed: Missing dependencies")
-        print("[v0] Run: pip install -r requirements.txt")
-        sys.exit(1)
-    
-    # Step 3: Run preprocessing
-    print("\n[Step 3/5] Preprocessing data...")
-    if not run_preprocessing():
-        print("\n[v0] Setup failed: Preprocessing error")
-        sys.exit(1)
-    
-    # Step 4: Train models
-    print("\n[Step 4/5] Training models...")
-    if not run_training():
-        print("\n[v0] Setup failed: Training error")
-        sys.exit(1)
+    print(f"\n[v0] Stage timings ({time.perf_counter() - started:.1f}s total):")
+    for line in runner.timing_lines():
+        print(f"  {line}")
     
-    # Step 5: Verify setup
-    print("\n[Step 5/5] Verifying setup...")
-    if not verify_setup():
-        print("\n[v0] Setup incomplete: Some files are missing")
+    if not succeeded:
+        failed = [name for name, entry in runner.state.items() if entry['status'] == 'failed']
+        print(f"\n[v0] Setup failed at: {', '.join(failed)}")
+        print("[v0] Fix the error above, then run: python scripts/setup.py --resume")
         sys.exit(1)
     
     print("\n" + "=" * 60)
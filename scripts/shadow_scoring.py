@@ -0,0 +1,216 @@
+"""
+Shadow scoring of every trained candidate model
+Scores each batch with all candidates on one shared preprocessing pass and tracks live latency and agreement
+"""
+
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import joblib
+import numpy as np
+from instrumentation import get_logger, metrics
+
+logger = get_logger('shadow_scoring')
+
+DEFAULT_CANDIDATES_DIR = 'models/candidates'
+DEFAULT_COMPARISON_PATH = 'models/live_model_comparison.json'
+MANIFEST_FILE = 'manifest.json'
+
+def candidate_file_name(model_name):
+    """File name a trained model is saved under, e.g. 'Random Forest' -> random_forest.pkl"""
+    return f'{model_name.lower().replace(" ", "_")}.pkl'
+
+def save_candidates(models, results, best_model_name, preprocessor_version, directory=DEFAULT_CANDIDATES_DIR):
+    """Save every trained model plus a manifest describing them"""
+    from predict import model_file_version
+    
+    os.makedirs(directory, exist_ok=True)
+    entries = {}
+    for model_name, model in models.items():
+        path = os.path.join(directory, candidate_file_name(model_name))
+        joblib.dump(model, path)
+        entries[model_name] = {
+            'file': candidate_file_name(model_name),
+            'version': model_file_version(path),
+            'accuracy': float(results[model_name]['accuracy']),
+            'auc_roc': float(results[model_name]['auc_roc'])
+        }
+    
+    tmp_path = os.path.join(directory, f'{MANIFEST_FILE}.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({
+            'best_model': best_model_name,
+            'preprocessor_version': preprocessor_version,
+            'models': entries
+        }, f, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST_FILE))
+    return entries
+
+def load_candidates(directory=DEFAULT_CANDIDATES_DIR, mmap_mode=None):
+    """Return (manifest, {model_name: model}) for the saved candidates"""
+    with open(os.path.join(directory, MANIFEST_FILE)) as f:
+        manifest = json.load(f)
+    models = {
+        model_name: joblib.load(os.path.join(directory, entry['file']), mmap_mode=mmap_mode)
+        for model_name, entry in manifest['models'].items()
+    }
+    return manifest, models
+
+def _empty_stats():
+    return {
+        'batches': 0,
+        'rows': 0,
+        'seconds': 0.0,
+        'max_batch_seconds': 0.0,
+        'prediction_agreements': 0,
+        'risk_level_agreements': 0,
+        'abs_probability_diff_sum': 0.0
+    }
+
+class ShadowScorer:
+    """Scores batches with the primary model and every shadow candidate concurrently
+    
+    Shadow models run on a thread pool while the primary model scores on the
+    calling thread; scikit-learn, XGBoost and BLAS release the GIL inside
+    predict, so a batch costs roughly the slowest model rather than the sum.
+    Only the primary model's output is returned.
+    """
+    
+    def __init__(self, primary_name, primary_version, shadows, snapshot_path=DEFAULT_COMPARISON_PATH):
+        self.primary_name = primary_name
+        self.primary_version = primary_version
+        self.shadows = shadows
+        self.snapshot_path = snapshot_path
+        self.stats = {name: _empty_stats() for name in (primary_name, *shadows)}
+        self.dirty = False
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(len(shadows), 1), thread_name_prefix='v0-shadow')
+    
+    @classmethod
+    def from_candidates(cls, predictor, directory=DEFAULT_CANDIDATES_DIR, snapshot_path=DEFAULT_COMPARISON_PATH,
+                        mmap_mode=None):
+        """Build a scorer around ``predictor`` from the saved candidates, or None if unusable"""
+        try:
+            manifest, models = load_candidates(directory, mmap_mode)
+        except FileNotFoundError:
+            logger.warning(f"No candidate models in {directory}; shadow scoring disabled")
+            return None
+        
+        # Shadows reuse the primary's encoded and scaled features
+        if manifest.get('preprocessor_version') != predictor.preprocessor_version:
+            logger.warning(
+                f"Candidates in {directory} were trained with preprocessor "
+                f"{manifest.get('preprocessor_version')}, not {predictor.preprocessor_version}; "
+                "shadow scoring disabled"
+            )
+            return None
+        
+        primary_name = f'model {predictor.model_version}'
+        shadows = {}
+        for model_name, model in models.items():
+            if manifest['models'][model_name]['version'] == predictor.model_version:
+                primary_name = model_name
+            else:
+                shadows[model_name] = predictor.concurrency.configure(model)
+        logger.info(f"Shadow scoring {sorted(shadows)} alongside primary {primary_name}")
+        return cls(primary_name, predictor.model_version, shadows, snapshot_path)
+    
+    def _run(self, model, X):
+        started = time.perf_counter()
+        predictions = model.predict(X)
+        probabilities = model.predict_proba(X)
+        return predictions, probabilities, time.perf_counter() - started
+    
+    def score(self, model, X, valid=None):
+        """Score ``X`` with the primary ``model`` and all shadows; returns the primary's output"""
+        futures = {name: self._executor.submit(self._run, shadow, X) for name, shadow in self.shadows.items()}
+        predictions, probabilities, seconds = self._run(model, X)
+        
+        outputs = {}
+        for name, future in futures.items():
+            try:
+                outputs[name] = future.result()
+            except Exception as e:
+                # A failing shadow never affects the primary answer
+                logger.error(f"Shadow model {name} failed: {e}")
+                metrics.increment('shadow_errors', model=name)
+        
+        self._record(predictions, probabilities, seconds, outputs, valid)
+        return predictions, probabilities
+    
+    def _record(self, predictions, probabilities, seconds, outputs, valid):
+        from predict import risk_levels
+        
+        if valid is not None:
+            predictions, probabilities = predictions[valid], probabilities[valid]
+        dropout_probs = probabilities[:, 1]
+        levels = risk_levels(dropout_probs)
+        rows = len(predictions)
+        
+        with self._lock:
+            self._accumulate(self.primary_name, rows, seconds)
+            stats = self.stats[self.primary_name]
+            stats['prediction_agreements'] += rows
+            stats['risk_level_agreements'] += rows
+            
+            for name, (shadow_predictions, shadow_probabilities, shadow_seconds) in outputs.items():
+                if valid is not None:
+                    shadow_predictions, shadow_probabilities = shadow_predictions[valid], shadow_probabilities[valid]
+                shadow_dropout = shadow_probabilities[:, 1]
+                self._accumulate(name, rows, shadow_seconds)
+                stats = self.stats[name]
+                stats['prediction_agreements'] += int(np.sum(shadow_predictions == predictions))
+                stats['risk_level_agreements'] += int(np.sum(risk_levels(shadow_dropout) == levels))
+                stats['abs_probability_diff_sum'] += float(np.abs(shadow_dropout - dropout_probs).sum())
+            self.dirty = True
+        
+        slowest = max([seconds, *(output[2] for output in outputs.values())])
+        metrics.observe('shadow_overhead_seconds', max(slowest - seconds, 0.0))
+    
+    def _accumulate(self, name, rows, seconds):
+        stats = self.stats[name]
+        stats['batches'] += 1
+        stats['rows'] += rows
+        stats['seconds'] += seconds
+        stats['max_batch_seconds'] = max(stats['max_batch_seconds'], seconds)
+        metrics.observe('shadow_model_seconds', seconds, model=name)
+    
+    def snapshot(self):
+        """Live per-model latency and agreement with the primary model"""
+        with self._lock:
+            models = {}
+            for name, stats in self.stats.items():
+                rows = stats['rows']
+                models[name] = {
+                    'primary': name == self.primary_name,
+                    'batches': stats['batches'],
+                    'rows': rows,
+                    'mean_batch_ms': stats['seconds'] / stats['batches'] * 1000 if stats['batches'] else 0.0,
+                    'max_batch_ms': stats['max_batch_seconds'] * 1000,
+                    'us_per_row': stats['seconds'] / rows * 1e6 if rows else 0.0,
+                    'prediction_agreement': stats['prediction_agreements'] / rows if rows else None,
+                    'risk_level_agreement': stats['risk_level_agreements'] / rows if rows else None,
+                    'mean_abs_probability_diff': stats['abs_probability_diff_sum'] / rows if rows else None
+                }
+        return {
+            'updated_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'primary_model': self.primary_name,
+            'primary_version': self.primary_version,
+            'models': models
+        }
+    
+    def save(self):
+        """Write the comparison snapshot atomically for the dashboard"""
+        directory = os.path.dirname(self.snapshot_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f'{self.snapshot_path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+        os.replace(tmp_path, self.snapshot_path)
+        self.dirty = False
+    
+    def close(self):
+        self._executor.shutdown(wait=True)
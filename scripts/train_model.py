@@ -7,19 +7,22 @@ using Support Vector Machines (SVM), Random Forest, and XGBoost.
 Features:
 - Data preprocessing (handling missing values, normalization, encoding)
 - Multiple algorithm comparison
-- AUC-ROC evaluation
+- AUC-ROC evaluation with shared cross-validation folds
+- Stacked ensemble over out-of-fold probabilities
 - Feature importance analysis
 """
 
 import numpy as np
 import pandas as pd
-from sklearn.model_selection import train_test_split, cross_val_score
+from sklearn.model_selection import train_test_split
 from sklearn.preprocessing import StandardScaler, LabelEncoder
 from sklearn.svm import SVC
+from sklearn.linear_model import LogisticRegression
 from sklearn.ensemble import RandomForestClassifier
 from xgboost import XGBClassifier
 from sklearn.metrics import roc_auc_score, roc_curve, classification_report
 import matplotlib.pyplot as plt
+from cv_engine import CVEngine
 
 # Generate synthetic dataset for demonstration
 np.random.seed(42)
@@ -102,46 +105,66 @@ models = {
 }
 
 results = {}
+# Stratified folds computed once; each model is fit once per fold and never on the full split
+cv = CVEngine(y_train)
 
 for name, model in models.items():
     print(f"\n{name}:")
     print("-" * 30)
     
-    # Train model
+    # Train model (out-of-fold probabilities are kept for stacking)
     if name == 'SVM':
-        model.fit(X_train_scaled, y_train)
-        y_pred_proba = model.predict_proba(X_test_scaled)[:, 1]
+        X_fit, X_eval = X_train_scaled, X_test_scaled
     else:
-        model.fit(X_train, y_train)
-        y_pred_proba = model.predict_proba(X_test)[:, 1]
+        X_fit, X_eval = X_train, X_test
+    cv_result = cv.cross_validate(name, model, X_fit)
+    print(f"Cross-validation AUC-ROC: {cv_result.mean_auc:.4f} (+/- {cv_result.std_auc:.4f})")
     
-    # Calculate AUC-ROC
+    # Test-set probabilities are the mean of the fold models
+    y_pred_proba = cv.predict_proba(name, X_eval)[:, 1]
     auc_score = roc_auc_score(y_test, y_pred_proba)
     print(f"AUC-ROC Score: {auc_score:.4f}")
     
-    # Cross-validation
-    if name == 'SVM':
-        cv_scores = cross_val_score(model, X_train_scaled, y_train, cv=5, scoring='roc_auc')
-    else:
-        cv_scores = cross_val_score(model, X_train, y_train, cv=5, scoring='roc_auc')
-    
-    print(f"Cross-validation AUC-ROC: {cv_scores.mean():.4f} (+/- {cv_scores.std():.4f})")
-    
     results[name] = {
-        'model': model,
+        'model': cv_result,
         'auc': auc_score,
         'y_pred_proba': y_pred_proba
     }
 
+# Stacked Ensemble
+print("\n" + "="*50)
+print("STACKED ENSEMBLE")
+print("="*50)
+
+# The meta-model learns from the out-of-fold probabilities, so no base model is refit
+base_names = list(models)
+meta_model = LogisticRegression()
+meta_model.fit(cv.oof_matrix(base_names), y_train)
+stacked_proba = meta_model.predict_proba(
+    np.column_stack([results[name]['y_pred_proba'] for name in base_names])
+)[:, 1]
+stacked_auc = roc_auc_score(y_test, stacked_proba)
+print(f"Meta-model weights: {dict(zip(base_names, meta_model.coef_[0].round(3).tolist()))}")
+print(f"AUC-ROC Score: {stacked_auc:.4f}")
+
+results['Stacked Ensemble'] = {
+    'model': meta_model,
+    'auc': stacked_auc,
+    'y_pred_proba': stacked_proba
+}
+
+cv_summary = cv.summary()
+print(f"\nFits: {cv_summary['fits']} ({cv_summary['fits_saved']} full-split fits saved by predicting with the fold models)")
+
 # Feature Importance (Random Forest)
 print("\n" + "="*50)
 print("FEATURE IMPORTANCE (Random Forest)")
 print("="*50)
 
-rf_model = results['Random Forest']['model']
+rf_folds = results['Random Forest']['model'].models
 feature_importance = pd.DataFrame({
     'feature': feature_columns,
-    'importance': rf_model.feature_importances_
+    'importance': np.mean([model.feature_importances_ for model in rf_folds], axis=0)
 }).sort_values('importance', ascending=False)
 
 print(feature_importance)
@@ -3,6 +3,7 @@ Model Training and Comparison for Student Dropout Prediction
 Implements SVM, Random Forest, XGBoost with hyperparameter tuning
 """
 
+import argparse
 import pandas as pd
 import numpy as np
 import joblib
@@ -11,31 +12,84 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.svm import SVC
 from sklearn.linear_model import LogisticRegression
 from xgboost import XGBClassifier
-from sklearn.model_selection import GridSearchCV, RandomizedSearchCV, cross_val_score
+from sklearn.model_selection import ParameterGrid, ParameterSampler, train_test_split
 from sklearn.metrics import (
     classification_report, confusion_matrix, roc_auc_score,
     roc_curve, precision_recall_curve, accuracy_score
 )
 import matplotlib.pyplot as plt
 import seaborn as sns
+from concurrency import ConcurrencyConfig
+from cv_engine import CVEngine
+from feature_store import DEFAULT_FEATURE_STORE_DIR, FeatureStore
+from instrumentation import get_logger, metrics, setup_instrumentation
+from model_compression import (DEFAULT_AUC_TOLERANCE, DEFAULT_MAX_PROBABILITY_DRIFT, DEFAULT_REPORT_PATH,
+                               ModelCompressor, compressible)
+from model_registry import ModelRegistry
+from predict import model_file_version
+from shadow_scoring import DEFAULT_CANDIDATES_DIR, save_candidates
+from similarity_index import DEFAULT_SIMILARITY_INDEX_PATH, SimilarityIndex
+
+logger = get_logger('train_models')
 
 class ModelTrainer:
     """Train and compare multiple classification models"""
     
-    def __init__(self):
+    def __init__(self, concurrency=None, feature_store=None, as_of=None, compress=True,
+                 auc_tolerance=DEFAULT_AUC_TOLERANCE, max_probability_drift=DEFAULT_MAX_PROBABILITY_DRIFT):
         self.models = {}
         self.results = {}
         self.best_model = None
         self.best_model_name = None
+        # Shared CV folds and fold fits, created for the training labels
+        self.cv = None
+        # Parallel CV fits with single-threaded native libraries, sized from one CPU budget
+        self.concurrency = concurrency or ConcurrencyConfig(training=True)
+        # Read scaled features from a FeatureStore snapshot instead of data/processed_data.pkl
+        self.feature_store = feature_store
+        self.as_of = as_of
+        # Publish a pruned/quantized variant of the best model when it stays within the AUC and probability tolerances
+        self.compress = compress
+        self.auc_tolerance = auc_tolerance
+        self.max_probability_drift = max_probability_drift
+        # student_id by row label of data/processed_data.pkl (feature store frames are indexed by it)
+        self.student_ids = None
         
     def load_data(self):
         """Load preprocessed data"""
+        if self.feature_store is not None:
+            return self.load_store_data()
         data = joblib.load('data/processed_data.pkl')
+        self.student_ids = data.get('student_id')
         return data['X_train'], data['X_test'], data['y_train'], data['y_test']
     
+    def load_store_data(self):
+        """Split the labelled students of the feature store snapshot as data_preprocessing.py does"""
+        snapshot = self.feature_store.snapshot(self.as_of)
+        if snapshot is None:
+            raise FileNotFoundError(f"No feature store snapshot in {self.feature_store.root}")
+        if snapshot.meta['preprocessor_version'] != model_file_version('models/preprocessor.pkl'):
+            raise ValueError(f"Feature store snapshot {snapshot.as_of} was built with another preprocessor; "
+                             "update the store first")
+        
+        X, y = snapshot.training_data()
+        logger.info(f"Loaded {len(X)} labelled students from feature store snapshot {snapshot.as_of}")
+        return train_test_split(X, y, test_size=0.2, random_state=42, stratify=y)
+    
+    def tune(self, model_name, estimator, candidates, X_train, y_train):
+        """Search ``candidates`` on the shared CV folds and refit the best on all training data"""
+        if self.cv is None:
+            self.cv = CVEngine(y_train, n_jobs=self.concurrency.n_jobs)
+        result = self.cv.search(model_name, self.concurrency.configure(estimator), candidates, X_train)
+        
+        logger.info(f"{model_name} best parameters: {result.params}")
+        logger.info(f"{model_name} best CV score: {result.mean_auc:.4f}")
+        
+        return self.cv.refit(model_name, X_train)
+    
     def train_logistic_regression(self, X_train, y_train):
         """Train Logistic Regression with hyperparameter tuning"""
-        print("\n[v0] Training Logistic Regression...")
+        logger.info("Training Logistic Regression...")
         
         param_grid = {
             'C': [0.001, 0.01, 0.1, 1, 10, 100],
@@ -45,19 +99,11 @@ class ModelTrainer:
         }
         
         lr = LogisticRegression(random_state=42)
-        grid_search = GridSearchCV(
-            lr, param_grid, cv=5, scoring='roc_auc', n_jobs=-1, verbose=1
-        )
-        grid_search.fit(X_train, y_train)
-        
-        print(f"[v0] Best Parameters: {grid_search.best_params_}")
-        print(f"[v0] Best CV Score: {grid_search.best_score_:.4f}")
-        
-        return grid_search.best_estimator_
+        return self.tune('Logistic Regression', lr, ParameterGrid(param_grid), X_train, y_train)
     
     def train_random_forest(self, X_train, y_train):
         """Train Random Forest with hyperparameter tuning"""
-        print("\n[v0] Training Random Forest...")
+        logger.info("Training Random Forest...")
         
         param_grid = {
             'n_estimators': [100, 200, 300],
@@ -68,20 +114,12 @@ class ModelTrainer:
         }
         
         rf = RandomForestClassifier(random_state=42)
-        random_search = RandomizedSearchCV(
-            rf, param_grid, n_iter=20, cv=5, scoring='roc_auc',
-            n_jobs=-1, verbose=1, random_state=42
-        )
-        random_search.fit(X_train, y_train)
-        
-        print(f"[v0] Best Parameters: {random_search.best_params_}")
-        print(f"[v0] Best CV Score: {random_search.best_score_:.4f}")
-        
-        return random_search.best_estimator_
+        candidates = ParameterSampler(param_grid, n_iter=20, random_state=42)
+        return self.tune('Random Forest', rf, candidates, X_train, y_train)
     
     def train_svm(self, X_train, y_train):
         """Train SVM with hyperparameter tuning"""
-        print("\n[v0] Training SVM...")
+        logger.info("Training SVM...")
         
         param_grid = {
             'C': [0.1, 1, 10, 100],
@@ -90,19 +128,11 @@ class ModelTrainer:
         }
         
         svm = SVC(probability=True, random_state=42)
-        grid_search = GridSearchCV(
-            svm, param_grid, cv=5, scoring='roc_auc', n_jobs=-1, verbose=1
-        )
-        grid_search.fit(X_train, y_train)
-        
-        print(f"[v0] Best Parameters: {grid_search.best_params_}")
-        print(f"[v0] Best CV Score: {grid_search.best_score_:.4f}")
-        
-        return grid_search.best_estimator_
+        return self.tune('SVM', svm, ParameterGrid(param_grid), X_train, y_train)
     
     def train_xgboost(self, X_train, y_train):
         """Train XGBoost with hyperparameter tuning"""
-        print("\n[v0] Training XGBoost...")
+        logger.info("Training XGBoost...")
         
         param_grid = {
             'n_estimators': [100, 200, 300],
@@ -113,20 +143,12 @@ class ModelTrainer:
         }
         
         xgb = XGBClassifier(random_state=42, eval_metric='logloss')
-        random_search = RandomizedSearchCV(
-            xgb, param_grid, n_iter=20, cv=5, scoring='roc_auc',
-            n_jobs=-1, verbose=1, random_state=42
-        )
-        random_search.fit(X_train, y_train)
-        
-        print(f"[v0] Best Parameters: {random_search.best_params_}")
-        print(f"[v0] Best CV Score: {random_search.best_score_:.4f}")
-        
-        return random_search.best_estimator_
+        candidates = ParameterSampler(param_grid, n_iter=20, random_state=42)
+        return self.tune('XGBoost', xgb, candidates, X_train, y_train)
     
     def evaluate_model(self, model, X_test, y_test, model_name):
         """Comprehensive model evaluation"""
-        print(f"\n[v0] Evaluating {model_name}...")
+        logger.info(f"Evaluating {model_name}...")
         
         # Predictions
         y_pred = model.predict(X_test)
@@ -136,16 +158,14 @@ class ModelTrainer:
         accuracy = accuracy_score(y_test, y_pred)
         auc_roc = roc_auc_score(y_test, y_pred_proba)
         
-        print(f"\n[v0] {model_name} Results:")
-        print(f"Accuracy: {accuracy:.4f}")
-        print(f"AUC-ROC: {auc_roc:.4f}")
-        print("\nClassification Report:")
-        print(classification_report(y_test, y_pred, target_names=['Graduate', 'Dropout']))
-        
         # Confusion Matrix
         cm = confusion_matrix(y_test, y_pred)
-        print("\nConfusion Matrix:")
-        print(cm)
+        logger.info(
+            f"{model_name} results: accuracy {accuracy:.4f}, AUC-ROC {auc_roc:.4f}\n"
+            "Classification report:\n"
+            f"{classification_report(y_test, y_pred, target_names=['Graduate', 'Dropout']).rstrip()}\n"
+            f"Confusion matrix:\n{cm}"
+        )
         
         # Store results
         self.results[model_name] = {
@@ -160,6 +180,13 @@ class ModelTrainer:
             'y_test': y_test.tolist()
         }
         
+        # Out-of-fold metrics come from the fold fits kept by the search
+        if self.cv is not None and model_name in self.cv.results:
+            cv_metrics = self.cv.result(model_name).summary(self.cv.y)
+            self.results[model_name]['cv'] = cv_metrics
+            logger.info(f"{model_name} out-of-fold AUC-ROC: {cv_metrics['oof_auc']:.4f} "
+                        f"(folds {cv_metrics['cv_auc_mean']:.4f} +/- {cv_metrics['cv_auc_std']:.4f})")
+        
         return accuracy, auc_roc
     
     def plot_feature_importance(self, model, feature_names, model_name):
@@ -176,9 +203,9 @@ class ModelTrainer:
             plt.savefig(f'models/{model_name.lower().replace(" ", "_")}_feature_importance.png')
             plt.close()
             
-            print(f"\n[v0] Top 5 Important Features for {model_name}:")
-            for i in range(min(5, len(importances))):
-                print(f"{i+1}. {feature_names[indices[i]]}: {importances[indices[i]]:.4f}")
+            top = [f"{i+1}. {feature_names[indices[i]]}: {importances[indices[i]]:.4f}"
+                   for i in range(min(5, len(importances)))]
+            logger.info(f"Top 5 important features for {model_name}:\n" + '\n'.join(top))
             
             # Store feature importance
             self.results[model_name]['feature_importance'] = {
@@ -204,31 +231,92 @@ class ModelTrainer:
         plt.savefig('models/roc_curves_comparison.png')
         plt.close()
         
-        print("\n[v0] ROC curves saved to models/roc_curves_comparison.png")
+        logger.info("ROC curves saved to models/roc_curves_comparison.png")
+    
+    def compress_best_model(self, X_train, y_train, X_test, y_test, full_version):
+        """Build compressed variants of the best model and publish the fastest one within tolerance
+        
+        The full model stays in the registry as the previous version, so a
+        rollback restores it.
+        """
+        if not compressible(self.best_model):
+            logger.info(f"{self.best_model_name} has no compressed form; skipping compression")
+            return None
+        
+        compressor = ModelCompressor(auc_tolerance=self.auc_tolerance,
+                                     max_probability_drift=self.max_probability_drift)
+        with metrics.timer('compress', model=self.best_model_name):
+            report, accepted = compressor.run(self.best_model_name, self.best_model,
+                                              X_train, y_train, X_test, y_test)
+        variant_path = compressor.save(accepted, report['selected'])
+        report['compressed_dir'] = compressor.output_dir
+        with open(DEFAULT_REPORT_PATH, 'w') as f:
+            json.dump(report, f, indent=2)
+        logger.info(f"{len(accepted)} of {len(report['variants']) - 1} compressed variants within "
+                    f"{self.auc_tolerance} AUC and {self.max_probability_drift} probability drift; "
+                    f"report saved to {DEFAULT_REPORT_PATH}")
+        
+        if variant_path is None:
+            logger.warning(f"No compressed variant of {self.best_model_name}; serving the full model")
+            return None
+        
+        selected = next(row for row in report['variants'] if row['variant'] == report['selected'])
+        joblib.dump(accepted[report['selected']], 'models/final_model_compact.pkl')
+        version = ModelRegistry().publish(
+            'models/final_model_compact.pkl', 'models/preprocessor.pkl',
+            metadata={'best_model': self.best_model_name, 'compressed_from': full_version,
+                      'variant': report['selected'], 'auc_roc': selected['auc_roc'],
+                      'max_probability_drift': selected['max_probability_drift']}
+        )
+        logger.info(f"Published compressed variant '{report['selected']}' as model version {version} "
+                    f"({selected['speedup_single']:.1f}x faster single-row, AUC {selected['auc_delta']:+.4f}, "
+                    f"max |dp| {selected['max_probability_drift']:.4f})")
+        return version
+    
+    def build_similarity_index(self, X_train, X_test, y_train, y_test):
+        """Index every labelled student for similar-student lookups, saved next to the model"""
+        X = pd.concat([X_train, X_test])
+        y = pd.concat([y_train, y_test])
+        student_ids = X.index if self.student_ids is None else self.student_ids.loc[X.index]
+        index = SimilarityIndex.build(X.to_numpy(), y.to_numpy(), student_ids=np.asarray(student_ids),
+                                      preprocessor_version=model_file_version('models/preprocessor.pkl'))
+        index.save(DEFAULT_SIMILARITY_INDEX_PATH)
+        logger.info(f"Similarity index of {len(index)} students saved to {DEFAULT_SIMILARITY_INDEX_PATH}")
+        return index
     
     def train_all_models(self):
         """Train and compare all models"""
+        self.concurrency.apply()
+        
         # Load data
-        X_train, X_test, y_train, y_test = self.load_data()
+        with metrics.timer('load_data'):
+            X_train, X_test, y_train, y_test = self.load_data()
+        self.cv = CVEngine(y_train, n_jobs=self.concurrency.n_jobs)
         
         # Load feature names
         preprocessor_state = joblib.load('models/preprocessor.pkl')
         feature_names = preprocessor_state['feature_names']
         
         # Train models
-        self.models['Logistic Regression'] = self.train_logistic_regression(X_train, y_train)
-        self.models['Random Forest'] = self.train_random_forest(X_train, y_train)
-        self.models['SVM'] = self.train_svm(X_train, y_train)
-        self.models['XGBoost'] = self.train_xgboost(X_train, y_train)
+        with metrics.timer('train', model='Logistic Regression'):
+            self.models['Logistic Regression'] = self.train_logistic_regression(X_train, y_train)
+        with metrics.timer('train', model='Random Forest'):
+            self.models['Random Forest'] = self.train_random_forest(X_train, y_train)
+        with metrics.timer('train', model='SVM'):
+            self.models['SVM'] = self.train_svm(X_train, y_train)
+        with metrics.timer('train', model='XGBoost'):
+            self.models['XGBoost'] = self.train_xgboost(X_train, y_train)
         
         # Evaluate all models
         best_auc = 0
         for model_name, model in self.models.items():
-            accuracy, auc_roc = self.evaluate_model(model, X_test, y_test, model_name)
+            with metrics.timer('evaluate', model=model_name):
+                accuracy, auc_roc = self.evaluate_model(model, X_test, y_test, model_name)
             
             # Plot feature importance for tree-based models
             if model_name in ['Random Forest', 'XGBoost']:
-                self.plot_feature_importance(model, feature_names, model_name)
+                with metrics.timer('plot', model=model_name):
+                    self.plot_feature_importance(model, feature_names, model_name)
             
             # Track best model
             if auc_roc > best_auc:
@@ -237,12 +325,31 @@ class ModelTrainer:
                 self.best_model_name = model_name
         
         # Plot ROC curves
-        self.plot_roc_curves()
+        with metrics.timer('plot', model='all'):
+            self.plot_roc_curves()
         
         # Save best model
-        print(f"\n[v0] Best Model: {self.best_model_name} (AUC-ROC: {best_auc:.4f})")
+        logger.info(f"Best Model: {self.best_model_name} (AUC-ROC: {best_auc:.4f})")
         joblib.dump(self.best_model, 'models/final_model.pkl')
-        print("[v0] Best model saved to models/final_model.pkl")
+        logger.info("Best model saved to models/final_model.pkl")
+        
+        # Keep every candidate so predictors can shadow-score them against live traffic
+        save_candidates(self.models, self.results, self.best_model_name,
+                        model_file_version('models/preprocessor.pkl'))
+        logger.info(f"All candidate models saved to {DEFAULT_CANDIDATES_DIR}")
+        
+        # Publish to the registry; running prediction servers hot-swap to it
+        version = ModelRegistry().publish(
+            'models/final_model.pkl', 'models/preprocessor.pkl',
+            metadata={'best_model': self.best_model_name, 'auc_roc': float(best_auc)}
+        )
+        logger.info(f"Published model version {version} to models/registry")
+        
+        if self.compress:
+            self.compress_best_model(X_train, y_train, X_test, y_test, version)
+        
+        with metrics.timer('similarity_index'):
+            self.build_similarity_index(X_train, X_test, y_train, y_test)
         
         # Save all results
         with open('models/model_comparison.json', 'w') as f:
@@ -257,17 +364,43 @@ class ModelTrainer:
                 }
                 if 'feature_importance' in results:
                     results_serializable[model_name]['feature_importance'] = results['feature_importance']
+                if 'cv' in results:
+                    results_serializable[model_name]['cv'] = results['cv']
             
             json.dump({
                 'best_model': self.best_model_name,
+                'cross_validation': self.cv.summary(),
                 'results': results_serializable
             }, f, indent=2)
         
-        print("[v0] Model comparison saved to models/model_comparison.json")
+        logger.info("Model comparison saved to models/model_comparison.json")
+        cv_summary = self.cv.summary()
+        # Final models are refit on the full split, so no fits are saved here; CV metrics reuse the search folds
+        logger.info(f"Cross-validation: {cv_summary['fits']} fits; out-of-fold metrics reuse the search's fold fits")
+        
+        if metrics.enabled:
+            logger.info("Stage timings:\n" + '\n'.join(f"  {line}" for line in metrics.summary_lines()))
         
         return self.best_model, self.best_model_name
 
 if __name__ == "__main__":
-    trainer = ModelTrainer()
+    parser = argparse.ArgumentParser(description="Train and compare the dropout models")
+    parser.add_argument('--feature-store', nargs='?', const=DEFAULT_FEATURE_STORE_DIR, default=None,
+                        help="Train from a feature store snapshot instead of data/processed_data.pkl")
+    parser.add_argument('--as-of', default=None, help="Feature store snapshot date (default: newest)")
+    parser.add_argument('--auc-tolerance', type=float, default=DEFAULT_AUC_TOLERANCE,
+                        help="Largest AUC drop allowed for a compressed variant")
+    parser.add_argument('--max-probability-drift', type=float, default=DEFAULT_MAX_PROBABILITY_DRIFT,
+                        help="Largest change in any test student's dropout probability for a compressed variant")
+    parser.add_argument('--no-compress', action='store_true',
+                        help="Publish only the full best model, without compressed variants")
+    args = parser.parse_args()
+    
+    # Metrics/profiling are opt-in via V0_METRICS_OUT / V0_PROFILE_OUT
+    setup_instrumentation()
+    feature_store = FeatureStore(args.feature_store) if args.feature_store else None
+    trainer = ModelTrainer(feature_store=feature_store, as_of=args.as_of,
+                           compress=not args.no_compress, auc_tolerance=args.auc_tolerance,
+                           max_probability_drift=args.max_probability_drift)
     best_model, best_model_name = trainer.train_all_models()
-    print(f"\n[v0] Training complete! Best model: {best_model_name}")
+    logger.info(f"Training complete! Best model: {best_model_name}")
@@ -0,0 +1,37 @@
+"""
+Shared test setup
+The scripts import each other as top-level modules, as when run from the repository root
+"""
+
+import os
+import sys
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'scripts'))
+from stubs import StubPredictor
+
+@pytest.fixture
+def predictor():
+    return StubPredictor()
+
+@pytest.fixture(scope='session')
+def trained_artifacts(tmp_path_factory):
+    """(raw students, model path, preprocessor path) for a small model trained as train_models.py trains"""
+    import joblib
+    from sklearn.linear_model import LogisticRegression
+    from data_preprocessing import DataPreprocessor
+    
+    directory = tmp_path_factory.mktemp('models')
+    preprocessor = DataPreprocessor()
+    students = preprocessor.generate_synthetic_data(400, filepath=None)
+    X, y = preprocessor.preprocess(students.copy())
+    model_path, preprocessor_path = str(directory / 'final_model.pkl'), str(directory / 'preprocessor.pkl')
+    joblib.dump(LogisticRegression(max_iter=1000).fit(X.to_numpy(), y), model_path)
+    preprocessor.save(preprocessor_path)
+    return students, model_path, preprocessor_path
+
+@pytest.fixture
+def dropout_predictor(trained_artifacts):
+    from predict import DropoutPredictor
+    _, model_path, preprocessor_path = trained_artifacts
+    return DropoutPredictor(model_path, preprocessor_path, similarity_index_path=None)
@@ -0,0 +1,59 @@
+"""
+Stand-ins for trained artifacts, so scoring paths can be tested without a trained model
+"""
+
+import numpy as np
+import pandas as pd
+
+FEATURES = ['attendance_rate', 'gpa_semester1', 'absences', 'behavioral_issues']
+
+class StubPredictor:
+    """Deterministic stand-in for DropoutPredictor: scores are a fixed function of the features"""
+    
+    feature_names = FEATURES
+    model_version = 'stub'
+    preprocessor_version = 'stub'
+    unseen_policy = 'most_frequent'
+    
+    def __init__(self):
+        self.rows_scored = 0
+    
+    def predict_frame(self, df):
+        self.rows_scored += len(df)
+        logits = 3 * (0.85 - df['attendance_rate']) + (2.5 - df['gpa_semester1']) + 0.05 * df['absences']
+        probabilities = 1 / (1 + np.exp(-logits.to_numpy(dtype=float)))
+        results = []
+        for probability, (_, row) in zip(probabilities, df.iterrows()):
+            recommendations = []
+            if row['attendance_rate'] < 0.85:
+                recommendations.append({'category': 'Attendance', 'priority': 'High', 'action': 'Attendance outreach'})
+            if row['gpa_semester1'] < 2.5:
+                recommendations.append({'category': 'Academic', 'priority': 'Medium', 'action': 'Tutoring'})
+            if row['behavioral_issues'] > 3:
+                recommendations.append({'category': 'Behavioral', 'priority': 'Low', 'action': 'Counseling'})
+            results.append({
+                'risk_level': 'High' if probability > 0.7 else 'Medium' if probability > 0.4 else 'Low',
+                'dropout_probability': float(probability),
+                'graduate_probability': float(1 - probability),
+                'recommendations': recommendations
+            })
+        return results
+
+def make_students(n=500, seed=0, schools=4):
+    rng = np.random.default_rng(seed)
+    return pd.DataFrame({
+        'student_id': np.arange(1000, 1000 + n),
+        'school': [f'School {i}' for i in rng.integers(schools, size=n)],
+        'attendance_rate': rng.uniform(0.6, 1.0, n).round(2),
+        'gpa_semester1': rng.uniform(1.0, 4.0, n).round(1),
+        'absences': rng.integers(0, 30, n),
+        'behavioral_issues': rng.integers(0, 8, n)
+    })
+
+def change_rows(students, n_changed=40, seed=1):
+    """Copy of ``students`` with ``n_changed`` random rows' absences changed"""
+    rng = np.random.default_rng(seed)
+    changed = students.copy()
+    rows = rng.choice(len(changed), n_changed, replace=False)
+    changed.loc[rows, 'absences'] += 5
+    return changed, rows
@@ -0,0 +1,34 @@
+"""
+Batch scoring keeps going when a sink fails
+"""
+
+from batch_predict import process_batch
+from prediction_store import PredictionStore
+from stubs import make_students
+
+def test_a_failing_sink_does_not_abort_scoring(predictor):
+    received = []
+    
+    def broken(student_ids, predictions, chunk):
+        raise KeyError('absences')
+    
+    def collect(student_ids, predictions, chunk):
+        received.extend(student_ids)
+    
+    students = make_students(100)
+    results = process_batch(predictor, students, chunk_size=30, sinks=[broken, collect])
+    assert len(results) == 100 and not any('error' in result for result in results)
+    assert received == students['student_id'].tolist()
+
+def test_store_records_chunks_missing_a_feature_column(predictor, tmp_path):
+    store = PredictionStore(str(tmp_path / 'predictions.db'))
+    students = make_students(20)
+    
+    def record_in_store(student_ids, predictions, chunk):
+        # As batch_predict.py records them: feature columns absent from the input hash as NaN
+        store.record_chunk(student_ids, predictions, chunk.reindex(columns=predictor.feature_names + ['age']),
+                           predictor.model_version)
+    
+    process_batch(predictor, students, sinks=[record_in_store])
+    assert store.count() == 20
+    store.close()
@@ -0,0 +1,82 @@
+"""
+Delta re-scoring produces the same output as scoring every row
+"""
+
+import numpy as np
+import pandas as pd
+from batch_predict import process_batch
+from stubs import FEATURES, StubPredictor, change_rows, make_students
+from delta_scoring import ScoringManifest, score_incrementally, scoring_version
+from prediction_store import feature_fingerprints
+
+def _score(predictor):
+    return lambda df: process_batch(predictor, df, chunk_size=64)
+
+def _manifest(predictor, students, results):
+    return ScoringManifest.from_results(
+        scoring_version(predictor), students['student_id'].tolist(),
+        feature_fingerprints(students[FEATURES]), results
+    )
+
+def test_fingerprints_ignore_numeric_dtype_and_track_changes():
+    students = make_students(50)
+    as_float = students.astype({'absences': float, 'behavioral_issues': float})
+    assert np.array_equal(feature_fingerprints(students[FEATURES]), feature_fingerprints(as_float[FEATURES]))
+    
+    changed, rows = change_rows(students, 5)
+    differs = feature_fingerprints(students[FEATURES]) != feature_fingerprints(changed[FEATURES])
+    assert sorted(np.flatnonzero(differs)) == sorted(rows)
+
+def test_incremental_output_matches_full_scoring(predictor):
+    students = make_students()
+    previous = _manifest(predictor, students, _score(predictor)(students))
+    
+    changed, rows = change_rows(students)
+    # New students and a reordered roster are handled too
+    changed = pd.concat([changed, make_students(20, seed=5).assign(student_id=lambda df: df['student_id'] + 10000)])
+    changed = changed.sample(frac=1, random_state=0).reset_index(drop=True)
+    
+    full = _score(StubPredictor())(changed)
+    predictor.rows_scored = 0
+    incremental, fingerprints = score_incrementally(predictor, changed, previous, _score(predictor))
+    
+    assert incremental == full
+    assert predictor.rows_scored == len(rows) + 20
+    assert np.array_equal(fingerprints, feature_fingerprints(changed[FEATURES]))
+
+def test_failed_rows_and_model_changes_are_rescored(predictor):
+    students = make_students(100)
+    results = _score(predictor)(students)
+    results[3] = {'student_id': results[3]['student_id'], 'error': 'boom'}
+    previous = _manifest(predictor, students, results)
+    
+    predictor.rows_scored = 0
+    score_incrementally(predictor, students, previous, _score(predictor))
+    assert predictor.rows_scored == 1
+    
+    retrained = StubPredictor()
+    retrained.model_version = 'retrained'
+    score_incrementally(retrained, students, previous, _score(retrained))
+    assert retrained.rows_scored == len(students)
+
+def test_manifest_round_trip(predictor, tmp_path):
+    students = make_students(30)
+    manifest = _manifest(predictor, students, _score(predictor)(students))
+    path = str(tmp_path / 'out.manifest.pkl')
+    manifest.save(path)
+    
+    loaded = ScoringManifest.load(path)
+    assert loaded.version == manifest.version
+    pd.testing.assert_frame_equal(loaded.table, manifest.table)
+    assert ScoringManifest.load(str(tmp_path / 'missing.pkl')) is None
+
+def test_missing_feature_columns_fail_rows_not_the_run(trained_artifacts, dropout_predictor):
+    students = trained_artifacts[0].drop(columns=['dropout', 'absences']).head(30)
+    score = _score(dropout_predictor)
+    results, fingerprints = score_incrementally(dropout_predictor, students, None, score)
+    assert all('absences missing' in result['error'] for result in results)
+    
+    previous = ScoringManifest.from_results(scoring_version(dropout_predictor), students['student_id'].tolist(),
+                                            fingerprints, results)
+    rescored, _ = score_incrementally(dropout_predictor, students, previous, score)
+    assert rescored == results
@@ -0,0 +1,38 @@
+"""
+Scoring from the feature store gives the same results as scoring the raw extract
+"""
+
+import numpy as np
+import pandas as pd
+from feature_store import FeatureStore, FeatureTransform
+
+def _rounded(results):
+    return [{key: round(value, 12) if isinstance(value, float) else value for key, value in result.items()}
+            for result in results]
+
+def test_predict_stored_matches_predict_frame(trained_artifacts, dropout_predictor, tmp_path):
+    students, _, preprocessor_path = trained_artifacts
+    extract = students.drop(columns=['dropout']).head(300).copy()
+    extract.loc[5, 'gpa_semester1'] = np.nan
+    extract.loc[9, 'gender'] = np.nan
+    extract.loc[12, 'attendance_rate'] = 7.0
+    
+    store = FeatureStore(str(tmp_path / 'feature_store'))
+    snapshot = store.update(extract, FeatureTransform.load(preprocessor_path), as_of='2026-10-01')
+    assert snapshot.meta['imputed'] == 2
+    
+    stored = dropout_predictor.predict_stored(extract, snapshot)
+    assert _rounded(stored) == _rounded(dropout_predictor.predict_frame(extract))
+    assert all('error' in stored[position] for position in (5, 9, 12))
+
+def test_imputed_rows_still_train(trained_artifacts, tmp_path):
+    students, _, preprocessor_path = trained_artifacts
+    extract = students.head(50).copy()
+    extract.loc[5, 'gpa_semester1'] = np.nan
+    snapshot = FeatureStore(str(tmp_path / 'feature_store')).update(
+        extract, FeatureTransform.load(preprocessor_path), as_of='2026-10-01'
+    )
+    X, y = snapshot.training_data()
+    assert len(X) == 50 and extract.loc[5, 'student_id'] in X.index
+    assert np.isfinite(X.to_numpy()).all()
+    pd.testing.assert_index_equal(X.index, y.index)
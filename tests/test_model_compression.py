@@ -0,0 +1,74 @@
+"""
+Compact model variants reproduce the original models' probabilities
+"""
+
+import warnings
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.datasets import make_classification
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.linear_model import LogisticRegression
+from model_compression import CompactTrees, ModelCompressor, compressible, rank_trees
+
+@pytest.fixture(scope='module')
+def data():
+    X, y = make_classification(n_samples=1200, n_features=8, n_informative=5, random_state=0)
+    X = pd.DataFrame(X, columns=[f'feature_{i}' for i in range(X.shape[1])])
+    return X[:800], y[:800], X[800:], y[800:]
+
+@pytest.fixture(scope='module')
+def forest(data):
+    X_train, y_train, _, _ = data
+    return RandomForestClassifier(n_estimators=30, random_state=0).fit(X_train, y_train)
+
+def test_compact_forest_matches_predict_proba(data, forest):
+    _, _, X_test, _ = data
+    compact = CompactTrees.from_forest(forest)
+    # Leaf values are 16-bit codes, so probabilities agree to the quantization step
+    np.testing.assert_allclose(compact.predict_proba(X_test.to_numpy()), forest.predict_proba(X_test), atol=1e-4)
+    assert np.array_equal(compact.predict(X_test.to_numpy()), forest.predict(X_test))
+
+def test_compact_forest_subsets_match_the_same_trees(data, forest):
+    X_train, _, X_test, _ = data
+    order = rank_trees(forest, X_train)
+    assert sorted(order) == list(range(len(forest.estimators_)))
+    
+    kept = order[:10]
+    compact = CompactTrees.from_forest(forest, kept)
+    expected = np.mean([forest.estimators_[i].predict_proba(X_test.to_numpy())[:, 1] for i in kept], axis=0)
+    np.testing.assert_allclose(compact.predict_proba(X_test.to_numpy())[:, 1], expected, atol=1e-4)
+
+def test_compact_booster_matches_predict_proba(data):
+    xgboost = pytest.importorskip('xgboost')
+    X_train, y_train, X_test, _ = data
+    model = xgboost.XGBClassifier(n_estimators=40, max_depth=4, random_state=0).fit(X_train, y_train)
+    compact = CompactTrees.from_booster(model, X_train)
+    np.testing.assert_allclose(compact.predict_proba(X_test.to_numpy()), model.predict_proba(X_test), atol=1e-4)
+
+def test_compressor_passes_training_columns_to_the_original(data, forest):
+    X_train, y_train, X_test, y_test = data
+    with warnings.catch_warnings():
+        # sklearn warns when a model fitted on a DataFrame is given bare arrays
+        warnings.simplefilter('error')
+        report, accepted = ModelCompressor().run('Random Forest', forest, X_train, y_train, X_test, y_test)
+    assert report['variants'][0]['variant'] == 'original'
+    assert len(report['variants']) > 1
+    assert report['selected'] in accepted
+
+def test_models_without_a_compressed_form(data):
+    X_train, y_train, _, _ = data
+    assert not compressible(LogisticRegression().fit(X_train, y_train))
+
+def test_variants_that_move_probabilities_are_rejected(data, forest):
+    X_train, y_train, X_test, y_test = data
+    # AUC alone would accept every variant here
+    report, accepted = ModelCompressor(auc_tolerance=1.0, max_probability_drift=0.05).run(
+        'Random Forest', forest, X_train, y_train, X_test, y_test
+    )
+    variants = report['variants'][1:]
+    for row in variants:
+        within = row['max_probability_drift'] <= 0.05 and row['risk_level_agreement'] >= 0.99
+        assert row['accepted'] == within == (row['variant'] in accepted)
+    assert any(not row['accepted'] for row in variants)
+    assert f"{len(forest.estimators_)} trees, full depth" in accepted
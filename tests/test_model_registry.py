@@ -0,0 +1,51 @@
+"""
+Registry pointer swaps: publishing, activation and rollback
+"""
+
+import pytest
+from model_registry import ModelRegistry
+
+def _artifacts(tmp_path, name):
+    model_path, preprocessor_path = tmp_path / f'{name}.pkl', tmp_path / f'{name}_preprocessor.pkl'
+    model_path.write_bytes(f'model {name}'.encode())
+    preprocessor_path.write_bytes(b'preprocessor')
+    return str(model_path), str(preprocessor_path)
+
+@pytest.fixture
+def registry(tmp_path):
+    return ModelRegistry(str(tmp_path / 'registry'))
+
+def test_publish_activates_and_remembers_the_previous_version(registry, tmp_path):
+    first = registry.publish(*_artifacts(tmp_path, 'a'), metadata={'best_model': 'A'})
+    assert (registry.active_version(), registry.previous_version()) == (first, None)
+    
+    second = registry.publish(*_artifacts(tmp_path, 'b'))
+    assert second != first
+    assert (registry.active_version(), registry.previous_version()) == (second, first)
+    assert sorted(registry.versions()) == sorted([first, second])
+    assert registry.metadata(first)['best_model'] == 'A'
+
+def test_rollback_swaps_active_and_previous(registry, tmp_path):
+    first = registry.publish(*_artifacts(tmp_path, 'a'))
+    second = registry.publish(*_artifacts(tmp_path, 'b'))
+    
+    assert registry.rollback() == first
+    assert (registry.active_version(), registry.previous_version()) == (first, second)
+    assert registry.rollback() == second
+    assert (registry.active_version(), registry.previous_version()) == (second, first)
+
+def test_republishing_the_active_model_changes_nothing(registry, tmp_path):
+    first = registry.publish(*_artifacts(tmp_path, 'a'))
+    second = registry.publish(*_artifacts(tmp_path, 'b'))
+    assert registry.publish(*_artifacts(tmp_path, 'b')) == second
+    assert (registry.active_version(), registry.previous_version()) == (second, first)
+    assert len(registry.versions()) == 2
+
+def test_invalid_swaps_are_rejected(registry, tmp_path):
+    with pytest.raises(ValueError):
+        registry.rollback()
+    registry.publish(*_artifacts(tmp_path, 'a'))
+    with pytest.raises(ValueError):
+        registry.activate('missing')
+    with pytest.raises(ValueError):
+        registry.rollback()
@@ -0,0 +1,50 @@
+"""
+Vectorized scoring isolates invalid rows
+"""
+
+import pandas as pd
+from batch_predict import process_batch
+from instrumentation import metrics
+
+def _rounded(results):
+    """Results with probabilities rounded off, since BLAS results vary slightly with batch composition"""
+    return [{key: round(value, 12) if key.endswith('probability') else value for key, value in result.items()}
+            for result in results]
+
+def _counter(name):
+    return sum(value for (counter, _), value in metrics.counters.items() if counter == name)
+
+def test_one_bad_cell_only_fails_its_own_row(trained_artifacts, dropout_predictor, tmp_path):
+    students = trained_artifacts[0].drop(columns=['dropout']).head(50)
+    bad = students.astype({'gpa_semester2': object})
+    bad.loc[7, 'gpa_semester2'] = 'abc'
+    # Read back from CSV, as batch_predict.py does, so the whole column arrives as text
+    path = tmp_path / 'students.csv'
+    bad.to_csv(path, index=False)
+    bad = pd.read_csv(path)
+    assert not pd.api.types.is_numeric_dtype(bad['gpa_semester2'])
+    
+    results = process_batch(dropout_predictor, bad, chunk_size=50)
+    failed = [position for position, result in enumerate(results) if 'error' in result]
+    assert failed == [7]
+    assert 'gpa_semester2 not numeric' in results[7]['error']
+    
+    expected = process_batch(dropout_predictor, students.drop(index=7), chunk_size=50)
+    assert _rounded(result for position, result in enumerate(results) if position != 7) == _rounded(expected)
+
+def test_single_rows_read_coerced_values(trained_artifacts, dropout_predictor):
+    student = trained_artifacts[0].drop(columns=['dropout']).iloc[0].to_dict()
+    as_text = {**student, 'gpa_semester1': str(student['gpa_semester1']), 'gpa_semester2': str(student['gpa_semester2'])}
+    assert dropout_predictor.predict(as_text) == dropout_predictor.predict(student)
+
+def test_invalid_rows_are_not_counted_as_rejected(trained_artifacts, dropout_predictor):
+    students = trained_artifacts[0].drop(columns=['dropout']).head(20).copy()
+    students.loc[3, 'attendance_rate'] = 5.0
+    metrics.reset()
+    metrics.enable()
+    try:
+        dropout_predictor.predict_frame(students)
+        assert (_counter('rows_invalid'), _counter('rows_rejected')) == (1, 0)
+    finally:
+        metrics.disable()
+        metrics.reset()
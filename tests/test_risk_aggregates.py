@@ -0,0 +1,77 @@
+"""
+Rolling risk aggregates stay equal to a recomputation from each student's latest result
+"""
+
+import numpy as np
+import pytest
+from risk_aggregates import RiskAggregator
+
+CATEGORIES = ('Attendance', 'Academic', 'Behavioral', 'Engagement')
+
+def _prediction(rng):
+    probability = float(rng.random())
+    level = 'High' if probability > 0.7 else 'Medium' if probability > 0.4 else 'Low'
+    picked = rng.choice(len(CATEGORIES), size=rng.integers(0, 3), replace=False)
+    return {
+        'risk_level': level,
+        'dropout_probability': probability,
+        'recommendations': [
+            {'category': CATEGORIES[i], 'priority': rng.choice(['High', 'Medium', 'Low']), 'action': 'a'}
+            for i in picked
+        ]
+    }
+
+def _views(aggregator):
+    """Snapshot without its timestamp, with mean probabilities split out for approximate comparison"""
+    snapshot = aggregator.snapshot()
+    buckets = [('overall', snapshot['overall'])] + [
+        ((col, value), bucket) for col, values in snapshot['groups'].items() for value, bucket in values.items()
+    ]
+    means = {key: bucket.pop('mean_dropout_probability') for key, bucket in buckets}
+    return dict(buckets), means
+
+def test_rescoring_retracts_the_previous_contribution(tmp_path):
+    aggregator = RiskAggregator(str(tmp_path / 'aggregates.json'))
+    high = {'risk_level': 'High', 'dropout_probability': 0.9,
+            'recommendations': [{'category': 'Attendance', 'priority': 'High', 'action': 'a'}]}
+    low = {'risk_level': 'Low', 'dropout_probability': 0.1, 'recommendations': []}
+    aggregator.record(1, high, {'school': 'A', 'cohort': '2024'})
+    aggregator.record(1, low, {'school': 'B', 'cohort': '2024'})
+    
+    overall = aggregator.snapshot()['overall']
+    assert (overall['students'], overall['high_risk'], overall['low_risk']) == (1, 0, 1)
+    assert overall['interventions'] == {}
+    assert overall['mean_dropout_probability'] == pytest.approx(0.1)
+    assert list(aggregator.snapshot()['groups']['school']) == ['B']
+
+def test_incremental_totals_match_recomputation(tmp_path):
+    rng = np.random.default_rng(0)
+    incremental = RiskAggregator(str(tmp_path / 'incremental.json'))
+    latest = {}
+    for _ in range(20):
+        student_ids = rng.choice(100, size=30, replace=False).tolist()
+        predictions = [_prediction(rng) for _ in student_ids]
+        groups = [{'school': f'S{rng.integers(4)}', 'cohort': str(2020 + rng.integers(3))} for _ in student_ids]
+        for student_id, prediction, group_values in zip(student_ids, predictions, groups):
+            incremental.record(student_id, prediction, group_values)
+            latest[student_id] = (prediction, group_values)
+    
+    recomputed = RiskAggregator(str(tmp_path / 'recomputed.json'))
+    for student_id, (prediction, group_values) in latest.items():
+        recomputed.record(student_id, prediction, group_values)
+    
+    incremental_buckets, incremental_means = _views(incremental)
+    recomputed_buckets, recomputed_means = _views(recomputed)
+    assert incremental_buckets == recomputed_buckets
+    assert incremental_means == pytest.approx(recomputed_means)
+
+def test_state_survives_a_reload(tmp_path):
+    path = str(tmp_path / 'aggregates.json')
+    aggregator = RiskAggregator(path)
+    aggregator.record(1, {'risk_level': 'High', 'dropout_probability': 0.8, 'recommendations': []}, {'school': 'A'})
+    aggregator.save()
+    
+    resumed = RiskAggregator.load(path)
+    resumed.record(1, {'risk_level': 'Low', 'dropout_probability': 0.2, 'recommendations': []}, {'school': 'A'})
+    overall = resumed.snapshot()['overall']
+    assert (overall['students'], overall['high_risk'], overall['low_risk']) == (1, 0, 1)
@@ -0,0 +1,76 @@
+"""
+Streaming top-k rankings match a full sort, including when delta scoring carries students forward
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+from batch_predict import process_batch
+from delta_scoring import ScoringManifest, score_incrementally, scoring_version
+from risk_ranking import TopKRanker, risk_factors
+from stubs import FEATURES, StubPredictor, change_rows, make_students
+
+def _ranked_ids(ranker):
+    return {group: [entry['student_id'] for entry in entries] for group, entries in ranker.rankings().items()}
+
+@pytest.mark.parametrize('chunk_size', [1, 7, 100, 1000])
+def test_heaps_match_a_full_sort(chunk_size):
+    rng = np.random.default_rng(0)
+    n = 1000
+    # Coarse probabilities force many ties, which go to the student earlier in the input
+    chunk = pd.DataFrame({'school': rng.choice(['A', 'B', 'C'], n)})
+    probabilities = rng.integers(0, 20, n) / 20
+    predictions = [{'dropout_probability': p, 'risk_level': 'Low', 'recommendations': []} for p in probabilities]
+    predictions[5] = {'error': 'boom'}
+    student_ids = list(range(n))
+    
+    ranker = TopKRanker(k=25, output_path=None)
+    for start in range(0, n, chunk_size):
+        ranker.update(student_ids[start:start + chunk_size], predictions[start:start + chunk_size],
+                      chunk.iloc[start:start + chunk_size])
+    
+    expected = pd.DataFrame({'school': chunk['school'], 'p': probabilities, 'row': np.arange(n)}).drop(index=5)
+    expected = expected.sort_values(['p', 'row'], ascending=[False, True]).groupby('school').head(25)
+    assert _ranked_ids(ranker) == {
+        school: group['row'].tolist() for school, group in expected.groupby('school', sort=True)
+    }
+    assert ranker.rows_seen == n
+
+def _run(predictor, students, previous=None, k=15):
+    """batch_predict's manifest-tracking flow: (rankings, manifest written for the next run)"""
+    ranker = TopKRanker(k=k, output_path=None, feature_columns=FEATURES)
+    factors_by_student = {}
+    
+    def collect_risk_factors(student_ids, predictions, chunk):
+        for student_id, prediction in zip(student_ids, predictions):
+            factors_by_student[student_id] = None if 'error' in prediction else risk_factors(prediction)
+    
+    def score(df):
+        return process_batch(predictor, df, chunk_size=64, sinks=[collect_risk_factors, ranker.update])
+    
+    results, fingerprints = score_incrementally(predictor, students, previous, score,
+                                                [collect_risk_factors, ranker.update])
+    student_ids = students['student_id'].tolist()
+    manifest = ScoringManifest.from_results(scoring_version(predictor), student_ids, fingerprints, results,
+                                            [factors_by_student.get(student_id) for student_id in student_ids])
+    return ranker.rankings(), manifest
+
+def test_incremental_rankings_match_a_full_run():
+    students = make_students(800)
+    _, manifest = _run(StubPredictor(), students)
+    changed, _ = change_rows(students, 60)
+    
+    incremental, _ = _run(StubPredictor(), changed, manifest)
+    full, _ = _run(StubPredictor(), changed)
+    assert incremental == full
+    assert all(entry['explanation']['risk_factors'] for entries in full.values() for entry in entries[:3])
+
+def test_manifest_without_risk_factors_rescores_everything():
+    students = make_students(100)
+    predictor = StubPredictor()
+    _, manifest = _run(predictor, students)
+    manifest.table = manifest.table.drop(columns=['risk_factors'])
+    
+    predictor.rows_scored = 0
+    _run(predictor, students, manifest)
+    assert predictor.rows_scored == len(students)
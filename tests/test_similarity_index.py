@@ -0,0 +1,70 @@
+"""
+IVF similar-student index against exact brute-force search
+"""
+
+import numpy as np
+import pytest
+from similarity_index import SimilarityIndex
+
+@pytest.fixture(scope='module')
+def students():
+    rng = np.random.default_rng(0)
+    # Clustered rows, like scaled student features
+    centers = rng.normal(scale=4, size=(12, 6))
+    X = (centers[rng.integers(len(centers), size=3000)] + rng.normal(size=(3000, 6))).astype(np.float32)
+    y = (rng.random(len(X)) < 0.3).astype(int)
+    return X, y
+
+@pytest.fixture(scope='module')
+def index(students):
+    X, y = students
+    return SimilarityIndex.build(X, y, student_ids=np.arange(len(X)) + 5000, n_lists=40)
+
+def _brute_force(X, queries, k):
+    distances = ((queries[:, None, :].astype(np.float64) - X[None, :, :]) ** 2).sum(axis=2)
+    return np.argsort(distances, axis=1, kind='stable')[:, :k], np.sqrt(np.sort(distances, axis=1)[:, :k])
+
+def test_probing_every_list_is_exact(students, index):
+    X, _ = students
+    queries = np.random.default_rng(1).normal(scale=4, size=(200, X.shape[1])).astype(np.float32)
+    k = 10
+    distances, rows = index.query(queries, k, n_probe=index.n_lists)
+    expected_rows, expected_distances = _brute_force(X, queries, k)
+    
+    found = index.student_id[rows] - 5000
+    assert np.mean([len(np.intersect1d(a, b)) == k for a, b in zip(found, expected_rows)]) == 1.0
+    np.testing.assert_allclose(distances, expected_distances, rtol=1e-4, atol=1e-3)
+    assert index.recall(queries, k, n_probe=index.n_lists) == 1.0
+
+def test_recall_grows_with_probes(students, index):
+    X, _ = students
+    queries = X[:300]
+    recalls = [index.recall(queries, 10, n_probe) for n_probe in (1, 4, index.n_lists)]
+    assert recalls == sorted(recalls)
+    assert recalls[-1] == 1.0
+
+def test_neighbors_report_outcomes(students, index):
+    X, y = students
+    result = index.neighbors(X[:3], k=5, n_probe=index.n_lists)
+    for position, entry in enumerate(result):
+        # An indexed student is its own nearest neighbour
+        assert entry['neighbors'][0]['student_id'] == 5000 + position
+        assert entry['neighbors'][0]['dropout'] == y[position]
+        rate = np.mean([neighbor['dropout'] for neighbor in entry['neighbors']])
+        assert entry['neighbor_dropout_rate'] == pytest.approx(rate)
+
+def test_short_probes_pad_missing_neighbours():
+    X = np.arange(12, dtype=np.float32).reshape(6, 2)
+    index = SimilarityIndex.build(X, np.zeros(6, dtype=int), n_lists=6)
+    distances, rows = index.query(X[:1], k=3, n_probe=1)
+    assert rows[0, 0] >= 0 and list(rows[0, 1:]) == [-1, -1]
+    assert np.isinf(distances[0, 1:]).all()
+
+def test_round_trip(index, students, tmp_path):
+    X, _ = students
+    path = str(tmp_path / 'similarity_index.pkl')
+    index.save(path)
+    loaded = SimilarityIndex.load(path)
+    assert loaded.meta == index.meta
+    for a, b in zip(loaded.query(X[:20], 5), index.query(X[:20], 5)):
+        np.testing.assert_array_equal(a, b)